@@ -0,0 +1,35 @@
+"""
+Adler-32 checksum as used in the zlib format (RFC 1950).
+"""
+
+from six.moves import xrange
+
+ADLER_BASE = 65521
+
+# Largest n such that 255n(n+1)/2 + (n+1)(BASE-1) fits in 32 bits.
+# The modulo reductions can be deferred for this many bytes.
+ADLER_NMAX = 5552
+
+def adler32(data, value=1):
+    """
+    Calculate Adler-32 of data.
+
+    Pass the previous result as value to checksum data incrementally.
+
+    >>> '%08x' % adler32(b'Wikipedia')
+    '11e60398'
+    >>> '%08x' % adler32(b'pedia', adler32(b'Wiki'))
+    '11e60398'
+    >>> adler32(b'')
+    1
+    """
+    a = value & 0xffff
+    b = (value >> 16) & 0xffff
+    data = bytearray(data)
+    for start in xrange(0, len(data), ADLER_NMAX):
+        for x in data[start:start + ADLER_NMAX]:
+            a += x
+            b += a
+        a %= ADLER_BASE
+        b %= ADLER_BASE
+    return (b << 16) | a
@@ -39,5 +39,67 @@ class BitString(object):
             bits = to_bin_inverted(byte2int(b))
             self.window.append_bytes(bits.encode('ascii'))
             self.readbits += len(bits)
-        if n >= self.readbits - self.offset:
+        if n > self.readbits - self.offset:
             raise EndOfStreamError('Unexpected end of stream')
+
+class BitWriter(object):
+    """
+    Bit writer packing bits in deflate bit order.
+
+    Values are packed starting from the least significant bit of each
+    byte, as specified in RFC 1951.
+
+    >>> w = BitWriter()
+    >>> w.write(0b1, 1)
+    >>> w.write(0b10, 2)
+    >>> w.write_code(0b110, 3)
+    >>> w.tell()
+    6
+    >>> '{:08b}'.format(bytearray(w.getvalue())[0])
+    '00011101'
+    >>> w.align()
+    >>> w.tell()
+    8
+    """
+    def __init__(self):
+        self.data = bytearray()
+        self.bitbuf = 0
+        self.bitcount = 0
+    def write(self, value, nbits):
+        """Write nbits lowest bits of value, least significant first."""
+        self.bitbuf |= value << self.bitcount
+        self.bitcount += nbits
+        while self.bitcount >= 8:
+            self.data.append(self.bitbuf & 0xff)
+            self.bitbuf >>= 8
+            self.bitcount -= 8
+    def write_code(self, code, length):
+        """Write Huffman code, most significant bit first."""
+        self.write(reverse_bits(code, length), length)
+    def write_bytes(self, data):
+        assert self.bitcount == 0
+        self.data += data
+    def align(self):
+        if self.bitcount:
+            self.write(0, 8 - self.bitcount)
+    def tell(self):
+        return 8 * len(self.data) + self.bitcount
+    def getvalue(self):
+        if self.bitcount:
+            return bytes(self.data + bytearray([self.bitbuf]))
+        return bytes(self.data)
+
+def reverse_bits(x, n):
+    """
+    Reverse the n lowest bits of x.
+
+    >>> '{:05b}'.format(reverse_bits(0b00111, 5))
+    '11100'
+    >>> reverse_bits(0b10, 3)
+    2
+    """
+    result = 0
+    for dummy in range(n):
+        result = (result << 1) | (x & 1)
+        x >>= 1
+    return result
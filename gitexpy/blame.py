@@ -0,0 +1,295 @@
+"""
+Blame lines of a file to the commits that added them.
+
+The history is walked from newest to oldest commit.  Each pending
+commit has ranges of its version of the file whose lines are not yet
+attributed.  The ranges are mapped to a parent through the matching
+blocks of a line diff, and the lines without a match in any parent
+are attributed to the commit.  Parents with the same blob id are
+given all the ranges without diffing, and the walk stops as soon as
+no ranges are left.
+
+The ranges are (start, length, final start) triples, where start is
+the index of the first line in the version of the commit and final
+start its index in the blamed version.
+"""
+
+import bisect
+import heapq
+from .diff import EditScript
+from .errors import *
+from .git_object_model import ObjectId, find_blob, get_git_object_by_id
+from .linediff import LineInterner, line_blocks, split_lines
+
+class PathNotFound(Error):
+    pass
+
+class BlameEntry(object):
+    """
+    Range of lines attributed to a commit.
+
+    Start is the index of the first line in the blamed version and
+    orig_start in the version of the commit.
+    """
+    def __init__(self, commit, start, length, orig_start):
+        self.commit = commit
+        self.start = start
+        self.length = length
+        self.orig_start = orig_start
+    def __repr__(self):
+        return '<%s %s start=%d length=%d orig_start=%d>' % (
+            self.__class__.__name__, str(self.commit)[:12], self.start,
+            self.length, self.orig_start)
+
+class BlameStats(object):
+    """
+    Number of visited commits, diffs, diffs found in the cache and
+    parents skipped as unchanged.
+    """
+    def __init__(self):
+        self.commits = 0
+        self.diffs = 0
+        self.cached = 0
+        self.unchanged = 0
+    def __repr__(self):
+        return '<%s commits=%d diffs=%d cached=%d unchanged=%d>' % (
+            self.__class__.__name__, self.commits, self.diffs, self.cached,
+            self.unchanged)
+
+class PendingCommit(object):
+    """
+    Commit with lines to blame.
+
+    The ranges passed from each child are kept in range_lists, joined
+    to one list unless they overlap (which happens only if some merge
+    brings two copies of a line).
+    """
+    def __init__(self, commit, blob, lines):
+        self.commit = commit
+        self.blob = blob
+        self.lines = lines
+        self.range_lists = []
+    def add_ranges(self, ranges):
+        for (k, old_ranges) in enumerate(self.range_lists):
+            merged = merge_ranges(old_ranges, ranges)
+            if merged is not None:
+                self.range_lists[k] = merged
+                return
+        self.range_lists.append(ranges)
+
+def blame(commit, path, get_object=get_git_object_by_id, stats=None,
+          cache=None):
+    """
+    Blame lines of path in commit.
+
+    Returns list of BlameEntries sorted by start.  Get_object is
+    called with a hexadecimal object id to get a Git object.  The line
+    diffs of blob pairs are kept in cache (a DiffCache), if given, so
+    that repeated blames reuse them.
+    """
+    path = split_path(path)
+    trees = {}
+    def get(oid):
+        return get_object(str(oid))
+    def find(commit_obj):
+        return find_blob(get, commit_obj.tree, path, trees)
+    def read_lines(blob):
+        return split_lines(get(blob).contents)
+    oid = ObjectId(commit)
+    commit_obj = get(oid)
+    blob = find(commit_obj)
+    if blob is None:
+        raise PathNotFound(b'/'.join(path))
+    head = PendingCommit(commit_obj, blob, read_lines(blob))
+    if head.lines:
+        head.add_ranges([(0, len(head.lines), 0)])
+    pending = {oid.bytes: head}
+    queue = [(-commit_obj.commit_time, 0, oid)]
+    counter = 1
+    interner = LineInterner()
+    entries = []
+    while queue:
+        (dummy, dummy, oid) = heapq.heappop(queue)
+        item = pending.pop(oid.bytes)
+        range_lists = item.range_lists
+        if stats is not None:
+            stats.commits += 1
+        for parent_oid in item.commit.parents:
+            if not range_lists:
+                break
+            parent = pending.get(parent_oid.bytes)
+            if parent is None:
+                parent_obj = get(parent_oid)
+                parent_blob = find(parent_obj)
+                if parent_blob is None:
+                    continue
+                parent = PendingCommit(parent_obj, parent_blob, None)
+            if parent.blob.bytes == item.blob.bytes:
+                (passed_lists, range_lists) = (range_lists, [])
+                parent.lines = parent.lines or item.lines
+                if stats is not None:
+                    stats.unchanged += 1
+            else:
+                parent.lines = parent.lines or read_lines(parent.blob)
+                blocks = diff_blocks(parent, item, interner, cache, stats)
+                mapped = [map_ranges(ranges, blocks) for ranges in range_lists]
+                passed_lists = [passed for (passed, rest) in mapped if passed]
+                range_lists = [rest for (passed, rest) in mapped if rest]
+            if not passed_lists:
+                continue
+            if parent_oid.bytes not in pending:
+                pending[parent_oid.bytes] = parent
+                heapq.heappush(
+                    queue, (-parent.commit.commit_time, counter, parent_oid))
+                counter += 1
+            for passed in passed_lists:
+                parent.add_ranges(passed)
+        entries.extend(BlameEntry(oid, final, length, start)
+                       for ranges in range_lists
+                       for (start, length, final) in ranges)
+    entries.sort(key=lambda entry: entry.start)
+    return entries
+
+def diff_blocks(parent, item, interner, cache=None, stats=None):
+    """
+    Get matching blocks of the lines of parent and item.
+    """
+    if cache is not None:
+        script = cache.get(parent.blob, item.blob, line_blocks)
+        if script is not None:
+            if stats is not None:
+                stats.cached += 1
+            return script.matching_blocks(len(parent.lines))
+    blocks = line_blocks(parent.lines, item.lines, interner)
+    if stats is not None:
+        stats.diffs += 1
+    if cache is not None:
+        cache.put(parent.blob, item.blob, EditScript.from_blocks(
+            parent.lines, item.lines, blocks), line_blocks)
+    return blocks
+
+def split_path(path):
+    """
+    Split path to list of bytes components.
+
+    >>> split_path('foo/bar.py')
+    [b'foo', b'bar.py']
+    """
+    if not isinstance(path, bytes):
+        path = path.encode('utf-8')
+    return [part for part in path.split(b'/') if part]
+
+def add_range(ranges, start, length, final):
+    """
+    Append range, joining it to the last range if they are contiguous.
+
+    >>> ranges = [(0, 2, 10)]
+    >>> add_range(ranges, 2, 3, 12)
+    >>> add_range(ranges, 6, 1, 15)
+    >>> ranges
+    [(0, 5, 10), (6, 1, 15)]
+    """
+    if not length:
+        return
+    if ranges:
+        (last_start, last_length, last_final) = ranges[-1]
+        if (last_start + last_length == start and
+                last_final + last_length == final):
+            ranges[-1] = (last_start, last_length + length, last_final)
+            return
+    ranges.append((start, length, final))
+
+def merge_ranges(ranges1, ranges2):
+    """
+    Merge two range lists to one sorted by start, or None if they overlap.
+
+    >>> merge_ranges([(0, 2, 0), (5, 1, 9)], [(2, 3, 2)])
+    [(0, 5, 0), (5, 1, 9)]
+    >>> merge_ranges([(0, 2, 0)], [(1, 1, 7)]) is None
+    True
+    """
+    result = []
+    for (start, length, final) in sorted(ranges1 + ranges2):
+        if result and start < result[-1][0] + result[-1][1]:
+            return None
+        add_range(result, start, length, final)
+    return result
+
+def map_ranges(ranges, blocks):
+    """
+    Map ranges of child lines to the parent through matching blocks.
+
+    Blocks are (i, j, n) triples telling that lines i..i+n of the
+    parent are lines j..j+n of the child, see linediff.matching_blocks.
+    Returns (ranges mapped to the parent, ranges without a match).
+
+    >>> map_ranges([(0, 10, 100)], [(0, 2, 3), (5, 6, 2), (10, 10, 0)])
+    ([(0, 3, 102), (5, 2, 106)], [(0, 2, 100), (5, 1, 105), (8, 2, 108)])
+    """
+    passed = []
+    remaining = []
+    block_ends = [j + n for (i, j, n) in blocks]
+    r = 0
+    while r < len(ranges):
+        (start, length, final) = ranges[r]
+        end = start + length
+        k = bisect.bisect_right(block_ends, start)
+        if k < len(blocks) and blocks[k][1] <= start and end <= block_ends[k]:
+            # Usually most of the ranges are inside unchanged blocks,
+            # so all ranges inside this block are moved at once
+            (i, j, n) = blocks[k]
+            stop = bisect.bisect_left(ranges, (j + n,), r)
+            if sum(ranges[stop - 1][:2]) > j + n:
+                stop -= 1
+            if i == j:
+                passed.extend(ranges[r:stop])
+            else:
+                passed.extend([(i - j + start, length, final)
+                               for (start, length, final) in ranges[r:stop]])
+            r = stop
+            continue
+        r += 1
+        pos = start
+        while pos < end:
+            if k == len(blocks) or blocks[k][1] >= end:
+                add_range(remaining, pos, end - pos, final + pos - start)
+                break
+            (i, j, n) = blocks[k]
+            if j > pos:
+                add_range(remaining, pos, j - pos, final + pos - start)
+                pos = j
+            stop = min(end, j + n)
+            add_range(passed, i + pos - j, stop - pos, final + pos - start)
+            pos = stop
+            if j + n <= end:
+                k += 1
+    return (passed, remaining)
+
+def main(sys):
+    """
+    Show the commit that added each line of a file.
+
+    Usage: blame COMMIT PATH
+    """
+    try:
+        (commit, path) = sys.argv[1:3]
+    except Exception:
+        print(main.__doc__.split('\n\n', 1)[1].rstrip())
+        sys.exit(1)
+    try:
+        entries = blame(commit, path)
+    except PathNotFound:
+        print('Path not found: %s' % path)
+        sys.exit(1)
+    commit_obj = get_git_object_by_id(commit)
+    blob = find_blob(get_git_object_by_id, commit_obj.tree, split_path(path))
+    lines = split_lines(get_git_object_by_id(blob).contents)
+    for entry in entries:
+        for k in range(entry.length):
+            line = lines[entry.start + k].decode('utf-8', 'replace')
+            sys.stdout.write('%s %5d) %s' % (
+                str(entry.commit)[:8], entry.start + k + 1, line))
+
+if __name__ == '__main__':
+    import sys
+    main(sys)
@@ -23,18 +23,25 @@ def blockify(data, avgsize=1024, minsize=256, maxsize=8192):
             continue
         yield data[lastsplit:stop]
         lastsplit = stop
-    if lastsplit < stop:
-        yield data[lastsplit:stop]
+    if lastsplit < len(data):
+        yield data[lastsplit:]
 
 def rabin_split(data, mask, splitval, maxsize):
-    last_pos = -1
+    """
+    Yield the end positions of the blocks of data.
+
+    A block ends after a byte whose fingerprint matches the split
+    value, or after maxsize bytes.  The last position is len(data).
+    """
+    last_end = 0
+    end = 0
     for (pos, fp) in enumerate(rabin.iterate_fingerprints(data)):
-        if fp & mask == splitval or pos - last_pos >= maxsize:
-            if pos > last_pos:
-                yield pos
-                last_pos = pos
-    if pos > last_pos:
-        yield pos
+        end = pos + 1
+        if fp & mask == splitval or end - last_end >= maxsize:
+            yield end
+            last_end = end
+    if end > last_end:
+        yield end
 
 def pretty_print_blocks(data, mask=7, splitval=0):
     assert len(data) < 10000
@@ -1,15 +1,51 @@
+import struct
+from six.moves import xrange
 from . import rabin
 from .memoize import memoized
 from .sixx import byte2int, int2byte
 
 crc32poly_mirrored = 0xedb88320
 
-def crc32(x):
+def crc32(x, value=0):
     """
     Calculate CRC32 of x.
 
+    Pass the previous result as value to checksum data incrementally.
+    Eight bytes are processed at a time with the slicing-by-8 tables.
+
     >>> '%x' % crc32(b'123456789')
     'cbf43926'
+    >>> '%x' % crc32(b'56789', crc32(b'1234'))
+    'cbf43926'
+    >>> crc32(b'')
+    0
+    """
+    (t0, t1, t2, t3, t4, t5, t6, t7) = get_crc32_tables()
+    crc = value ^ 0xffffffff
+    data = bytearray(x)
+    n8 = len(data) - len(data) % 8
+    for (lo, hi) in iter_uint32_pairs(bytes(data[:n8])):
+        lo ^= crc
+        crc = (t7[lo & 0xff] ^ t6[(lo >> 8) & 0xff] ^
+               t5[(lo >> 16) & 0xff] ^ t4[lo >> 24] ^
+               t3[hi & 0xff] ^ t2[(hi >> 8) & 0xff] ^
+               t1[(hi >> 16) & 0xff] ^ t0[hi >> 24])
+    for c in data[n8:]:
+        crc = (crc >> 8) ^ t0[(crc ^ c) & 0xff]
+    return crc ^ 0xffffffff
+
+def iter_uint32_pairs(data):
+    if hasattr(struct, 'iter_unpack'):
+        return struct.iter_unpack('<II', data)
+    return (struct.unpack_from('<II', data, i)
+            for i in xrange(0, len(data), 8))
+
+def crc32_bytewise(x):
+    """
+    Calculate CRC32 of x one byte at a time.
+
+    >>> '%x' % crc32_bytewise(b'123456789')
+    'cbf43926'
     """
     T = get_crc32_table()
     crc = 0xffffffff
@@ -19,7 +55,7 @@ def crc32(x):
 
 @memoized
 def get_crc32_table():
-    table = {}
+    table = []
     for i in range(256):
         crc = i
         for j in range(8):
@@ -27,9 +63,24 @@ def get_crc32_table():
             crc >>= 1
             if outbit:
                 crc ^= crc32poly_mirrored
-        table[i] = crc
+        table.append(crc)
     return table
 
+@memoized
+def get_crc32_tables():
+    """
+    Get tables for slicing-by-8.
+
+    Table k gives the CRC contribution of a byte followed by k zero
+    bytes.
+    """
+    tables = [get_crc32_table()]
+    for k in range(1, 8):
+        prev = tables[-1]
+        tables.append(
+            [(prev[i] >> 8) ^ tables[0][prev[i] & 0xff] for i in range(256)])
+    return tables
+
 def r_crc32(x):
     """
     Calculate CRC32 of x using Rabin.
@@ -4,11 +4,14 @@ from .binfielddecoder import BfdMsb, BfdMsbB
 from .bitstring import BitString
 from .errors import *
 from .fieldlist import FieldList
+from .huffman import canonical_codes
 from .outputwindow import OutputWindow
 from .chrconvert import to_bin, to_printable
 from .infoprint import iprint
 from .sixx import int2byte
 
+WINDOW_SIZE = 32768
+
 cclorder = [16, 17, 18, 0, 8, 7, 9, 6, 10, 5, 11, 4, 12, 3, 13, 2, 14, 1, 15]
 
 class DeflateError(Error):
@@ -22,17 +25,36 @@ class DeflateBitString(BitString):
     def iprint(self, text):
         if self.info_stream:
             iprint(self.info_stream, text)
-    def decode_blocks(self):
+    def decode_blocks(self, window=None, checkpoint=None):
+        """
+        Decode deflate blocks and yield the decoded data.
+
+        Decoding may be resumed from the middle of a stream by giving
+        a window preloaded with the preceding output.  If checkpoint
+        is given, it is called as checkpoint(self, window) at the
+        beginning of every block.
+        """
         final = False
-        window = OutputWindow(max_size=32768)
+        if window is None:
+            window = OutputWindow(max_size=WINDOW_SIZE)
         self.stats = DeflateStats(self.info_stream)
         self.stats.start_offset = self.offset
-        assert window.sz == 0
         while not final:
+            if checkpoint:
+                checkpoint(self, window)
             for (data, fin) in self.decode_block(window):
-                yield data
+                if data:
+                    yield data
                 final = fin
         self.iprint(str(self.stats))
+    def build_index(self, span=None, stream_start=0):
+        """
+        Decode the rest of the stream and build a checkpoint index.
+
+        See deflate_index.DeflateIndex.
+        """
+        from .deflate_index import build_index
+        return build_index(self, span, stream_start)
     def decode_block(self, window):
         blockstats = self.stats.add_blockstats()
         blockstats['start_offset'] = self.offset
@@ -54,6 +76,8 @@ class DeflateBitString(BitString):
             decoder = self.decode_type3_block
         for data in decoder(f, window):
             yield (data, final)
+        # Blocks without output must end the stream too, if final
+        yield (b'', final)
     def decode_uncompressed_block(self, f, window):
         # uncompressed
         blockstats = self.stats.blockstats[-1]
@@ -71,8 +95,10 @@ class DeflateBitString(BitString):
         data = b''
         for dummy in xrange(block_len):
             data += int2byte(BfdMsb(0)(self.take(8)))
+        # Later blocks may refer to the stored data
+        window.append_bytes(bytearray(data))
         blockstats['data_stop_offset'] = self.offset
-        blockstats['output_stop_offset'] = (len(window) + len(data)) * 8
+        blockstats['output_stop_offset'] = len(window) * 8
         yield data
     def decode_type2_block(self, f, window):
         # type 2, fixed tables
@@ -230,6 +256,36 @@ class DeflateBlockStats(dict):
             iprint(
                 self.info_stream,
                 'BLOCK[%d]: %s=%s' % (self.blocknumber, key, value))
+    def __reduce__(self):
+        # Info stream is not picklable and not needed after decoding
+        return (rebuild_blockstats, (self.blocknumber, dict(self)))
+    def sizes(self):
+        """Return dict of block sizes in bits and ratios."""
+        nv = {
+            'type': self['type'],
+            'size':
+                self['data_stop_offset'] - self['start_offset'],
+            'codes_size':
+                self['data_start_offset'] - self['codes_start_offset'],
+            'data_size':
+                self['data_stop_offset'] - self['data_start_offset'],
+            'overhead_size':
+                self['data_start_offset'] - self['start_offset'],
+            'uncompressed_size':
+                self['output_stop_offset'] - self['output_start_offset'],
+            }
+        if nv['size'] > 0:
+            nv['overhead_ratio'] = float(nv['overhead_size']) / nv['size']
+            nv['compress_ratio'] = float(nv['uncompressed_size']) / nv['size']
+        else:
+            nv['overhead_ratio'] = 'inf'
+            nv['compress_ratio'] = 'inf'
+        return nv
+
+def rebuild_blockstats(blocknumber, items):
+    blockstats = DeflateBlockStats(blocknumber, None)
+    dict.update(blockstats, items)
+    return blockstats
 
 class DeflateStats(object):
     def __init__(self, info_stream):
@@ -240,6 +296,39 @@ class DeflateStats(object):
         x = DeflateBlockStats(len(self.blockstats), self.info_stream)
         self.blockstats.append(x)
         return x
+    def __getstate__(self):
+        state = dict(self.__dict__)
+        state['info_stream'] = None
+        return state
+    def merge(self, other):
+        """Append block stats of other to these stats."""
+        for bs in other.blockstats:
+            self.blockstats.append(
+                rebuild_blockstats(len(self.blockstats), bs))
+    def totals(self):
+        """
+        Return dict of block type counts and total sizes in bits.
+        """
+        totals = {
+            'blocks': len(self.blockstats),
+            'type 1 blocks': 0,
+            'type 2 blocks': 0,
+            'type 3 blocks': 0,
+            'compressed size': 0,
+            'uncompressed size': 0,
+            'overhead size': 0,
+            'codes size': 0,
+            'data size': 0,
+            }
+        for bs in self.blockstats:
+            nv = bs.sizes()
+            totals['type %d blocks' % nv['type']] += 1
+            totals['compressed size'] += nv['size']
+            totals['uncompressed size'] += nv['uncompressed_size']
+            totals['overhead size'] += nv['overhead_size']
+            totals['codes size'] += nv['codes_size']
+            totals['data size'] += nv['data_size']
+        return totals
     def __str__(self):
         ret = ''
         def widen(text, width=35):
@@ -249,25 +338,7 @@ class DeflateStats(object):
         total_uncompressed_size = 0
         total_overhead_size = 0
         for (i, bs) in enumerate(self.blockstats):
-            nv = {
-                'type': bs['type'],
-                'size':
-                    bs['data_stop_offset'] - bs['start_offset'],
-                'codes_size':
-                    bs['data_start_offset'] - bs['codes_start_offset'],
-                'data_size':
-                    bs['data_stop_offset'] - bs['data_start_offset'],
-                'overhead_size':
-                    bs['data_start_offset'] - bs['start_offset'],
-                'uncompressed_size':
-                    bs['output_stop_offset'] - bs['output_start_offset'],
-                }
-            if nv['size'] > 0:
-                nv['overhead_ratio'] = float(nv['overhead_size']) / nv['size']
-                nv['compress_ratio'] = float(nv['uncompressed_size']) / nv['size']
-            else:
-                nv['overhead_ratio'] = 'inf'
-                nv['compress_ratio'] = 'inf'
+            nv = bs.sizes()
             block_type_counts[bs['type']] += 1
             total_compressed_size += nv['size']
             total_uncompressed_size += nv['uncompressed_size']
@@ -378,24 +449,16 @@ def code_length_list_from_fieldlist(fl):
     return cll
 
 def generate_huffman_codes_from_code_lengths(code_lengths):
-    bl_count = defaultdict(int)
-    for cl in code_lengths:
-        bl_count[cl] += 1
-    bl_count[0] = 0
-    next_code = {}
-    code = 0
-    max_code_length = max(code_lengths)
-    for bits in xrange(1, max_code_length + 1):
-        code = (code + bl_count[bits - 1]) * 2
-        next_code[bits] = code
-    codes = {}
-    for (k, cl) in enumerate(code_lengths):
-        if cl:
-            codes[k] = next_code[cl]
-            next_code[cl] += 1
+    """
+    Return dict from codeword strings to symbols.
+
+    >>> codes = generate_huffman_codes_from_code_lengths([2, 1, 0, 3, 3])
+    >>> sorted(codes.items())
+    [('0', 1), ('10', 0), ('110', 3), ('111', 4)]
+    """
     code_to_sym = {}
-    for k in codes.keys():
-        b = bin(codes[k]).split('b')[1]
-        b = (code_lengths[k] - len(b)) * '0' + b
-        code_to_sym[b] = k
+    for (k, (code, cl)) in enumerate(
+            zip(canonical_codes(code_lengths), code_lengths)):
+        if cl:
+            code_to_sym['{x:0{n}b}'.format(x=code, n=cl)] = k
     return code_to_sym
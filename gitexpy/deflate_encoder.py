@@ -0,0 +1,764 @@
+"""
+Deflate compression.
+
+Produces standard deflate streams (RFC 1951) with greedy, lazy or
+optimal LZ77 parsing.  The optimal mode does iterative cost-based
+parsing: shortest path over the match graph where the edge costs are
+taken from the Huffman code lengths of the previous pass.  The parsed
+symbol stream is then split into blocks at the points which minimize
+the total encoded size.
+"""
+
+from six.moves import xrange
+from .adler32 import adler32
+from .bitstring import BitWriter, reverse_bits
+from .deflate import DeflateStats, cclorder, get_ll_table, get_d_table
+from .errors import *
+from .huffman import canonical_codes, code_lengths
+from .infoprint import iprint
+from .memoize import memoized
+
+MIN_MATCH = 3
+MAX_MATCH = 258
+WINDOW_SIZE = 32768
+WINDOW_MASK = WINDOW_SIZE - 1
+MAX_STORED_LEN = 65535
+MAX_CODE_LENGTH = 15
+MAX_CL_CODE_LENGTH = 7
+END_OF_BLOCK = 256
+
+BTYPE_STORED = 1
+BTYPE_FIXED = 2
+BTYPE_DYNAMIC = 3
+
+MODE_GREEDY = 'greedy'
+MODE_LAZY = 'lazy'
+MODE_OPTIMAL = 'optimal'
+
+mode_defaults = {
+    # mode: (max_chain, nice_length)
+    MODE_GREEDY: (32, 32),
+    MODE_LAZY: (128, 128),
+    MODE_OPTIMAL: (256, MAX_MATCH),
+}
+
+fixed_ll_lengths = (144 * [8]) + (112 * [9]) + (24 * [7]) + (8 * [8])
+fixed_d_lengths = 32 * [5]
+
+class DeflateEncoderError(Error):
+    """Deflate Encoder Error"""
+
+@memoized
+def get_length_code_table():
+    """
+    Return table for encoding match lengths.
+
+    The table is a list indexed by length, containing tuples in format
+    (code, extra_bits, extra_value).
+
+    >>> lct = get_length_code_table()
+    >>> [lct[3], lct[10], lct[11], lct[12]]
+    [(257, 0, 0), (264, 0, 0), (265, 1, 0), (265, 1, 1)]
+    >>> [lct[257], lct[258]]
+    [(284, 5, 30), (285, 0, 0)]
+    """
+    table = (MAX_MATCH + 1) * [None]
+    ll = get_ll_table()
+    for code in sorted(ll.keys()):
+        (extra_bits, first_len) = ll[code]
+        for length in xrange(first_len, min(first_len + 2**extra_bits,
+                                            MAX_MATCH + 1)):
+            table[length] = (code, extra_bits, length - first_len)
+    return table
+
+@memoized
+def get_distance_code_table():
+    """
+    Return table for encoding match distances.
+
+    The table is a list indexed by distance, containing tuples in
+    format (code, extra_bits, extra_value).
+
+    >>> dct = get_distance_code_table()
+    >>> [dct[1], dct[4], dct[5], dct[32768]]
+    [(0, 0, 0), (3, 0, 0), (4, 1, 0), (29, 13, 8191)]
+    """
+    table = (WINDOW_SIZE + 1) * [None]
+    dt = get_d_table()
+    for code in sorted(dt.keys()):
+        (extra_bits, first_d) = dt[code]
+        for dist in xrange(first_d, first_d + 2**extra_bits):
+            table[dist] = (code, extra_bits, dist - first_d)
+    return table
+
+def match_length(data, i, j, max_length):
+    """
+    Return length of the common prefix of data[i:] and data[j:].
+
+    >>> match_length(b'abcabcabd', 0, 3, 6)
+    5
+    """
+    length = 0
+    while (length + 16 <= max_length and
+           data[i+length:i+length+16] == data[j+length:j+length+16]):
+        length += 16
+    while length < max_length and data[i+length] == data[j+length]:
+        length += 1
+    return length
+
+class MatchFinder(object):
+    """
+    LZ77 match finder using hash chains of 3-byte prefixes.
+
+    >>> mf = MatchFinder(b'abcdabcabcd', max_chain=8)
+    >>> for i in range(7):
+    ...     mf.insert(i)
+    >>> mf.find(7)
+    [(3, 3), (4, 7)]
+    """
+    def __init__(self, data, max_chain=128, nice_length=MAX_MATCH):
+        self.data = bytes(data)
+        self.max_chain = max_chain
+        self.nice_length = nice_length
+        self.head = {}
+        self.prev = WINDOW_SIZE * [-1]
+    def insert(self, i):
+        key = self.data[i:i+MIN_MATCH]
+        if len(key) == MIN_MATCH:
+            self.prev[i & WINDOW_MASK] = self.head.get(key, -1)
+            self.head[key] = i
+    def find(self, i):
+        """
+        Find matches for position i.
+
+        Return list of (length, distance) pairs in increasing length
+        order.  Every length is paired with the smallest distance
+        that has a match at least that long.
+        """
+        data = self.data
+        max_length = min(MAX_MATCH, len(data) - i)
+        matches = []
+        if max_length < MIN_MATCH:
+            return matches
+        j = self.head.get(data[i:i+MIN_MATCH], -1)
+        best = MIN_MATCH - 1
+        chain = self.max_chain
+        prev = self.prev
+        while j >= 0 and i - j <= WINDOW_SIZE and chain > 0:
+            if data[j+best] == data[i+best]:
+                length = match_length(data, j, i, max_length)
+                if length > best:
+                    best = length
+                    matches.append((length, i - j))
+                    if length >= self.nice_length or length >= max_length:
+                        break
+            j = prev[j & WINDOW_MASK]
+            chain -= 1
+        return matches
+
+class LZ77Store(object):
+    """
+    Parsed LZ77 symbol stream.
+
+    Literals are stored with distance 0, matches as (length, distance).
+    """
+    def __init__(self):
+        self.litlens = []
+        self.dists = []
+    def __len__(self):
+        return len(self.litlens)
+    def append_literal(self, value):
+        self.litlens.append(value)
+        self.dists.append(0)
+    def append_match(self, length, dist):
+        self.litlens.append(length)
+        self.dists.append(dist)
+    def extend(self, other):
+        self.litlens += other.litlens
+        self.dists += other.dists
+    def byte_length(self, start=0, stop=None):
+        stop = len(self) if stop is None else stop
+        return sum(
+            (self.litlens[k] if self.dists[k] else 1)
+            for k in xrange(start, stop))
+    def histogram(self, start=0, stop=None):
+        """
+        Return (ll_freqs, d_freqs, extra_bits) of the given symbol range.
+
+        The end of block symbol is counted in too.
+        """
+        stop = len(self) if stop is None else stop
+        lct = get_length_code_table()
+        dct = get_distance_code_table()
+        ll_freqs = 286 * [0]
+        d_freqs = 30 * [0]
+        extra_bits = 0
+        litlens = self.litlens
+        dists = self.dists
+        for k in xrange(start, stop):
+            dist = dists[k]
+            if dist:
+                (lcode, lxbits, dummy) = lct[litlens[k]]
+                (dcode, dxbits, dummy) = dct[dist]
+                ll_freqs[lcode] += 1
+                d_freqs[dcode] += 1
+                extra_bits += lxbits + dxbits
+            else:
+                ll_freqs[litlens[k]] += 1
+        ll_freqs[END_OF_BLOCK] += 1
+        return (ll_freqs, d_freqs, extra_bits)
+
+def ensure_two_codes(freqs):
+    """
+    Make sure that at least two symbols have non-zero frequency.
+
+    Codes with a single codeword are incomplete, which is not accepted
+    by every inflater.
+
+    >>> ensure_two_codes([0, 0, 0])
+    [1, 1, 0]
+    >>> ensure_two_codes([0, 0, 4])
+    [1, 0, 4]
+    """
+    freqs = list(freqs)
+    used = sum(1 for f in freqs if f)
+    for s in xrange(len(freqs)):
+        if used >= 2:
+            break
+        if not freqs[s]:
+            freqs[s] = 1
+            used += 1
+    return freqs
+
+def rle_code_lengths(lengths):
+    """
+    Run length encode code lengths with the code length alphabet.
+
+    Return list of (symbol, extra_bits, extra_value).
+
+    >>> rle_code_lengths([5, 5, 5, 5, 5, 0, 0, 0, 8])
+    [(5, 0, 0), (16, 2, 1), (17, 3, 0), (8, 0, 0)]
+    >>> rle_code_lengths(20 * [0] + [1, 1])
+    [(18, 7, 9), (1, 0, 0), (1, 0, 0)]
+    """
+    result = []
+    i = 0
+    n = len(lengths)
+    while i < n:
+        length = lengths[i]
+        run = 1
+        while i + run < n and lengths[i+run] == length:
+            run += 1
+        i += run
+        if length == 0:
+            while run >= 11:
+                r = min(run, 138)
+                result.append((18, 7, r - 11))
+                run -= r
+            if run >= 3:
+                result.append((17, 3, run - 3))
+                run = 0
+        else:
+            result.append((length, 0, 0))
+            run -= 1
+            while run >= 3:
+                r = min(run, 6)
+                result.append((16, 2, r - 3))
+                run -= r
+        result += run * [(length, 0, 0)]
+    return result
+
+class DynamicHeader(object):
+    """
+    Code length header of a dynamic Huffman block.
+    """
+    def __init__(self, ll_freqs, d_freqs):
+        self.ll_lengths = code_lengths(
+            ensure_two_codes(ll_freqs), MAX_CODE_LENGTH)
+        self.d_lengths = code_lengths(
+            ensure_two_codes(d_freqs), MAX_CODE_LENGTH)
+        self.hlit = max(257, last_nonzero(self.ll_lengths) + 1)
+        self.hdist = max(1, last_nonzero(self.d_lengths) + 1)
+        self.ll_rle = rle_code_lengths(self.ll_lengths[:self.hlit])
+        self.d_rle = rle_code_lengths(self.d_lengths[:self.hdist])
+        cl_freqs = 19 * [0]
+        for (sym, dummy, dummy) in self.ll_rle + self.d_rle:
+            cl_freqs[sym] += 1
+        self.cl_lengths = code_lengths(
+            ensure_two_codes(cl_freqs), MAX_CL_CODE_LENGTH)
+        self.hclen = max(
+            4, last_nonzero([self.cl_lengths[c] for c in cclorder]) + 1)
+    def size(self):
+        bits = 5 + 5 + 4 + 3 * self.hclen
+        for (sym, extra_bits, dummy) in self.ll_rle + self.d_rle:
+            bits += self.cl_lengths[sym] + extra_bits
+        return bits
+    def data_size(self, ll_freqs, d_freqs):
+        return (
+            sum(f * l for (f, l) in zip(ll_freqs, self.ll_lengths)) +
+            sum(f * l for (f, l) in zip(d_freqs, self.d_lengths)))
+
+def longest(matches):
+    return matches[-1] if matches else (0, 0)
+
+def last_nonzero(seq):
+    for i in xrange(len(seq) - 1, -1, -1):
+        if seq[i]:
+            return i
+    return -1
+
+def stored_size(nbytes):
+    """Estimate size of stored block(s) in bits."""
+    nblocks = max(1, (nbytes + MAX_STORED_LEN - 1) // MAX_STORED_LEN)
+    return nblocks * (3 + 5 + 32) + 8 * nbytes
+
+def block_size(ll_freqs, d_freqs, extra_bits, nbytes):
+    """
+    Calculate the best block type and its size in bits.
+
+    Return (btype, size).
+    """
+    header = DynamicHeader(ll_freqs, d_freqs)
+    dynamic = (
+        3 + extra_bits + header.size() + header.data_size(ll_freqs, d_freqs))
+    fixed = 3 + extra_bits + (
+        sum(f * l for (f, l) in zip(ll_freqs, fixed_ll_lengths)) +
+        sum(f * l for (f, l) in zip(d_freqs, fixed_d_lengths)))
+    return min(
+        (stored_size(nbytes), BTYPE_STORED),
+        (fixed, BTYPE_FIXED),
+        (dynamic, BTYPE_DYNAMIC))[::-1]
+
+class CostModel(object):
+    """
+    Symbol costs in bits for the optimal parser.
+
+    The costs are the Huffman code lengths calculated from the symbol
+    statistics of the previous pass.  Symbols not used in the previous
+    pass are assumed to cost one bit more than the longest code.
+    """
+    def __init__(self, ll_freqs, d_freqs):
+        ll_lengths = code_lengths(ll_freqs, MAX_CODE_LENGTH)
+        d_lengths = code_lengths(d_freqs, MAX_CODE_LENGTH)
+        ll_unused = max(ll_lengths) + 1
+        d_unused = max(d_lengths) + 1
+        self.literal = [ll_lengths[b] or ll_unused for b in xrange(256)]
+        self.length = (MAX_MATCH + 1) * [0]
+        lct = get_length_code_table()
+        for length in xrange(MIN_MATCH, MAX_MATCH + 1):
+            (code, extra_bits, dummy) = lct[length]
+            self.length[length] = (ll_lengths[code] or ll_unused) + extra_bits
+        self.dist_code = [
+            (l or d_unused) + get_d_table()[c][0]
+            for (c, l) in enumerate(d_lengths)]
+        self.dct = get_distance_code_table()
+    def distance(self, dist):
+        return self.dist_code[self.dct[dist][0]]
+    @classmethod
+    def from_store(cls, store, start=0, stop=None):
+        (ll_freqs, d_freqs, dummy) = store.histogram(start, stop)
+        return cls(ll_freqs, d_freqs)
+
+def store_size(store, start=0, stop=None, nbytes=None):
+    (ll_freqs, d_freqs, extra_bits) = store.histogram(start, stop)
+    if nbytes is None:
+        nbytes = store.byte_length(start, stop)
+    return block_size(ll_freqs, d_freqs, extra_bits, nbytes)[1]
+
+class DeflateEncoder(object):
+    """
+    Deflate encoder.
+
+    >>> import zlib
+    >>> data = 20 * b'Hello Deflate! '
+    >>> for mode in (MODE_GREEDY, MODE_LAZY, MODE_OPTIMAL):
+    ...     encoded = DeflateEncoder(mode=mode).encode(data)
+    ...     assert zlib.decompress(encoded, -15) == data
+    >>> len(DeflateEncoder(mode=MODE_OPTIMAL).encode(data))
+    21
+    """
+    def __init__(self, mode=MODE_OPTIMAL, info_stream=None,
+                 iterations=5, max_blocks=15, min_block_symbols=512,
+                 block_symbols=16384, max_chain=None, nice_length=None):
+        if mode not in mode_defaults:
+            raise DeflateEncoderError('Unknown mode: %r' % (mode,))
+        self.mode = mode
+        self.info_stream = info_stream
+        self.iterations = iterations
+        self.max_blocks = max_blocks
+        self.min_block_symbols = min_block_symbols
+        self.block_symbols = block_symbols
+        (default_chain, default_nice) = mode_defaults[mode]
+        self.max_chain = max_chain or default_chain
+        self.nice_length = nice_length or default_nice
+        self.stats = None
+    def iprint(self, text):
+        if self.info_stream:
+            iprint(self.info_stream, text)
+    def encode(self, data, writer=None):
+        """
+        Encode data to a deflate stream.
+
+        If writer is given, the stream is written to it and the
+        returned value contains also what was written before.
+        """
+        w = writer if writer is not None else BitWriter()
+        self.data = bytes(data)
+        self.values = bytearray(data)
+        self.finder = MatchFinder(
+            self.data, max_chain=self.max_chain, nice_length=self.nice_length)
+        self.stats = DeflateStats(self.info_stream)
+        self.stats.start_offset = w.tell()
+        if self.mode == MODE_GREEDY:
+            blocks = self.fixed_size_blocks(self.greedy_parse())
+        elif self.mode == MODE_LAZY:
+            blocks = self.fixed_size_blocks(self.lazy_parse())
+        else:
+            blocks = self.optimal_blocks()
+        pos = 0
+        for (n, store) in enumerate(blocks):
+            nbytes = store.byte_length()
+            self.write_block(
+                w, store, pos, pos + nbytes, n == len(blocks) - 1)
+            pos += nbytes
+        assert pos == len(self.data)
+        self.iprint(str(self.stats))
+        return w.getvalue()
+    def greedy_parse(self):
+        store = LZ77Store()
+        finder = self.finder
+        i = 0
+        while i < len(self.data):
+            (length, dist) = longest(finder.find(i))
+            finder.insert(i)
+            if length:
+                store.append_match(length, dist)
+                for k in xrange(i + 1, i + length):
+                    finder.insert(k)
+                i += length
+            else:
+                store.append_literal(self.values[i])
+                i += 1
+        return store
+    def lazy_parse(self):
+        store = LZ77Store()
+        finder = self.finder
+        values = self.values
+        n = len(self.data)
+        i = 0
+        pending = None
+        while i < n:
+            if pending is None:
+                cur = longest(finder.find(i))
+                finder.insert(i)
+            else:
+                (cur, pending) = (pending, None)
+            inserted = i + 1
+            if MIN_MATCH <= cur[0] < self.nice_length and i + 1 < n:
+                nxt = longest(finder.find(i + 1))
+                finder.insert(i + 1)
+                inserted = i + 2
+                if nxt[0] > cur[0]:
+                    # Defer: a literal followed by the longer match
+                    store.append_literal(values[i])
+                    i += 1
+                    pending = nxt
+                    continue
+            if cur[0] >= MIN_MATCH:
+                store.append_match(*cur)
+                for k in xrange(inserted, i + cur[0]):
+                    finder.insert(k)
+                i += cur[0]
+            else:
+                store.append_literal(values[i])
+                i += 1
+        return store
+    def find_all_matches(self):
+        finder = self.finder
+        all_matches = []
+        for i in xrange(len(self.data)):
+            all_matches.append(finder.find(i))
+            finder.insert(i)
+        return all_matches
+    def optimal_parse(self, all_matches, costs, start, stop):
+        """
+        Find the cheapest parse of data[start:stop] for the costs.
+
+        The parse is the shortest path from start to stop in the
+        graph in which every position has an edge to the next
+        position (a literal) and to every position reachable with a
+        match.
+        """
+        values = self.values
+        n = stop - start
+        inf = float('inf')
+        cost = [0.0] + n * [inf]
+        step_length = (n + 1) * [0]
+        step_dist = (n + 1) * [0]
+        literal_cost = costs.literal
+        length_cost = costs.length
+        for p in xrange(n):
+            c = cost[p]
+            i = start + p
+            x = c + literal_cost[values[i]]
+            if x < cost[p+1]:
+                cost[p+1] = x
+                step_length[p+1] = 1
+                step_dist[p+1] = 0
+            matches = all_matches[i]
+            if not matches:
+                continue
+            limit = stop - i
+            lo = MIN_MATCH
+            if matches[-1][0] == MAX_MATCH and limit >= MAX_MATCH:
+                # In a long repetition: only the longest match is
+                # worth considering.
+                lo = MAX_MATCH
+            for (length, dist) in matches:
+                hi = min(length, limit)
+                if hi < lo:
+                    continue
+                dc = c + costs.distance(dist)
+                for l in xrange(lo, hi + 1):
+                    x = dc + length_cost[l]
+                    if x < cost[p+l]:
+                        cost[p+l] = x
+                        step_length[p+l] = l
+                        step_dist[p+l] = dist
+                lo = hi + 1
+                if hi == limit:
+                    break
+        steps = []
+        p = n
+        while p > 0:
+            steps.append((step_length[p], step_dist[p]))
+            p -= step_length[p]
+        store = LZ77Store()
+        p = start
+        for (length, dist) in reversed(steps):
+            if dist:
+                store.append_match(length, dist)
+            else:
+                store.append_literal(values[p])
+            p += length
+        return store
+    def iterate_optimal_parse(self, all_matches, store, start, stop):
+        """
+        Improve the parse of data[start:stop] iteratively.
+
+        Every iteration uses the statistics of the previous parse as
+        its cost model.  Return the smallest parse found.
+        """
+        nbytes = stop - start
+        best = store
+        best_size = store_size(store, nbytes=nbytes)
+        for dummy in xrange(self.iterations):
+            costs = CostModel.from_store(store)
+            store = self.optimal_parse(all_matches, costs, start, stop)
+            size = store_size(store, nbytes=nbytes)
+            if size < best_size:
+                (best, best_size) = (store, size)
+        return best
+    def optimal_blocks(self):
+        all_matches = self.find_all_matches()
+        n = len(self.data)
+        store = self.lz77_from_matches(all_matches)
+        store = self.iterate_optimal_parse(all_matches, store, 0, n)
+        blocks = []
+        pos = 0
+        for (start, stop) in self.split_points(store):
+            nbytes = store.byte_length(start, stop)
+            block_store = LZ77Store()
+            block_store.litlens = store.litlens[start:stop]
+            block_store.dists = store.dists[start:stop]
+            blocks.append(self.iterate_optimal_parse(
+                all_matches, block_store, pos, pos + nbytes))
+            pos += nbytes
+        return blocks
+    def lz77_from_matches(self, all_matches):
+        """Greedy parse using precalculated matches."""
+        store = LZ77Store()
+        i = 0
+        while i < len(self.data):
+            matches = all_matches[i]
+            if matches:
+                store.append_match(*matches[-1])
+                i += matches[-1][0]
+            else:
+                store.append_literal(self.values[i])
+                i += 1
+        return store
+    def split_points(self, store):
+        """
+        Split the symbol stream to blocks minimizing the total size.
+
+        Candidate split points are evenly spaced and the best subset
+        of them is found with dynamic programming.  Return list of
+        (start, stop) symbol index pairs.
+        """
+        nsym = len(store)
+        step = max(self.min_block_symbols,
+                   (nsym + self.max_blocks - 1) // max(1, self.max_blocks))
+        points = list(xrange(0, nsym, step)) + [nsym]
+        if len(points) > 1 and points[-2] == nsym:
+            points.pop()
+        if len(points) <= 2:
+            return [(0, nsym)]
+        hists = []
+        for k in xrange(len(points) - 1):
+            (ll, d, extra) = store.histogram(points[k], points[k+1])
+            ll[END_OF_BLOCK] -= 1
+            hists.append((ll, d, extra, store.byte_length(points[k], points[k+1])))
+        best = [0] + (len(points) - 1) * [None]
+        best_from = len(points) * [0]
+        for j in xrange(1, len(points)):
+            ll = 286 * [0]
+            d = 30 * [0]
+            extra = 0
+            nbytes = 0
+            for i in xrange(j - 1, -1, -1):
+                (hll, hd, hextra, hbytes) = hists[i]
+                ll = [x + y for (x, y) in zip(ll, hll)]
+                d = [x + y for (x, y) in zip(d, hd)]
+                extra += hextra
+                nbytes += hbytes
+                eob_ll = list(ll)
+                eob_ll[END_OF_BLOCK] += 1
+                size = best[i] + block_size(eob_ll, d, extra, nbytes)[1]
+                if best[j] is None or size < best[j]:
+                    best[j] = size
+                    best_from[j] = i
+        result = []
+        j = len(points) - 1
+        while j > 0:
+            i = best_from[j]
+            result.append((points[i], points[j]))
+            j = i
+        return list(reversed(result))
+    def fixed_size_blocks(self, store):
+        blocks = []
+        for start in xrange(0, max(1, len(store)), self.block_symbols):
+            block_store = LZ77Store()
+            block_store.litlens = store.litlens[start:start+self.block_symbols]
+            block_store.dists = store.dists[start:start+self.block_symbols]
+            blocks.append(block_store)
+        return blocks
+    def write_block(self, w, store, byte_start, byte_stop, final):
+        (ll_freqs, d_freqs, extra_bits) = store.histogram()
+        (btype, dummy) = block_size(
+            ll_freqs, d_freqs, extra_bits, byte_stop - byte_start)
+        if btype == BTYPE_STORED:
+            self.write_stored_blocks(w, byte_start, byte_stop, final)
+            return
+        blockstats = self.stats.add_blockstats()
+        blockstats['start_offset'] = w.tell()
+        w.write(int(final), 1)
+        w.write(btype - 1, 2)
+        blockstats['type'] = btype
+        blockstats['codes_start_offset'] = w.tell()
+        if btype == BTYPE_FIXED:
+            (ll_lengths, d_lengths) = (fixed_ll_lengths, fixed_d_lengths)
+        else:
+            header = DynamicHeader(ll_freqs, d_freqs)
+            self.write_dynamic_header(w, header, blockstats)
+            (ll_lengths, d_lengths) = (header.ll_lengths, header.d_lengths)
+        blockstats['data_start_offset'] = w.tell()
+        blockstats['output_start_offset'] = byte_start * 8
+        self.write_data(w, store, ll_lengths, d_lengths)
+        blockstats['data_stop_offset'] = w.tell()
+        blockstats['output_stop_offset'] = byte_stop * 8
+    def write_stored_blocks(self, w, byte_start, byte_stop, final):
+        pos = byte_start
+        while True:
+            block_len = min(MAX_STORED_LEN, byte_stop - pos)
+            last = final and pos + block_len == byte_stop
+            blockstats = self.stats.add_blockstats()
+            blockstats['start_offset'] = w.tell()
+            w.write(int(last), 1)
+            w.write(BTYPE_STORED - 1, 2)
+            blockstats['type'] = BTYPE_STORED
+            w.align()
+            w.write(block_len, 16)
+            w.write(block_len ^ 0xffff, 16)
+            blockstats['codes_start_offset'] = w.tell()
+            blockstats['data_start_offset'] = w.tell()
+            blockstats['output_start_offset'] = pos * 8
+            w.write_bytes(self.data[pos:pos+block_len])
+            pos += block_len
+            blockstats['data_stop_offset'] = w.tell()
+            blockstats['output_stop_offset'] = pos * 8
+            if pos >= byte_stop:
+                break
+    def write_dynamic_header(self, w, header, blockstats):
+        w.write(header.hlit - 257, 5)
+        w.write(header.hdist - 1, 5)
+        w.write(header.hclen - 4, 4)
+        for c in cclorder[:header.hclen]:
+            w.write(header.cl_lengths[c], 3)
+        cl_codes = canonical_codes(header.cl_lengths)
+        blockstats['ll_codes_start_offset'] = w.tell()
+        for (rle, name) in ((header.ll_rle, 'd_codes_start_offset'),
+                            (header.d_rle, None)):
+            for (sym, extra_bits, extra_value) in rle:
+                w.write_code(cl_codes[sym], header.cl_lengths[sym])
+                w.write(extra_value, extra_bits)
+            if name:
+                blockstats[name] = w.tell()
+    def write_data(self, w, store, ll_lengths, d_lengths):
+        ll_rev = [reverse_bits(c, l) for (c, l) in
+                  zip(canonical_codes(ll_lengths), ll_lengths)]
+        d_rev = [reverse_bits(c, l) for (c, l) in
+                 zip(canonical_codes(d_lengths), d_lengths)]
+        lct = get_length_code_table()
+        dct = get_distance_code_table()
+        write = w.write
+        for (litlen, dist) in zip(store.litlens, store.dists):
+            if dist:
+                (lcode, lxbits, lxval) = lct[litlen]
+                (dcode, dxbits, dxval) = dct[dist]
+                write(ll_rev[lcode], ll_lengths[lcode])
+                write(lxval, lxbits)
+                write(d_rev[dcode], d_lengths[dcode])
+                write(dxval, dxbits)
+            else:
+                write(ll_rev[litlen], ll_lengths[litlen])
+        write(ll_rev[END_OF_BLOCK], ll_lengths[END_OF_BLOCK])
+
+def compress_raw(data, mode=MODE_OPTIMAL, info_stream=None, **kwargs):
+    """
+    Compress data to a raw deflate stream.
+
+    >>> import zlib
+    >>> zlib.decompress(compress_raw(b'abcabcabc'), -15) == b'abcabcabc'
+    True
+    """
+    return DeflateEncoder(mode, info_stream, **kwargs).encode(data)
+
+def compress(data, mode=MODE_OPTIMAL, info_stream=None, **kwargs):
+    """
+    Compress data to a zlib stream.
+
+    >>> import zlib
+    >>> zlib.decompress(compress(b'Hello World!')) == b'Hello World!'
+    True
+    """
+    w = BitWriter()
+    w.write_bytes(b'\x78\xda')
+    DeflateEncoder(mode, info_stream, **kwargs).encode(data, w)
+    w.align()
+    adler = adler32(data)
+    w.write_bytes(bytearray((adler >> s) & 0xff for s in (24, 16, 8, 0)))
+    return w.getvalue()
+
+def main(sys):
+    from .sixx import make_streams_binary
+    mode = MODE_OPTIMAL
+    if len(sys.argv) > 1:
+        mode = sys.argv[1]
+    info_stream = sys.stderr
+    make_streams_binary(sys)
+    sys.stdout.write(compress(sys.stdin.read(), mode, info_stream))
+
+if __name__ == '__main__':
+    import sys
+    main(sys)
@@ -0,0 +1,222 @@
+"""
+Random access to deflate streams.
+
+A checkpoint index records the decoder state at some block boundaries:
+the input bit offset, the output offset and the last 32 KiB of output
+(the window).  Decoding can be resumed from any checkpoint, so a byte
+range from the middle of a large stream can be read without inflating
+everything before it.  This is the technique of zran.c from the zlib
+examples.
+
+The index can be saved to a file and loaded back.  The windows are
+stored zlib compressed.
+"""
+
+import bisect
+import struct
+import zlib
+from .deflate import DeflateBitString, WINDOW_SIZE
+from .errors import *
+from .outputwindow import OutputWindow
+
+DEFAULT_SPAN = 2**20
+
+INDEX_MAGIC = b'GXDI'
+INDEX_VERSION = 1
+
+class DeflateIndexError(Error):
+    """Deflate Index Error"""
+
+class Checkpoint(object):
+    """
+    Decoder state at the beginning of a deflate block.
+
+    bit_offset is relative to the start of the bit string and
+    out_offset to the start of the decoded data.
+    """
+    def __init__(self, bit_offset, out_offset, window):
+        self.bit_offset = bit_offset
+        self.out_offset = out_offset
+        self.window = bytes(window)
+    def __repr__(self):
+        return '<%s bit_offset=%d out_offset=%d window=%d>' % (
+            self.__class__.__name__,
+            self.bit_offset, self.out_offset, len(self.window))
+
+class DeflateIndex(object):
+    """
+    Checkpoint index of a deflate stream.
+
+    Usage example:
+
+    >>> from six import BytesIO
+    >>> data = ' '.join(str(i * i) for i in range(25000)).encode('ascii')
+    >>> stream = BytesIO(zlib.compress(data))
+    >>> binstr = DeflateBitString(stream)
+    >>> binstr.discard(16)  # skip zlib header
+    >>> index = binstr.build_index(span=40000)
+    >>> len(index.checkpoints) > 2
+    True
+    >>> index.total_out == len(data)
+    True
+    >>> index.read_at(stream, 100000, 20) == data[100000:100020]
+    True
+    """
+    def __init__(self, span=DEFAULT_SPAN, stream_start=0):
+        self.span = span
+        self.stream_start = stream_start
+        self.checkpoints = []
+        self.total_out = None
+    def add_checkpoint(self, bit_offset, out_offset, window):
+        assert not self.checkpoints or (
+            out_offset > self.checkpoints[-1].out_offset)
+        self.checkpoints.append(Checkpoint(bit_offset, out_offset, window))
+    def find_checkpoint(self, offset):
+        """Find the last checkpoint at or before output offset."""
+        out_offsets = [cp.out_offset for cp in self.checkpoints]
+        i = bisect.bisect_right(out_offsets, offset) - 1
+        if i < 0:
+            raise DeflateIndexError('No checkpoint for offset %d' % offset)
+        return self.checkpoints[i]
+    def read_at(self, in_stream, offset, length):
+        """
+        Read length bytes of decoded data starting from offset.
+
+        The in_stream should be a seekable stream of the same data
+        that the index was built from.
+        """
+        if offset < 0 or length < 0:
+            raise DeflateIndexError('Negative offset or length')
+        if self.total_out is not None:
+            length = max(0, min(length, self.total_out - offset))
+        if length == 0:
+            return b''
+        cp = self.find_checkpoint(offset)
+        in_stream.seek(self.stream_start + cp.bit_offset // 8)
+        binstr = DeflateBitString(in_stream)
+        binstr.discard(cp.bit_offset % 8)
+        window = OutputWindow(max_size=WINDOW_SIZE)
+        window.append_bytes(bytearray(cp.window))
+        skip = offset - cp.out_offset
+        chunks = []
+        left = length
+        for data in binstr.decode_blocks(window=window):
+            if skip >= len(data):
+                skip -= len(data)
+                continue
+            chunk = bytes(data[skip:skip+left])
+            skip = 0
+            chunks.append(chunk)
+            left -= len(chunk)
+            if left == 0:
+                break
+        return b''.join(chunks)
+    def save(self, out_stream):
+        out_stream.write(INDEX_MAGIC)
+        out_stream.write(struct.pack(
+            '>BQQQL', INDEX_VERSION, self.span, self.stream_start,
+            self.total_out, len(self.checkpoints)))
+        for cp in self.checkpoints:
+            compressed_window = zlib.compress(cp.window)
+            out_stream.write(struct.pack(
+                '>QQL', cp.bit_offset, cp.out_offset,
+                len(compressed_window)))
+            out_stream.write(compressed_window)
+    @classmethod
+    def load(cls, in_stream):
+        """
+        Load index saved with save.
+
+        >>> from six import BytesIO
+        >>> index = DeflateIndex(span=42, stream_start=2)
+        >>> index.add_checkpoint(0, 0, b'')
+        >>> index.add_checkpoint(123, 456, b'abc')
+        >>> index.total_out = 789
+        >>> f = BytesIO()
+        >>> index.save(f)
+        >>> loaded = DeflateIndex.load(BytesIO(f.getvalue()))
+        >>> (loaded.span, loaded.stream_start, loaded.total_out)
+        (42, 2, 789)
+        >>> loaded.checkpoints
+        [<Checkpoint bit_offset=0 out_offset=0 window=0>, \
+<Checkpoint bit_offset=123 out_offset=456 window=3>]
+        """
+        if in_stream.read(len(INDEX_MAGIC)) != INDEX_MAGIC:
+            raise DeflateIndexError('Not a deflate index')
+        (version, span, stream_start, total_out, count) = read_struct(
+            in_stream, '>BQQQL')
+        if version != INDEX_VERSION:
+            raise DeflateIndexError(
+                'Unsupported deflate index version %d' % version)
+        index = cls(span, stream_start)
+        index.total_out = total_out
+        for dummy in range(count):
+            (bit_offset, out_offset, window_len) = read_struct(
+                in_stream, '>QQL')
+            window = zlib.decompress(in_stream.read(window_len))
+            index.add_checkpoint(bit_offset, out_offset, window)
+        return index
+
+def read_struct(in_stream, fmt):
+    size = struct.calcsize(fmt)
+    data = in_stream.read(size)
+    if len(data) != size:
+        raise DeflateIndexError('Truncated deflate index')
+    return struct.unpack(fmt, data)
+
+def build_index(binstr, span=None, stream_start=0):
+    """
+    Build checkpoint index by decoding the rest of binstr.
+
+    A checkpoint is added at the current position and then at the
+    first block boundary after every span bytes of output.
+    """
+    index = DeflateIndex(span or DEFAULT_SPAN, stream_start)
+    state = {}
+    def checkpoint(binstr, window):
+        if 'base' not in state:
+            state['base'] = len(window)
+        out_offset = len(window) - state['base']
+        if (not index.checkpoints or
+            out_offset - index.checkpoints[-1].out_offset >= index.span):
+            index.add_checkpoint(
+                binstr.offset, out_offset,
+                window.last_n(min(len(window), WINDOW_SIZE)))
+    total_out = 0
+    for data in binstr.decode_blocks(checkpoint=checkpoint):
+        total_out += len(data)
+    index.total_out = total_out
+    return index
+
+def main(sys):
+    """
+    Build deflate index of a zlib file or read from a zlib file.
+
+    Usage: deflate_index build ZFILE INDEXFILE [SPAN]
+           deflate_index read ZFILE INDEXFILE OFFSET LENGTH
+    """
+    from . import zlibstream
+    from .sixx import make_streams_binary
+    try:
+        cmd = sys.argv[1]
+        (zfile, indexfile) = sys.argv[2:4]
+        if cmd == 'build':
+            span = int(sys.argv[4]) if len(sys.argv) > 4 else None
+        elif cmd == 'read':
+            (offset, length) = (int(sys.argv[4]), int(sys.argv[5]))
+        else:
+            raise Exception('Unknown cmd')
+    except Exception:
+        print(main.__doc__.split('\n\n', 1)[1].rstrip())
+        sys.exit(1)
+    in_stream = open(zfile, 'rb')
+    if cmd == 'build':
+        zlibstream.build_index(in_stream, span).save(open(indexfile, 'wb'))
+    else:
+        index = DeflateIndex.load(open(indexfile, 'rb'))
+        make_streams_binary(sys)
+        sys.stdout.write(index.read_at(in_stream, offset, length))
+
+if __name__ == '__main__':
+    import sys
+    main(sys)
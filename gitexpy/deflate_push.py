@@ -0,0 +1,254 @@
+"""
+Push-mode deflate decoder.
+
+Unlike DeflateBitString, which pulls its input from a stream, the
+decoder in this module is driven by feeding it chunks of input as they
+arrive, e.g. from a non-blocking socket.  The decoding is done in small
+atomic steps (block header, one code length, one literal or match etc.)
+and if a step runs out of input, it is rolled back and retried when
+more input is fed.  Thus the decoder state survives any input boundary,
+even in the middle of a symbol or a block header.
+"""
+
+from .bitstring import EndOfStreamError
+from .deflate import (
+    DeflateError, WINDOW_SIZE, cclorder, get_ll_table, get_d_table)
+from .huffman import HuffmanCodeError, HuffmanTable
+
+STATE_HEADER = 'header'
+STATE_STORED_HEADER = 'stored_header'
+STATE_STORED_COPY = 'stored_copy'
+STATE_TABLE_HEADER = 'table_header'
+STATE_CODE_LENGTH_CODES = 'code_length_codes'
+STATE_CODE_LENGTHS = 'code_lengths'
+STATE_DATA = 'data'
+STATE_DONE = 'done'
+
+fixed_ll_lengths = (144 * [8]) + (112 * [9]) + (24 * [7]) + (8 * [8])
+fixed_d_lengths = 32 * [5]
+
+class NeedInput(Exception):
+    """Raised internally when a step cannot be completed."""
+
+def make_table(lengths):
+    try:
+        return HuffmanTable(lengths)
+    except HuffmanCodeError as e:
+        raise DeflateError(str(e))
+
+class PushDecoder(object):
+    """
+    Resumable deflate decoder.
+
+    Feed input with feed(), which returns list of decoded chunks.
+    After the input has ended, call finish() to check that the stream
+    was complete.  Data after the end of the deflate stream is stored
+    to unused_data.
+
+    >>> import zlib
+    >>> data = 30 * b'Hello Push! '
+    >>> compressed = zlib.compress(data)[2:-4]
+    >>> d = PushDecoder()
+    >>> result = b''
+    >>> for i in range(len(compressed)):
+    ...     result += b''.join(d.feed(compressed[i:i+1]))
+    >>> d.finish()
+    []
+    >>> result == data
+    True
+    """
+    def __init__(self):
+        self.data = bytearray()
+        self.bitpos = 0
+        self.consumed_bits = 0
+        self.window = bytearray()
+        self.state = STATE_HEADER
+        self.final = False
+        self.unused_data = b''
+        self.total_out = 0
+    @property
+    def eof(self):
+        return self.state == STATE_DONE
+    @property
+    def offset(self):
+        """Bit offset in the whole input."""
+        return self.consumed_bits + self.bitpos
+    def feed(self, chunk):
+        if self.eof:
+            self.unused_data += bytes(chunk)
+            return []
+        self.data += chunk
+        output = []
+        while not self.eof:
+            start = self.bitpos
+            try:
+                out = self.step()
+            except NeedInput:
+                self.bitpos = start
+                break
+            if out:
+                output.append(out)
+        if self.eof:
+            self.unused_data += bytes(self.data[(self.bitpos + 7) >> 3:])
+            self.data = bytearray()
+            self.bitpos = 0
+        else:
+            self.compact()
+        return self.join_output(output)
+    def finish(self):
+        if not self.eof:
+            raise EndOfStreamError('Unexpected end of stream')
+        return []
+    def compact(self):
+        used = self.bitpos >> 3
+        if used:
+            del self.data[:used]
+            self.consumed_bits += 8 * used
+            self.bitpos &= 7
+    def join_output(self, output):
+        if not output:
+            return []
+        out = b''.join(output)
+        self.total_out += len(out)
+        return [out]
+    def peek(self, n):
+        """Return next n bits and the number of available bits."""
+        avail = 8 * len(self.data) - self.bitpos
+        if avail < n:
+            n = avail
+        byte = self.bitpos >> 3
+        shift = self.bitpos & 7
+        val = 0
+        data = self.data
+        for k in range((shift + n + 7) >> 3):
+            val |= data[byte + k] << (8 * k)
+        return ((val >> shift) & ((1 << n) - 1), avail)
+    def take(self, n):
+        (val, avail) = self.peek(n)
+        if avail < n:
+            raise NeedInput()
+        self.bitpos += n
+        return val
+    def take_sym(self, table):
+        (val, avail) = self.peek(table.max_length)
+        entry = table.table[val]
+        if entry is None or entry[1] > avail:
+            if avail < table.max_length:
+                raise NeedInput()
+            raise DeflateError(
+                'Cannot decode symbol at offset %d' % self.offset)
+        self.bitpos += entry[1]
+        return entry[0]
+    def step(self):
+        return getattr(self, 'step_' + self.state)()
+    def step_header(self):
+        self.final = bool(self.take(1))
+        btype = self.take(2) + 1
+        if btype == 1:
+            self.state = STATE_STORED_HEADER
+        elif btype == 2:
+            self.use_tables(fixed_ll_lengths, fixed_d_lengths)
+        elif btype == 3:
+            self.state = STATE_TABLE_HEADER
+        else:
+            raise DeflateError(
+                'Invalid block type %s at offset %d' % (btype, self.offset))
+    def step_stored_header(self):
+        self.take((8 - self.bitpos) % 8)
+        block_len = self.take(16)
+        block_len_check = self.take(16)
+        if block_len + block_len_check != 2**16 - 1:
+            raise DeflateError(
+                'Uncompressed block length decode error at offset %d' %
+                self.offset)
+        self.stored_left = block_len
+        self.state = STATE_STORED_COPY
+    def step_stored_copy(self):
+        assert self.bitpos % 8 == 0
+        byte = self.bitpos >> 3
+        n = min(self.stored_left, len(self.data) - byte)
+        if n == 0 and self.stored_left:
+            raise NeedInput()
+        out = bytes(self.data[byte:byte+n])
+        self.bitpos += 8 * n
+        self.stored_left -= n
+        if not self.stored_left:
+            self.end_block()
+        return self.output(out)
+    def step_table_header(self):
+        self.hlit = self.take(5) + 257
+        self.hdist = self.take(5) + 1
+        self.hclen = self.take(4) + 4
+        self.state = STATE_CODE_LENGTH_CODES
+    def step_code_length_codes(self):
+        cl_lengths = 19 * [0]
+        for i in range(self.hclen):
+            cl_lengths[cclorder[i]] = self.take(3)
+        self.cl_table = make_table(cl_lengths)
+        self.ll_lengths = []
+        self.d_lengths = []
+        self.state = STATE_CODE_LENGTHS
+    def step_code_lengths(self):
+        if len(self.ll_lengths) < self.hlit:
+            (sq, num) = (self.ll_lengths, self.hlit)
+        else:
+            (sq, num) = (self.d_lengths, self.hdist)
+        sym = self.take_sym(self.cl_table)
+        if sym < 16:
+            reps = [sym]
+        elif sym == 16:
+            if not sq:
+                raise DeflateError(
+                    'Invalid sequence symbol %d at offset %d' %
+                    (sym, self.offset))
+            reps = (self.take(2) + 3) * [sq[-1]]
+        elif sym == 17:
+            reps = (self.take(3) + 3) * [0]
+        else:
+            reps = (self.take(7) + 11) * [0]
+        sq += reps
+        if len(sq) > num:
+            raise DeflateError('Invalid number of lit/dist codes')
+        if len(self.d_lengths) == self.hdist:
+            self.use_tables(self.ll_lengths, self.d_lengths)
+    def use_tables(self, ll_lengths, d_lengths):
+        self.ll_table = make_table(ll_lengths)
+        self.d_table = make_table(d_lengths)
+        self.state = STATE_DATA
+    def step_data(self):
+        sym = self.take_sym(self.ll_table)
+        if sym < 256:
+            return self.output(bytearray((sym,)))
+        if sym == 256:
+            self.end_block()
+            return None
+        if sym > 285:
+            raise DeflateError(
+                'Invalid length symbol %d at offset %d' % (sym, self.offset))
+        (extra_bits, first_len) = get_ll_table()[sym]
+        length = first_len + self.take(extra_bits)
+        d_sym = self.take_sym(self.d_table)
+        if d_sym > 29:
+            raise DeflateError(
+                'Invalid distance symbol %d at offset %d' %
+                (d_sym, self.offset))
+        (extra_bits, first_d) = get_d_table()[d_sym]
+        dist = first_d + self.take(extra_bits)
+        window = self.window
+        if dist > len(window):
+            raise DeflateError(
+                'Invalid distance %d at offset %d' % (dist, self.offset))
+        start = len(window) - dist
+        if dist >= length:
+            out = window[start:start+length]
+        else:
+            out = (window[start:] * (length // dist + 1))[:length]
+        return self.output(out)
+    def end_block(self):
+        self.state = STATE_DONE if self.final else STATE_HEADER
+    def output(self, out):
+        window = self.window
+        window += out
+        if len(window) >= 2 * WINDOW_SIZE:
+            del window[:-WINDOW_SIZE]
+        return bytes(out)
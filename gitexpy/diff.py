@@ -1,8 +1,13 @@
+import bisect
 import gc
+import math
+import os
 import random
+import subprocess
 import sys
 import time
-from collections import defaultdict
+from collections import Counter, defaultdict
+import six
 from six.moves import reduce, xrange
 from . import randomstring
 from .randomstring import randomstringpair
@@ -240,6 +245,82 @@ def edit_distance(a, b):
                 return d
     raise Exception('Length of LCS(a,b) > %d' % max_d)
 
+DEFAULT_QGRAM_SIZE = 2
+
+def edit_distance_within(a, b, k):
+    """
+    Calculate edit distance of a and b, if it is at most k.
+
+    Same as edit_distance, but gives up and returns None as soon as
+    the distance is known to be more than k.  Runs in O(k * min(n, m))
+    time, where n and m are the lengths of a and b.
+
+    >>> edit_distance_within('edit_distance', 'editing_dist', 7)
+    7
+    >>> edit_distance_within('edit_distance', 'editing_dist', 6) is None
+    True
+    """
+    (n, m) = (len(a), len(b))
+    if abs(n - m) > k:
+        return None
+    t = common_prefix_length(a, 0, n, b, 0, m)
+    u = common_suffix_length(a, t, n, b, t, m)
+    if t or u:
+        (a, b) = (a[t:n-u], b[t:m-u])
+        (n, m) = (n - t - u, m - t - u)
+    v = {1: 0}
+    for d in xrange(k + 1):
+        for diagonal in xrange(-d, d+1, 2):
+            if diagonal == -d or (
+                    diagonal != d and v[diagonal-1] < v[diagonal+1]):
+                x = v[diagonal+1]
+            else:
+                x = v[diagonal-1] + 1
+            y = x - diagonal
+            while x < n and y < m and a[x] == b[y]:
+                (x, y) = (x + 1, y + 1)
+            v[diagonal] = x
+            if x >= n and y >= m:
+                return d
+    return None
+
+def qgram_counts(s, q=DEFAULT_QGRAM_SIZE):
+    """
+    Count the substrings of length q in s.
+
+    >>> sorted(qgram_counts('abab').items())
+    [('ab', 2), ('ba', 1)]
+    """
+    return Counter(s[i:i+q] for i in xrange(len(s) - q + 1))
+
+def candidates_within(query, candidates, k, q=DEFAULT_QGRAM_SIZE):
+    """
+    Find candidates whose edit distance to query is at most k.
+
+    Yields (index, distance) pairs.  Before calculating the distance
+    with edit_distance_within, candidates whose length differs by more
+    than k are skipped and so are candidates which have too few common
+    q-grams with query: every inserted or deleted element breaks at
+    most q q-grams, so strings within distance k have at least
+    max(n, m) - q + 1 - q * k common q-grams.
+
+    >>> words = ['distance', 'instance', 'dis', 'stance', 'dance', 'xyz']
+    >>> list(candidates_within('distance', words, 2))
+    [(0, 0), (1, 2), (3, 2)]
+    """
+    query_qgrams = qgram_counts(query, q)
+    for (index, candidate) in enumerate(candidates):
+        if abs(len(candidate) - len(query)) > k:
+            continue
+        required = max(len(query), len(candidate)) - q + 1 - q * k
+        if required > 0:
+            common = qgram_counts(candidate, q) & query_qgrams
+            if sum(common.values()) < required:
+                continue
+        distance = edit_distance_within(query, candidate, k)
+        if distance is not None:
+            yield (index, distance)
+
 def lcs_m1(a, b):
     """
     Calculate LCS of a and b, with Myers algorithm in O(d^2) space.
@@ -470,12 +551,708 @@ def middle_snake(a, b):
                 if x <= v[k+delta]:
                     return (x, y, x0, y0)
 
-lcs_best = lcs_d2
+MAX_COST_MIN = 256
+
+def default_max_cost(n, m):
+    """
+    Get the search cost limit used by LibXDiff for sequences of size n and m.
+
+    >>> default_max_cost(10, 20)
+    256
+    >>> default_max_cost(1000000, 1000000)
+    1414
+    """
+    return max(int(math.sqrt(n + m + 3)), MAX_COST_MIN)
+
+class DiffStats(object):
+    """
+    Statistics of diffs calculated with a capped search cost.
+
+    The heuristic_* counters tell how often the search was cut and
+    the excess_edits counters how much longer than the minimal the
+    resulting edit scripts were (if measured, see max_cost_stats).
+    """
+    def __init__(self):
+        self.pairs = 0
+        self.splits = 0
+        self.heuristic_pairs = 0
+        self.heuristic_splits = 0
+        self.excess_edits = 0
+        self.max_excess_edits = 0
+    def add_excess(self, excess):
+        self.excess_edits += excess
+        self.max_excess_edits = max(self.max_excess_edits, excess)
+    def __repr__(self):
+        return '<%s %s>' % (self.__class__.__name__, ' '.join(
+            '%s=%d' % (name, getattr(self, name)) for name in (
+                'pairs', 'splits', 'heuristic_pairs', 'heuristic_splits',
+                'excess_edits', 'max_excess_edits')))
+
+def lcs_xa(a, b, max_cost=None, stats=None):
+    """
+    Calculate LCS of a and b, with LibXDiff technique without slicing.
+
+    Gives the same result as lcs_x, but works on index ranges of the
+    original sequences with an explicit stack instead of slicing and
+    recursion, keeps the V vectors in preallocated lists and trims
+    common prefixes and suffixes by comparing slices of growing size.
+
+    If max_cost is given, the search for a middle snake is stopped
+    after max_cost steps and the sequences are split at the furthest
+    reaching point found so far instead, like LibXDiff does.  Then
+    the result is a common subsequence, but not necessarily the
+    longest.  The splits are counted to DiffStats stats, if given.
+
+    Returns same as lcs_r.
+
+    >>> lcs_xa('dbcbcbcac', 'adcadcac')
+    ((0, 1), (2, 2), (6, 5), (7, 6), (8, 7))
+    >>> stats = DiffStats()
+    >>> lcs_xa('phef', 'eb', max_cost=1, stats=stats)
+    ()
+    >>> lcs_xa('phef', 'eb')
+    ((2, 0),)
+    >>> (stats.splits, stats.heuristic_splits)
+    (2, 2)
+    """
+    # V vectors are indexed with diagonal k, which is in range
+    # [-(m+d+1), n+d+1] for the forward and reverse d-paths, where d
+    # is at most (n+m+1)//2
+    offset = len(a) + len(b) + (len(a) + len(b) + 1) // 2 + 2
+    v = [0] * (2 * offset + 1)
+    u = [0] * (2 * offset + 1)
+    if max_cost is not None:
+        max_cost = max(max_cost, 1)
+    result = []
+    heuristic_splits = 0
+    stack = [(0, 0, len(a), len(b))]
+    while stack:
+        (apos, bpos, amax, bmax) = stack.pop()
+        t = common_prefix_length(a, apos, amax, b, bpos, bmax)
+        result.extend((apos + i, bpos + i) for i in xrange(t))
+        (apos, bpos) = (apos + t, bpos + t)
+        t = common_suffix_length(a, apos, amax, b, bpos, bmax)
+        result.extend((amax - t + i, bmax - t + i) for i in xrange(t))
+        (amax, bmax) = (amax - t, bmax - t)
+        if apos < amax and bpos < bmax:
+            snake = middle_snake_a(
+                a, b, apos, bpos, amax, bmax, v, u, offset, max_cost)
+            if snake is None:
+                snake = furthest_split_a(
+                    a, b, apos, bpos, amax, bmax, v, u, offset, max_cost)
+                heuristic_splits += 1
+            (x, y, x2, y2) = snake
+            result.extend((i, y + i - x) for i in xrange(x, x2))
+            stack.append((x2, y2, amax, bmax))
+            stack.append((apos, bpos, x, y))
+            if stats is not None:
+                stats.splits += 1
+    if stats is not None:
+        stats.pairs += 1
+        stats.heuristic_splits += heuristic_splits
+        stats.heuristic_pairs += 1 if heuristic_splits else 0
+    result.sort()
+    return tuple(result)
+
+def common_prefix_length(a, apos, amax, b, bpos, bmax):
+    """
+    Length of the common prefix of a[apos:amax] and b[bpos:bmax].
+
+    Compares slices of doubling size and then halves the size to
+    find the exact end, so the number of compared elements is linear
+    in the length of the prefix.
+
+    >>> common_prefix_length('xabcdef', 1, 7, 'abcxef', 0, 6)
+    3
+    """
+    limit = min(amax - apos, bmax - bpos)
+    n = 0
+    step = 1
+    while step:
+        if n + step <= limit and (
+                a[apos + n:apos + n + step] == b[bpos + n:bpos + n + step]):
+            n += step
+            step *= 2
+        else:
+            step //= 2
+    return n
+
+def common_suffix_length(a, apos, amax, b, bpos, bmax):
+    """
+    Length of the common suffix of a[apos:amax] and b[bpos:bmax].
+
+    >>> common_suffix_length('abcdef', 0, 5, 'xcde', 0, 4)
+    3
+    """
+    limit = min(amax - apos, bmax - bpos)
+    n = 0
+    step = 1
+    while step:
+        if n + step <= limit and (
+                a[amax - n - step:amax - n] == b[bmax - n - step:bmax - n]):
+            n += step
+            step *= 2
+        else:
+            step //= 2
+    return n
+
+def middle_snake_a(a, b, apos, bpos, amax, bmax, v, u, offset,
+                   max_cost=None):
+    """
+    Find middle snake of a[apos:amax] and b[bpos:bmax].
+
+    Same as middle_snake, but the V vectors v and u are lists indexed
+    with k + offset, and they and the returned coordinates hold
+    positions in a and b instead of positions in the slices.
+
+    Returns None if the snake is not found within max_cost steps.
+    """
+    delta = (amax - apos) - (bmax - bpos)
+    odd = delta % 2 == 1
+    shift = apos - bpos # y = x - k - shift in diagonal k
+    v[offset + 1] = apos
+    u[offset + delta + 1] = amax + 1
+    for d in xrange((amax - apos + bmax - bpos + 1)//2 + 1):
+        for i in xrange(offset - d, offset + d + 1, 2):
+            # find the end of furthest reaching forward d-path in
+            # diagonal k = i - offset
+            if i == offset - d or (i != offset + d and v[i-1] < v[i+1]):
+                x = v[i+1]
+            else:
+                x = v[i-1] + 1
+            y = x - (i - offset) - shift
+            (x0, y0) = (x, y)
+            while x < amax and y < bmax and a[x] == b[y]:
+                (x, y) = (x + 1, y + 1)
+            v[i] = x
+            if odd and delta - (d-1) <= i - offset <= delta + (d-1):
+                if x >= u[i]:
+                    return (x0, y0, x, y)
+        for i in xrange(offset + delta - d, offset + delta + d + 1, 2):
+            # find the end of furthest reaching reverse d-path in
+            # diagonal k + delta = i - offset
+            if i == offset + delta - d or (
+                    i != offset + delta + d and u[i-1] > u[i+1] - 1):
+                x = u[i+1] - 1
+            else:
+                x = u[i-1]
+            y = x - (i - offset) - shift
+            (x0, y0) = (x, y)
+            while x > apos and y > bpos and a[x-1] == b[y-1]:
+                (x, y) = (x - 1, y - 1)
+            u[i] = x
+            if not odd and -d <= i - offset <= d:
+                if x <= v[i]:
+                    return (x, y, x0, y0)
+        if max_cost is not None and d >= max_cost:
+            return None
+
+def furthest_split_a(a, b, apos, bpos, amax, bmax, v, u, offset, d):
+    """
+    Find a split point from V vectors of a cut middle snake search.
+
+    Picks the furthest reaching point of the forward and reverse
+    d-paths left in v and u by middle_snake_a.  Returns it as an empty
+    snake, which is never at either end of the ranges.
+    """
+    delta = (amax - apos) - (bmax - bpos)
+    shift = apos - bpos
+    best = None
+    best_progress = 0
+    for i in xrange(offset - d, offset + d + 1, 2):
+        x = v[i]
+        y = x - (i - offset) - shift
+        progress = (x - apos) + (y - bpos)
+        if (apos <= x <= amax and bpos <= y <= bmax and
+                progress > best_progress and (x, y) != (amax, bmax)):
+            (best, best_progress) = ((x, y), progress)
+    for i in xrange(offset + delta - d, offset + delta + d + 1, 2):
+        x = u[i]
+        y = x - (i - offset) - shift
+        progress = (amax - x) + (bmax - y)
+        if (apos <= x <= amax and bpos <= y <= bmax and
+                progress > best_progress and (x, y) != (apos, bpos)):
+            (best, best_progress) = ((x, y), progress)
+    (x, y) = best
+    return (x, y, x, y)
+
+def match_masks(b):
+    """
+    Get bit masks of the positions of each symbol in b.
+
+    >>> sorted(match_masks('abba').items())
+    [('a', 9), ('b', 6)]
+    """
+    masks = defaultdict(int)
+    for (j, symbol) in enumerate(b):
+        masks[symbol] |= 1 << j
+    return masks
+
+def popcount(x):
+    return bin(x).count('1')
+
+def lcs_rows_bitparallel(a, b):
+    """
+    Iterate bit-parallel LCS rows of a and b.
+
+    Uses the Allison-Dix technique with Python ints as bit vectors of
+    len(b) bits.  Yields the bit vector V_i for each i in 0..len(a).
+    Bit j of V_i is zero if and only if L[i][j+1] = L[i][j] + 1, where
+    L[i][j] is the length of LCS(a[:i], b[:j]).
+    """
+    masks = match_masks(b)
+    full = (1 << len(b)) - 1
+    v = full
+    yield v
+    for symbol in a:
+        u = v & masks.get(symbol, 0)
+        v = ((v + u) | (v - u)) & full
+        yield v
+
+def lcs_len_bitparallel(a, b):
+    """
+    Calculate length of LCS of a and b with bit-parallel technique.
+
+    Uses O(len(a) * len(b) / w) word operations, where w is the word
+    size.
+
+    >>> lcs_len_bitparallel('foobar', 'moocowbat')
+    4
+    >>> lcs_len_bitparallel('', 'abc')
+    0
+    """
+    for v in lcs_rows_bitparallel(a, b):
+        pass
+    return len(b) - popcount(v)
+
+def edit_distance_bitparallel(a, b):
+    """
+    Calculate edit distance of a and b with bit-parallel technique.
+
+    Same as edit_distance, i.e. counts insertions and deletions.
+
+    >>> edit_distance_bitparallel('aaa', 'bb')
+    5
+    >>> edit_distance_bitparallel('edit_distance', 'editing_dist')
+    7
+    """
+    return len(a) + len(b) - 2 * lcs_len_bitparallel(a, b)
+
+def levenshtein_bitparallel(a, b):
+    """
+    Calculate Levenshtein distance of a and b with bit-parallel technique.
+
+    Unlike edit_distance, counts also substitutions as single edits.
+    Uses the technique of Myers as formulated by Hyyro.
+
+    >>> levenshtein_bitparallel('kitten', 'sitting')
+    3
+    >>> levenshtein_bitparallel('aaa', 'bb')
+    3
+    >>> levenshtein_bitparallel('', 'abc')
+    3
+    """
+    m = len(b)
+    if not m:
+        return len(a)
+    masks = match_masks(b)
+    full = (1 << m) - 1
+    top = 1 << (m - 1)
+    pv = full # positive vertical deltas
+    mv = 0 # negative vertical deltas
+    score = m
+    for symbol in a:
+        eq = masks.get(symbol, 0)
+        xv = eq | mv
+        xh = (((eq & pv) + pv) ^ pv) | eq
+        ph = (mv | ~(xh | pv)) & full
+        mh = pv & xh
+        if ph & top:
+            score += 1
+        elif mh & top:
+            score -= 1
+        ph = ((ph << 1) | 1) & full
+        mh = (mh << 1) & full
+        pv = (mh | ~(xv | ph)) & full
+        mv = ph & xv
+    return score
+
+def lcs_bp(a, b):
+    """
+    Calculate LCS of a and b, with bit-parallel technique and traceback.
+
+    Stores the bit-parallel rows, i.e. uses O(len(a) * len(b) / w)
+    words of memory, and traces the LCS back from them.  Gives the
+    same result as lcs_d2.
+
+    Returns same as lcs_r.
+
+    >>> lcs_bp('dbcbcbcac', 'adcadcac') == lcs_d2('dbcbcbcac', 'adcadcac')
+    True
+    >>> lcs_bp('foobar', 'moocowbat')
+    ((1, 2), (2, 4), (3, 6), (4, 7))
+    """
+    rows = list(lcs_rows_bitparallel(a, b))
+    result = []
+    (i, j) = (len(a), len(b))
+    # Same traceback as in lcs_d2, where L[i][j] is the number of zero
+    # bits in the lowest j bits of rows[i]
+    while i > 0 and j > 0:
+        if a[i-1] == b[j-1]:
+            (i, j) = (i - 1, j - 1)
+            result.append((i, j))
+        elif (j - popcount(rows[i-1] & ((1 << j) - 1)) >=
+              j - 1 - popcount(rows[i] & ((1 << (j - 1)) - 1))):
+            i -= 1
+        else:
+            j -= 1
+    result.reverse()
+    return tuple(result)
+
+MAX_CHAIN_LENGTH = 64
+
+def lcs_patience(a, b):
+    """
+    Calculate common subsequence of a and b, with patience diff.
+
+    Elements which occur exactly once in both a and b are used as
+    anchors.  The longest increasing sequence of them is matched and
+    the ranges between are handled recursively.  Ranges without
+    unique elements are matched with lcs_xa.  The result is not
+    necessarily the longest common subsequence, but usually aligns
+    better, e.g. on lines of source code.
+
+    Returns same as lcs_r.
+
+    >>> lcs_patience('dbcbcbcac', 'adcadcac')
+    ((0, 1), (2, 2), (6, 5), (7, 6), (8, 7))
+    >>> lcs_patience('abxyc', 'xyabc')
+    ((2, 0), (3, 1), (4, 4))
+    """
+    return split_on_anchors(a, b, patience_anchors)
+
+def lcs_histogram(a, b):
+    """
+    Calculate common subsequence of a and b, with histogram diff.
+
+    Works like the histogram diff of Git: The common region whose
+    elements occur least often in a is matched and the ranges before
+    and after it are handled recursively.  Like in Git, elements
+    occurring more than MAX_CHAIN_LENGTH + 1 times are not used for
+    matching; if there is no region to match, the range is matched
+    with lcs_xa.
+
+    Returns same as lcs_r.
+
+    >>> lcs_histogram('dbcbcbcac', 'adcadcac')
+    ((0, 1), (2, 2), (6, 5), (7, 6), (8, 7))
+    >>> lcs_histogram('abxyc', 'xyabc')
+    ((2, 0), (3, 1), (4, 4))
+    """
+    return split_on_anchors(a, b, histogram_anchors)
+
+def split_on_anchors(a, b, find_anchors):
+    """
+    Calculate common subsequence of a and b by matching anchors.
+
+    find_anchors(a, b, apos, bpos, amax, bmax) should return list of
+    increasing matching pairs (i, j) within the given ranges.  The
+    ranges between the anchors are split recursively with an explicit
+    stack.
+    """
+    result = []
+    stack = [(0, 0, len(a), len(b))]
+    while stack:
+        (apos, bpos, amax, bmax) = stack.pop()
+        t = common_prefix_length(a, apos, amax, b, bpos, bmax)
+        result.extend((apos + i, bpos + i) for i in xrange(t))
+        (apos, bpos) = (apos + t, bpos + t)
+        t = common_suffix_length(a, apos, amax, b, bpos, bmax)
+        result.extend((amax - t + i, bmax - t + i) for i in xrange(t))
+        (amax, bmax) = (amax - t, bmax - t)
+        if apos >= amax or bpos >= bmax:
+            continue
+        anchors = find_anchors(a, b, apos, bpos, amax, bmax)
+        if not anchors:
+            result.extend((apos + i, bpos + j) for (i, j) in lcs_xa(
+                a[apos:amax], b[bpos:bmax]))
+            continue
+        result.extend(anchors)
+        for (i, j) in anchors:
+            stack.append((apos, bpos, i, j))
+            (apos, bpos) = (i + 1, j + 1)
+        stack.append((apos, bpos, amax, bmax))
+    result.sort()
+    return tuple(result)
+
+def patience_anchors(a, b, apos, bpos, amax, bmax):
+    """
+    Find longest increasing sequence of pairs of unique elements.
+
+    >>> patience_anchors('axbycz', 'zcybxa', 0, 0, 6, 6)
+    [(5, 0)]
+    >>> patience_anchors('abcab', 'bca', 0, 0, 5, 3)
+    [(2, 1)]
+    """
+    a_unique = {}
+    for i in xrange(apos, amax):
+        a_unique[a[i]] = i if a[i] not in a_unique else None
+    b_unique = {}
+    for j in xrange(bpos, bmax):
+        if a_unique.get(b[j]) is not None:
+            b_unique[b[j]] = j if b[j] not in b_unique else None
+    pairs = sorted(
+        (a_unique[x], j) for (x, j) in b_unique.items() if j is not None)
+    # Patience sorting: tops[k] is the smallest j ending an increasing
+    # sequence of length k+1, and links point to the previous pair
+    tops = []
+    top_indices = []
+    links = []
+    for (n, (i, j)) in enumerate(pairs):
+        k = bisect.bisect_left(tops, j)
+        if k == len(tops):
+            tops.append(j)
+            top_indices.append(n)
+        else:
+            tops[k] = j
+            top_indices[k] = n
+        links.append(top_indices[k-1] if k else None)
+    anchors = []
+    n = top_indices[-1] if top_indices else None
+    while n is not None:
+        anchors.append(pairs[n])
+        n = links[n]
+    anchors.reverse()
+    return anchors
+
+def histogram_anchors(a, b, apos, bpos, amax, bmax):
+    """
+    Find the common region with least occurring elements.
+
+    Returns the matching pairs of the region.
+
+    >>> histogram_anchors('aaxbyaa', 'xaaby', 0, 0, 7, 5)
+    [(3, 3), (4, 4)]
+    """
+    positions = defaultdict(list)
+    for i in xrange(apos, amax):
+        positions[a[i]].append(i)
+    best = None
+    best_count = MAX_CHAIN_LENGTH + 1
+    j = bpos
+    while j < bmax:
+        next_j = j + 1
+        occurrences = positions.get(b[j], ())
+        if len(occurrences) <= best_count:
+            for i in occurrences:
+                (s, t) = (i, j)
+                while s > apos and t > bpos and a[s-1] == b[t-1]:
+                    (s, t) = (s - 1, t - 1)
+                (e, f) = (i + 1, j + 1)
+                while e < amax and f < bmax and a[e] == b[f]:
+                    (e, f) = (e + 1, f + 1)
+                next_j = max(next_j, f)
+                count = min(len(positions[a[k]]) for k in xrange(s, e))
+                if best is None or count < best_count or (
+                        e - s > best[1] - best[0]):
+                    (best, best_count) = ((s, e, t), count)
+        j = next_j
+    if best is None:
+        return []
+    (s, e, t) = best
+    return [(s + k, t + k) for k in xrange(e - s)]
+
+class CostModel(object):
+    """
+    Estimated running times of LCS algorithms in seconds.
+
+    Myers technique (lcs_xa) takes myers_unit * (n + m) * (d + 1), the
+    bit-parallel lcs_bp bitparallel_unit * (n + m) * (m // 64 + 1) and
+    the NumPy engine lcs_numpy dp_unit * n * m + dp_diagonal_unit *
+    (n + m), where d is the edit distance.  Since lcs_bp stores n * m
+    bits, it is used only if they fit in max_bitparallel_bytes.
+
+    The default units are from calibrate_cost_model on CPython 3.
+    """
+    def __init__(self, myers_unit=5e-8, bitparallel_unit=1e-7,
+                 dp_unit=2e-8, dp_diagonal_unit=3e-5,
+                 max_bitparallel_bytes=2**27):
+        self.myers_unit = myers_unit
+        self.bitparallel_unit = bitparallel_unit
+        self.dp_unit = dp_unit
+        self.dp_diagonal_unit = dp_diagonal_unit
+        self.max_bitparallel_bytes = max_bitparallel_bytes
+    def myers(self, n, m, d):
+        return self.myers_unit * (n + m) * (d + 1)
+    def bitparallel(self, n, m):
+        return self.bitparallel_unit * (n + m) * (m // 64 + 1)
+    def dp(self, n, m):
+        return self.dp_unit * n * m + self.dp_diagonal_unit * (n + m)
+    def __repr__(self):
+        return '%s(%r, %r, %r, %r, %r)' % (
+            self.__class__.__name__, self.myers_unit, self.bitparallel_unit,
+            self.dp_unit, self.dp_diagonal_unit, self.max_bitparallel_bytes)
+
+default_cost_model = CostModel()
+
+class AlgorithmChoice(object):
+    """
+    LCS algorithm chosen for a pair and the estimates it is based on.
+
+    The sizes n and m are without the common prefix and suffix.  The
+    edit distance d is None if it is more than probe_limit, i.e. too
+    large for Myers technique to be the fastest.
+    """
+    def __init__(self, algorithm, n, m, prefix, suffix, d, probe_limit,
+                 costs):
+        self.algorithm = algorithm
+        self.n = n
+        self.m = m
+        self.prefix = prefix
+        self.suffix = suffix
+        self.d = d
+        self.probe_limit = probe_limit
+        self.costs = costs
+    def __repr__(self):
+        return '<%s %s n=%d m=%d d=%s limit=%d costs=%s>' % (
+            self.__class__.__name__, self.algorithm.__name__,
+            self.n, self.m, self.d, self.probe_limit, ','.join(
+                '%s:%.3g' % item for item in sorted(self.costs.items())))
+
+def choose_lcs_algorithm(a, b, model=None):
+    """
+    Choose the fastest LCS algorithm for a and b.
+
+    After trimming the common prefix and suffix, the cost of the
+    algorithm usable for any d (lcs_bp, or lcs_numpy if lcs_bp would
+    need too much memory) is estimated.  Then edit distance is probed
+    with edit_distance_within up to the largest d for which Myers
+    technique would be cheaper, so the probe takes at most about as
+    long as the chosen algorithm.
+
+    >>> a = 'abcd' * 100
+    >>> choice = choose_lcs_algorithm(a, a[:10] + 'x' + a[10:390] + a[391:])
+    >>> (choice.algorithm.__name__, choice.n, choice.m, choice.d)
+    ('lcs_xa', 381, 381, 2)
+    >>> choose_lcs_algorithm('foobar', 'moocowbat').algorithm.__name__
+    'lcs_bp'
+    """
+    if model is None:
+        model = default_cost_model
+    (n, m) = (len(a), len(b))
+    prefix = common_prefix_length(a, 0, n, b, 0, m)
+    suffix = common_suffix_length(a, prefix, n, b, prefix, m)
+    (n, m) = (n - prefix - suffix, m - prefix - suffix)
+    if not n or not m:
+        return AlgorithmChoice(lcs_xa, n, m, prefix, suffix, n + m, 0, {})
+    if n * m <= 8 * model.max_bitparallel_bytes:
+        (fallback, fallback_cost) = (lcs_bp, model.bitparallel(n, m))
+    else:
+        from .diff_numpy import lcs_numpy, numpy
+        if numpy is None:
+            return AlgorithmChoice(lcs_xa, n, m, prefix, suffix, None, 0, {})
+        (fallback, fallback_cost) = (lcs_numpy, model.dp(n, m))
+    costs = {fallback.__name__: fallback_cost}
+    limit = int(fallback_cost / model.myers(n, m, 0)) - 1
+    d = None
+    if limit >= 0:
+        d = edit_distance_within(
+            a[prefix:len(a)-suffix], b[prefix:len(b)-suffix], limit)
+    if d is None:
+        return AlgorithmChoice(
+            fallback, n, m, prefix, suffix, d, limit, costs)
+    costs[lcs_xa.__name__] = model.myers(n, m, d)
+    return AlgorithmChoice(lcs_xa, n, m, prefix, suffix, d, limit, costs)
+
+def lcs_adaptive(a, b, model=None, choice=None):
+    """
+    Calculate LCS of a and b, with algorithm chosen by estimated cost.
+
+    See choose_lcs_algorithm.  The chosen algorithm is run on a and b
+    without their common prefix and suffix.
+
+    Returns same as lcs_r.
+
+    >>> lcs_adaptive('dbcbcbcac', 'adcadcac')
+    ((0, 1), (2, 2), (6, 5), (7, 6), (8, 7))
+    """
+    if choice is None:
+        choice = choose_lcs_algorithm(a, b, model)
+    (p, s) = (choice.prefix, choice.suffix)
+    (n, m) = (len(a), len(b))
+    result = [(i, i) for i in xrange(p)]
+    result.extend((i + p, j + p) for (i, j) in choice.algorithm(
+        a[p:n-s], b[p:m-s]))
+    result.extend((n - s + k, m - s + k) for k in xrange(s))
+    return tuple(result)
+
+def calibrate_cost_model(pairs=None, max_bitparallel_bytes=2**27):
+    """
+    Measure the units of CostModel.
+
+    Times the algorithms on the given pairs (or random pairs of
+    strings) and returns CostModel with the median units.  The units of
+    the NumPy engine are fitted with least squares.
+    """
+    from .diff_numpy import lcs_numpy, numpy
+    if pairs is None:
+        randomstring.seed(45)
+        pairs = [randomstringpair(minlen=size, maxlen=size,
+                                  maxeditdistance=random.randint(1, size))
+                 for size in (300, 1000, 3000) for dummy in xrange(3)]
+    units = defaultdict(list)
+    dp_samples = []
+    for (a, b) in pairs:
+        (n, m) = (len(a), len(b))
+        d = n + m - 2 * lcs_len_bitparallel(a, b)
+        for (name, lcs) in [('myers', lcs_xa), ('bitparallel', lcs_bp),
+                            ('dp', lcs_numpy)]:
+            if name == 'dp' and numpy is None:
+                continue
+            gc.collect()
+            t = time.time()
+            lcs(a, b)
+            t = time.time() - t
+            if name == 'dp':
+                dp_samples.append((n * m, n + m, t))
+            else:
+                unit_model = CostModel(1.0, 1.0)
+                units[name].append(t / getattr(unit_model, name)(
+                    *((n, m, d) if name == 'myers' else (n, m))))
+    model = CostModel(mid(units['myers']), mid(units['bitparallel']),
+                      max_bitparallel_bytes=max_bitparallel_bytes)
+    if len(dp_samples) >= 2:
+        # Solve the normal equations of t = dp_unit * x + diagonal_unit * y
+        sxx = sum(x * x for (x, y, t) in dp_samples)
+        sxy = sum(x * y for (x, y, t) in dp_samples)
+        syy = sum(y * y for (x, y, t) in dp_samples)
+        sxt = sum(x * t for (x, y, t) in dp_samples)
+        syt = sum(y * t for (x, y, t) in dp_samples)
+        det = float(sxx * syy - sxy * sxy)
+        if det:
+            model.dp_unit = max((sxt * syy - syt * sxy) / det, 0.0)
+            model.dp_diagonal_unit = max((syt * sxx - sxt * sxy) / det, 0.0)
+    return model
+
+lcs_best = lcs_adaptive
+
+OP_COPY = 0
+OP_DELETE = 1
+OP_INSERT = 2
+
+SCRIPT_BYTES = 0
+SCRIPT_TEXT = 1
+SCRIPT_LINES = 2
 
 class EditScript(object):
     """
     EditScript of two strings.
 
+    The script is stored as a list of run-length operations: (OP_COPY,
+    n) copies next n elements of the source, (OP_DELETE, n) skips next
+    n elements of the source and (OP_INSERT, s) inserts s.  Elements
+    left after the last operation are copied.
+
     Usage example:
 
     >>> es = EditScript.from_strings('foobar', 'moocowbat')
@@ -487,31 +1264,252 @@ class EditScript(object):
     7
     >>> es.apply('foobar')
     'moocowbat'
+    >>> es.ops[:4]
+    [(2, 'mo'), (1, 1), (0, 1), (2, 'c')]
+    >>> EditScript.from_bytes(es.to_bytes()).apply('foobar')
+    'moocowbat'
     """
-    def __init__(self, delset, insset):
-        self.delset = set(delset)
-        self.insmap = defaultdict(str)
-        self.insmap.update(insset)
+    def __init__(self, delset=(), insset=(), ops=None):
+        if ops is None:
+            ops = delset_insmap_to_ops(set(delset), dict(insset))
+        self.ops = ops
     @classmethod
-    def from_strings(cls, from_string, to_string):
-        lcs = lcs_best(from_string, to_string)
-        (delset, insset) = lcs_to_editscript(from_string, to_string, lcs)
-        return cls(delset, insset)
+    def from_strings(cls, from_string, to_string, lcs_algorithm=lcs_best):
+        lcs = lcs_algorithm(from_string, to_string)
+        return cls.from_lcs(from_string, to_string, lcs)
+    @classmethod
+    def from_lcs(cls, from_string, to_string, lcs):
+        ops = []
+        (i, j) = (0, 0)
+        for (x, y) in lcs + ((len(from_string), len(to_string)),):
+            if y > j:
+                add_op(ops, OP_INSERT, to_string[j:y])
+            if x > i:
+                add_op(ops, OP_DELETE, x - i)
+            if x < len(from_string):
+                add_op(ops, OP_COPY, 1)
+            (i, j) = (x + 1, y + 1)
+        if ops and ops[-1][0] == OP_COPY:
+            ops.pop()
+        return cls(ops=ops)
+    @classmethod
+    def from_blocks(cls, from_seq, to_seq, blocks):
+        """
+        Make script from matching blocks (i, j, n) ending with a
+        (len(from_seq), len(to_seq), 0) block.
+
+        >>> EditScript.from_blocks('abcd', 'xbcy', [(1, 1, 2), (4, 4, 0)]).ops
+        [(2, 'x'), (1, 1), (0, 2), (2, 'y'), (1, 1)]
+        """
+        ops = []
+        (i, j) = (0, 0)
+        for (x, y, n) in blocks:
+            if y > j:
+                add_op(ops, OP_INSERT, to_seq[j:y])
+            if x > i:
+                add_op(ops, OP_DELETE, x - i)
+            if n:
+                add_op(ops, OP_COPY, n)
+            (i, j) = (x + n, y + n)
+        if ops and ops[-1][0] == OP_COPY:
+            ops.pop()
+        return cls(ops=ops)
+    def matching_blocks(self, from_length):
+        """
+        Get the matching blocks (i, j, n) of a source of from_length.
+
+        The last block is (from_length, length of the result, 0).
+
+        >>> es = EditScript.from_strings('abcd', 'xbcy')
+        >>> es.matching_blocks(4)
+        [(1, 1, 2), (4, 4, 0)]
+        """
+        blocks = []
+        (i, j) = (0, 0)
+        for (op, value) in self.ops:
+            if op == OP_COPY:
+                blocks.append((i, j, value))
+                (i, j) = (i + value, j + value)
+            elif op == OP_DELETE:
+                i += value
+            else:
+                j += len(value)
+        if i < from_length:
+            blocks.append((i, j, from_length - i))
+            j += from_length - i
+        blocks.append((from_length, j, 0))
+        return blocks
+    @property
+    def delset(self):
+        result = set()
+        pos = 0
+        for (op, value) in self.ops:
+            if op == OP_DELETE:
+                result.update(xrange(pos, pos + value))
+            if op != OP_INSERT:
+                pos += value
+        return result
+    @property
+    def insmap(self):
+        result = defaultdict(str)
+        pos = 0
+        for (op, value) in self.ops:
+            if op == OP_INSERT:
+                result[pos - 1] += value
+            else:
+                pos += value
+        return result
     def size(self):
-        return len(self.delset) + sum(len(s) for s in self.insmap.values())
+        return sum(value if op == OP_DELETE else len(value)
+                   for (op, value) in self.ops if op != OP_COPY)
     def apply(self, to):
-        a = to
-        b = self.insmap[-1]
-        for i in xrange(len(a)):
-            if i not in self.delset:
-                b += a[i]
-            b += self.insmap[i]
-        return b
+        parts = []
+        pos = 0
+        for (op, value) in self.ops:
+            if op == OP_COPY:
+                parts.append(to[pos:pos + value])
+                pos += value
+            elif op == OP_DELETE:
+                pos += value
+            else:
+                parts.append(value)
+        parts.append(to[pos:])
+        if isinstance(to, (list, tuple)):
+            return type(to)(x for part in parts for x in part)
+        return to[:0].join(parts)
+    def to_bytes(self):
+        """
+        Serialize the script.
+
+        The first byte tells whether the inserted data is bytes or text
+        (encoded as UTF-8), or lists of them (SCRIPT_LINES flag).  Each
+        operation is encoded as varint of (n << 2 | op), followed by n
+        bytes of data for inserts, or n lines each prefixed with its
+        length as varint for inserts of lines.
+
+        >>> data = EditScript(ops=[(OP_COPY, 300), (OP_INSERT, b'ab')]).to_bytes()
+        >>> list(bytearray(data))
+        [0, 176, 9, 10, 97, 98]
+        >>> es = EditScript.from_strings(['a\\n', 'b\\n'], ['a\\n', 'c\\n'])
+        >>> EditScript.from_bytes(es.to_bytes()).ops
+        [(0, 1), (2, ['c\\n']), (1, 1)]
+        """
+        inserts = [value for (op, value) in self.ops if op == OP_INSERT]
+        lines = any(isinstance(value, (list, tuple)) for value in inserts)
+        if lines:
+            inserts = [line for value in inserts for line in value]
+        text = any(isinstance(value, six.text_type) for value in inserts)
+        result = bytearray([
+            (SCRIPT_TEXT if text else SCRIPT_BYTES) |
+            (SCRIPT_LINES if lines else 0)])
+        def encode(value):
+            return value.encode('utf-8') if text else value
+        for (op, value) in self.ops:
+            if op != OP_INSERT:
+                result += encode_varint(value << 2 | op)
+                continue
+            result += encode_varint(len(value) << 2 | op)
+            if not lines:
+                result += encode(value)
+                continue
+            for line in value:
+                line = encode(line)
+                result += encode_varint(len(line))
+                result += line
+        return bytes(result)
+    @classmethod
+    def from_bytes(cls, data):
+        data = bytearray(data)
+        text = data[0] & SCRIPT_TEXT
+        lines = data[0] & SCRIPT_LINES
+        def decode(start, stop):
+            value = bytes(data[start:stop])
+            return value.decode('utf-8') if text else value
+        ops = []
+        pos = 1
+        while pos < len(data):
+            (x, pos) = decode_varint(data, pos)
+            (n, op) = (x >> 2, x & 3)
+            if op != OP_INSERT:
+                ops.append((op, n))
+            elif not lines:
+                ops.append((op, decode(pos, pos + n)))
+                pos += n
+            else:
+                value = []
+                for dummy in xrange(n):
+                    (size, pos) = decode_varint(data, pos)
+                    value.append(decode(pos, pos + size))
+                    pos += size
+                ops.append((op, value))
+        return cls(ops=ops)
+
+def add_op(ops, op, value):
+    if ops and ops[-1][0] == op:
+        ops[-1] = (op, ops[-1][1] + value)
+    else:
+        ops.append((op, value))
+
+def delset_insmap_to_ops(delset, insmap):
+    ops = []
+    if insmap.get(-1):
+        add_op(ops, OP_INSERT, insmap[-1])
+    pos = 0
+    for i in sorted(delset.union(k for k in insmap if k >= 0)):
+        if i > pos:
+            add_op(ops, OP_COPY, i - pos)
+        add_op(ops, OP_DELETE if i in delset else OP_COPY, 1)
+        if insmap.get(i):
+            add_op(ops, OP_INSERT, insmap[i])
+        pos = i + 1
+    return ops
+
+def encode_varint(n):
+    """
+    Encode non-negative integer as little endian base 128 varint.
+
+    >>> list(encode_varint(0)), list(encode_varint(300))
+    ([0], [172, 2])
+    """
+    result = bytearray()
+    while n >= 0x80:
+        result.append((n & 0x7f) | 0x80)
+        n >>= 7
+    result.append(n)
+    return result
+
+def decode_varint(data, pos):
+    """
+    Decode varint from bytearray data at pos.
+
+    Returns (value, position after the varint).
+
+    >>> decode_varint(bytearray([172, 2, 5]), 0)
+    (300, 2)
+    """
+    n = 0
+    shift = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        n |= (byte & 0x7f) << shift
+        if not byte & 0x80:
+            return (n, pos)
+        shift += 7
 
 class Differ(object):
     """
     Difference analyzator of two strings.
 
+    By default the LCS algorithm is chosen by the estimated cost with
+    cost_model, see lcs_adaptive, and the AlgorithmChoice of the last
+    calculated LCS is stored to the choice attribute.
+
+    If max_cost is given, the LCS is calculated with lcs_xa with that
+    cost limit and the edit distance is the size of the resulting edit
+    script, which may be more than the minimal.  The statistics of the
+    heuristic are collected to the stats attribute.
+
     Usage example:
     >>> d = Differ('foobar', 'moocowbat')
     >>> d.a
@@ -520,6 +1518,8 @@ class Differ(object):
     'moocowbat'
     >>> d.lcs()
     ((1, 2), (2, 4), (3, 6), (4, 7))
+    >>> d.choice.algorithm.__name__
+    'lcs_bp'
     >>> d.edit_distance()
     7
     >>> d.edit_script().size()
@@ -535,16 +1535,32 @@ class Differ(object):
     ----------------------------------------------------
       j  |       0   1   2   3   4   5   6   7       8 |
     """
-    def __init__(self, a, b, lcs_algorithm=lcs_best):
+    def __init__(self, a, b, lcs_algorithm=lcs_best, max_cost=None,
+                 cost_model=None):
         self.a = a
         self.b = b
+        self.max_cost = max_cost
+        self.stats = DiffStats()
+        self.cost_model = cost_model
+        self.choice = None
+        if max_cost is not None:
+            lcs_algorithm = self.capped_lcs
+        elif lcs_algorithm is lcs_adaptive:
+            lcs_algorithm = self.adaptive_lcs
         self.lcs_algorithm = lcs_algorithm
+    def capped_lcs(self, a, b):
+        return lcs_xa(a, b, self.max_cost, self.stats)
+    def adaptive_lcs(self, a, b):
+        self.choice = choose_lcs_algorithm(a, b, self.cost_model)
+        return lcs_adaptive(a, b, choice=self.choice)
     def lcs(self):
         return self.lcs_algorithm(self.a, self.b)
     def edit_distance(self):
+        if self.max_cost is not None:
+            return len(self.a) + len(self.b) - 2 * len(self.lcs())
         return edit_distance(self.a, self.b)
     def edit_script(self):
-        return EditScript.from_strings(self.a, self.b)
+        return EditScript.from_strings(self.a, self.b, self.lcs_algorithm)
     def print_lcs(self):
         print_lcs(self.a, self.b, lcs=self.lcs_algorithm)
 
@@ -647,12 +1663,14 @@ def speed_compare():
 
     times = defaultdict(list)
 
-    lcslist = [lcs_d1, lcs_d2, lcs_d3, lcs_d4, lcs_m, lcs_x]
+    lcslist = [lcs_d1, lcs_d2, lcs_d3, lcs_d4, lcs_m, lcs_x, lcs_xa, lcs_bp,
+               lcs_adaptive]
 
     for i in xrange(5):
         (a,b) = randomstringpair(minlen=0, maxlen=500, maxeditdistance=random.randint(0,200))
         nm = len(a)*len(b)
         print('n  = %4d, m = %4d, nm=%8d, d=%3d' % (len(a), len(b), nm, edit_distance(a,b)))
+        print('adaptive choice: %r' % choose_lcs_algorithm(a, b))
         for lcs in lcslist:
             gc.collect()
             gc.disable()
@@ -669,12 +1687,98 @@ def speed_compare():
             assert is_cs(result, a, b), 'not a common subsequence'
             assert len(result) >= cached_lcs_len(a,b), 'not the longest common subsequence'
             assert len(result) <= cached_lcs_len(a,b), 'longer than longest common subsequence?'
-    print
+    print('')
     for lcs in lcslist:
         tl = times[lcs]
         if tl:
-            print('%-35s mid=%8.6f, avg=%8.6f, min=%8.6f, max=%8.6f' % (
-                lcs, avg(tl), mid(tl), min(tl), max(tl)))
+            print('%-35s mid=%8.6f, avg=%8.6f, min=%8.6f, max=%8.6f, '
+                  'speedup vs %s=%.1f' % (
+                lcs, mid(tl), avg(tl), min(tl), max(tl),
+                lcs_d2.__name__, avg(times[lcs_d2]) / avg(tl)))
+    pairs = history_pairs()
+    if pairs:
+        print('')
+        line_algorithm_compare(pairs)
+
+def history_pairs(repo_dir=None, max_pairs=200):
+    """
+    Get line lists of file versions changed in commits of a Git repository.
+
+    Returns list of (old lines, new lines) pairs of the modified files
+    of the newest commits, or an empty list if git cannot be run.  The
+    default repository is the one containing this module.
+    """
+    if repo_dir is None:
+        repo_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    def git(*args):
+        return subprocess.check_output(('git', '-C', repo_dir) + args)
+    try:
+        log = git('log', '--format=', '--raw', '--no-abbrev', '--no-renames')
+        pairs = []
+        for line in log.decode('utf-8', 'replace').splitlines():
+            fields = line.split()
+            if len(fields) < 5 or fields[4] != 'M':
+                continue
+            pairs.append(tuple(
+                git('cat-file', 'blob', sha).splitlines(True)
+                for sha in fields[2:4]))
+            if len(pairs) >= max_pairs:
+                break
+        return pairs
+    except (OSError, subprocess.CalledProcessError):
+        return []
+
+def line_algorithm_compare(pairs, lcslist=None):
+    """
+    Compare time and diff size of LCS algorithms on pairs of line lists.
+
+    The diff size is the number of deleted and inserted lines.
+    """
+    if lcslist is None:
+        lcslist = [lcs_x, lcs_xa, lcs_patience, lcs_histogram]
+    print('%d file pairs, %d lines' % (
+        len(pairs), sum(len(a) + len(b) for (a, b) in pairs)))
+    for lcs in lcslist:
+        gc.collect()
+        size = 0
+        t = time.time()
+        for (a, b) in pairs:
+            size += len(a) + len(b) - 2 * len(lcs(a, b))
+        t = time.time() - t
+        print('%-20s took %10.6f s, diff size %8d lines' % (
+            lcs.__name__, t, size))
+
+def max_cost_stats(pairs, max_cost=None):
+    """
+    Measure the cost limit heuristic on a corpus of string pairs.
+
+    Calculates LCS of each pair with lcs_xa limited to max_cost (or
+    default_max_cost) and compares it to the minimal edit distance.
+
+    >>> stats = max_cost_stats([('phef', 'eb'), ('abc', 'abd')], 1)
+    >>> (stats.pairs, stats.heuristic_pairs, stats.excess_edits)
+    (2, 1, 2)
+    """
+    stats = DiffStats()
+    for (a, b) in pairs:
+        cost = max_cost if max_cost is not None else (
+            default_max_cost(len(a), len(b)))
+        result = lcs_xa(a, b, cost, stats)
+        stats.add_excess(2 * (lcs_len_bitparallel(a, b) - len(result)))
+    return stats
+
+def max_cost_compare(max_costs=(1, 4, 16, 64, None)):
+    randomstring.seed(38)
+    pairs = [
+        randomstringpair(minlen=0, maxlen=2000,
+                         maxeditdistance=random.randint(0, 1000))
+        for dummy in xrange(20)]
+    for max_cost in max_costs:
+        t = time.time()
+        stats = max_cost_stats(pairs, max_cost)
+        t = time.time() - t
+        print('max_cost=%-7s took %8.4f s, %r' % (
+            max_cost if max_cost is not None else 'default', t, stats))
 
 @memoized
 def cached_lcs(a,b):
@@ -701,3 +1805,4 @@ if __name__ == '__main__':
     import doctest
     doctest.testmod()
     speed_compare()
+    max_cost_compare()
@@ -0,0 +1,198 @@
+"""
+Calculate diffs of many pairs of sequences in parallel.
+
+The pairs are divided to shards of about equal estimated cost, which
+are processed in a pool of worker processes.  The results are yielded
+as soon as their shard is finished.
+
+Pairs of files can be given as FilePair objects, so that the workers
+read the files by themselves and only the file names are sent to
+them.
+"""
+
+import heapq
+import math
+import multiprocessing
+import os
+import time
+from collections import defaultdict
+from .diff import DiffStats, common_prefix_length, common_suffix_length
+from .diff import lcs_xa
+
+DEFAULT_SHARDS_PER_WORKER = 4
+
+class FilePair(object):
+    """
+    Pair of files to diff line by line.
+    """
+    def __init__(self, path_a, path_b):
+        self.path_a = path_a
+        self.path_b = path_b
+    def load(self):
+        return (read_lines(self.path_a), read_lines(self.path_b))
+    def __repr__(self):
+        return '%s(%r, %r)' % (
+            self.__class__.__name__, self.path_a, self.path_b)
+
+def read_lines(path):
+    with open(path, 'rb') as f:
+        return f.read().splitlines(True)
+
+class PairResult(object):
+    """
+    LCS of a pair and statistics of its calculation.
+
+    Index is the position of the pair in the input and cost is its
+    estimated cost, see estimate_cost.
+    """
+    def __init__(self, index, lcs, elapsed, cost, heuristic_splits=0):
+        self.index = index
+        self.lcs = lcs
+        self.elapsed = elapsed
+        self.cost = cost
+        self.heuristic_splits = heuristic_splits
+    def __repr__(self):
+        return '<%s index=%d lcs=%d elapsed=%.6f cost=%d>' % (
+            self.__class__.__name__, self.index, len(self.lcs),
+            self.elapsed, self.cost)
+
+class BatchStats(object):
+    """
+    Statistics of a batch of diffs.
+
+    >>> stats = BatchStats()
+    >>> stats.add(PairResult(0, (), 0.0005, 10))
+    >>> stats.add(PairResult(1, (), 0.003, 10, heuristic_splits=2))
+    >>> stats.add(PairResult(2, (), 0.004, 10))
+    >>> stats.histogram_rows()
+    [(0.001, 1), (0.004, 2)]
+    >>> stats.capped_pairs
+    [1]
+    """
+    def __init__(self):
+        self.pairs = 0
+        self.total_time = 0.0
+        self.time_histogram = defaultdict(int)
+        self.capped_pairs = []
+    def add(self, result):
+        self.pairs += 1
+        self.total_time += result.elapsed
+        self.time_histogram[time_bucket(result.elapsed)] += 1
+        if result.heuristic_splits:
+            self.capped_pairs.append(result.index)
+    def histogram_rows(self):
+        """Return list of (upper bound of time in seconds, count)."""
+        return sorted(self.time_histogram.items())
+
+def time_bucket(elapsed, resolution=0.001):
+    """
+    Get the upper bound of the time histogram bucket of elapsed.
+
+    The buckets are powers of two multiples of resolution.
+
+    >>> [time_bucket(t) for t in (0, 0.001, 0.0011, 0.005)]
+    [0.001, 0.001, 0.002, 0.008]
+    """
+    if elapsed <= resolution:
+        return resolution
+    return resolution * 2**int(math.ceil(math.log(elapsed / resolution, 2)))
+
+def estimate_cost(pair):
+    """
+    Estimate cost of diffing a pair.
+
+    The cost is the total length of the sequences without their common
+    prefix and suffix.  For FilePair the total size of the files is
+    used instead to avoid reading them.
+
+    >>> estimate_cost(('abcxdef', 'abcydef'))
+    2
+    """
+    if isinstance(pair, FilePair):
+        return os.path.getsize(pair.path_a) + os.path.getsize(pair.path_b)
+    (a, b) = pair
+    (n, m) = (len(a), len(b))
+    prefix = common_prefix_length(a, 0, n, b, 0, m)
+    suffix = common_suffix_length(a, prefix, n, b, prefix, m)
+    return n + m - 2 * (prefix + suffix)
+
+def make_shards(costs, shard_count):
+    """
+    Divide indices of costs to shards of about equal total cost.
+
+    The most expensive items are assigned first, each to the shard
+    with the smallest total so far.  The shards are returned in the
+    order of decreasing total cost.
+
+    >>> make_shards([5, 1, 4, 2, 2], 2)
+    [[2, 3, 1], [0, 4]]
+    """
+    shards = [(0, k, []) for k in range(min(shard_count, len(costs)))]
+    for index in sorted(range(len(costs)), key=lambda i: -costs[i]):
+        (total, k, shard) = heapq.heappop(shards)
+        shard.append(index)
+        heapq.heappush(shards, (total + costs[index], k, shard))
+    return [shard for (total, k, shard) in sorted(shards, reverse=True)]
+
+def diff_shard(task):
+    (items, algorithm, max_cost) = task
+    results = []
+    for (index, pair, cost) in items:
+        if isinstance(pair, FilePair):
+            pair = pair.load()
+        (a, b) = pair
+        stats = DiffStats()
+        t = time.time()
+        if max_cost is not None:
+            lcs = lcs_xa(a, b, max_cost, stats)
+        else:
+            lcs = algorithm(a, b)
+        elapsed = time.time() - t
+        results.append(
+            PairResult(index, lcs, elapsed, cost, stats.heuristic_splits))
+    return results
+
+def diff_many(pairs, workers=None, algorithm=lcs_xa, max_cost=None,
+              stats=None, shards_per_worker=DEFAULT_SHARDS_PER_WORKER):
+    """
+    Calculate LCS of many pairs and yield PairResults as they finish.
+
+    The pairs can be (a, b) tuples of sequences or FilePairs.  The
+    results are not in the input order; use their index attribute.
+    If workers is 1, the pairs are processed in this process.  If
+    max_cost is given, lcs_xa with that cost limit is used instead of
+    algorithm and the pairs where the limit was hit are recorded to
+    BatchStats stats, if given.
+
+    >>> results = diff_many([('abc', 'abd'), ('xy', 'y')], workers=1)
+    >>> sorted((r.index, r.lcs) for r in results)
+    [(0, ((0, 0), (1, 1))), (1, ((1, 0),))]
+    """
+    pairs = list(pairs)
+    costs = [estimate_cost(pair) for pair in pairs]
+    shard_count = (workers or multiprocessing.cpu_count()) * shards_per_worker
+    tasks = (
+        ([(index, pairs[index], costs[index]) for index in shard],
+         algorithm, max_cost)
+        for shard in make_shards(costs, shard_count))
+    if workers == 1:
+        results = (diff_shard(task) for task in tasks)
+        pool = None
+    else:
+        pool = multiprocessing.Pool(workers)
+        results = pool.imap_unordered(diff_shard, tasks)
+    try:
+        for shard_results in results:
+            for result in shard_results:
+                if stats is not None:
+                    stats.add(result)
+                yield result
+        if pool:
+            pool.close()
+    except:
+        if pool:
+            pool.terminate()
+        raise
+    finally:
+        if pool:
+            pool.join()
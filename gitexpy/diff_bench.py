@@ -0,0 +1,352 @@
+"""
+Benchmark of the LCS engines.
+
+The engines are timed on random string pairs of length n and edit
+distance at most d, where n and d are taken from logarithmic grids.
+Both the absolute time and the time per cell of the n * m table are
+recorded, and the results can be written as JSON and compared to a
+stored baseline to find regressions.
+
+The pairs are generated from a seed derived from n and d, so the same
+grid point gets the same pair in every run.
+"""
+
+import gc
+import json
+import math
+import platform
+import sys
+import time
+from six.moves import xrange
+from . import diff, randomstring
+from .diff_numpy import lcs_numpy
+from .errors import *
+
+RESULT_FORMAT = 1
+
+DEFAULT_SIZES = (16, 64, 256, 1024, 4096)
+DEFAULT_DISTANCES = (0, 1, 4, 16, 64, 256, 1024, 4096)
+QUICK_SIZES = (16, 64, 256)
+DEFAULT_REPEAT = 3
+DEFAULT_TIME_LIMIT = 1.0
+DEFAULT_THRESHOLD = 0.25
+DEFAULT_MIN_SECONDS = 0.002
+
+timer = getattr(time, 'perf_counter', time.time)
+
+class UnknownEngine(Error):
+    pass
+
+class WrongResult(Error):
+    pass
+
+class Engine(object):
+    """
+    LCS function to benchmark.
+
+    Engines with a full table in memory (like lcs_d2) should be given
+    max_cells, the largest n * m to run them with.  Exact is false for
+    engines which return a common subsequence that is not always the
+    longest, like lcs_patience.
+    """
+    def __init__(self, function, max_cells=None, exact=True):
+        self.function = function
+        self.max_cells = max_cells
+        self.exact = exact
+    @property
+    def name(self):
+        return self.function.__name__
+    def accepts(self, n, m):
+        return self.max_cells is None or n * m <= self.max_cells
+    def __repr__(self):
+        return '%s(%s, %r, %r)' % (
+            self.__class__.__name__, self.name, self.max_cells, self.exact)
+
+# lcs_r is left out, since it takes exponential time
+ENGINES = [
+    Engine(diff.lcs_d1, 2**20),
+    Engine(diff.lcs_d2, 2**20),
+    Engine(diff.lcs_d3, 2**20),
+    Engine(diff.lcs_d4, 2**20),
+    Engine(diff.lcs_m1),
+    Engine(diff.lcs_m),
+    Engine(diff.lcs_x),
+    Engine(diff.lcs_xa),
+    Engine(diff.lcs_bp),
+    Engine(diff.lcs_patience, exact=False),
+    Engine(diff.lcs_histogram, exact=False),
+    Engine(diff.lcs_adaptive),
+    Engine(lcs_numpy),
+]
+
+def register_engine(function, max_cells=None, exact=True):
+    """Add an LCS function to the benchmarked engines."""
+    engine = Engine(function, max_cells, exact)
+    ENGINES.append(engine)
+    return engine
+
+def find_engines(names=None):
+    """
+    Get engines by their names, or all engines if names is None.
+
+    >>> [e.name for e in find_engines(['lcs_xa', 'lcs_bp'])]
+    ['lcs_xa', 'lcs_bp']
+    >>> find_engines(['lcs_foo'])  # doctest: +IGNORE_EXCEPTION_DETAIL
+    Traceback (most recent call last):
+        ...
+    UnknownEngine: lcs_foo
+    """
+    if names is None:
+        return list(ENGINES)
+    by_name = dict((engine.name, engine) for engine in ENGINES)
+    for name in names:
+        if name not in by_name:
+            raise UnknownEngine(name)
+    return [by_name[name] for name in names]
+
+def grid(sizes=DEFAULT_SIZES, distances=DEFAULT_DISTANCES):
+    """
+    Get the (n, d) points of the grid, skipping d larger than n.
+
+    >>> list(grid((4, 16), (0, 4, 16)))
+    [(4, 0), (4, 4), (16, 0), (16, 4), (16, 16)]
+    """
+    for n in sizes:
+        for d in distances:
+            if d <= n:
+                yield (n, d)
+
+def make_pair(n, d):
+    """
+    Get the random string pair of grid point (n, d).
+
+    >>> (a, b) = make_pair(100, 10)
+    >>> (len(a), a == make_pair(100, 10)[0])
+    (100, True)
+    """
+    randomstring.seed(n * 1000003 + d)
+    return randomstring.randomstringpair(minlen=n, maxlen=n, maxeditdistance=d)
+
+def time_engine(function, a, b, repeat=DEFAULT_REPEAT):
+    """
+    Run function(a, b) repeat times and return (best time, result).
+    """
+    best = None
+    for dummy in xrange(repeat):
+        gc.collect()
+        gc.disable()
+        try:
+            t = timer()
+            result = function(a, b)
+            t = timer() - t
+        finally:
+            gc.enable()
+        if best is None or t < best:
+            best = t
+    return (best, result)
+
+def run_benchmark(engines=None, sizes=DEFAULT_SIZES,
+                  distances=DEFAULT_DISTANCES, repeat=DEFAULT_REPEAT,
+                  time_limit=DEFAULT_TIME_LIMIT, report=None):
+    """
+    Time engines on the grid and return list of result dictionaries.
+
+    Each result has keys engine, n, m, target_d (d of the grid), d
+    (the actual edit distance), seconds and us_per_cell.  The results
+    are also passed to report, if given, as they are ready.
+
+    An engine that takes longer than time_limit at (n, d) is not run
+    at the points where both n and d are at least as large.  The
+    results are checked to be common subsequences, and for exact
+    engines also against the length from lcs_len_bitparallel.
+
+    >>> results = run_benchmark(find_engines(['lcs_xa']), (8, 32), (0, 4),
+    ...                         repeat=1)
+    >>> [(r['n'], r['target_d']) for r in results]
+    [(8, 0), (8, 4), (32, 0), (32, 4)]
+    """
+    if engines is None:
+        engines = find_engines()
+    sys.setrecursionlimit(max(sys.getrecursionlimit(), 100000))
+    too_slow = dict((engine.name, []) for engine in engines)
+    results = []
+    for (n, target_d) in grid(sizes, distances):
+        (a, b) = make_pair(n, target_d)
+        m = len(b)
+        lcs_len = diff.lcs_len_bitparallel(a, b)
+        for engine in engines:
+            if not engine.accepts(n, m) or any(
+                    n >= n0 and target_d >= d0
+                    for (n0, d0) in too_slow[engine.name]):
+                continue
+            (seconds, lcs) = time_engine(engine.function, a, b, repeat)
+            if ((engine.exact and len(lcs) != lcs_len) or
+                    not all(a[i] == b[j] for (i, j) in lcs)):
+                raise WrongResult('%s n=%d d=%d' % (engine.name, n, target_d))
+            if seconds > time_limit:
+                too_slow[engine.name].append((n, target_d))
+            result = {
+                'engine': engine.name,
+                'n': n,
+                'm': m,
+                'target_d': target_d,
+                'd': n + m - 2 * lcs_len,
+                'seconds': seconds,
+                'us_per_cell': 1000000.0 * seconds / max(n * m, 1),
+            }
+            results.append(result)
+            if report:
+                report(result)
+    return results
+
+def format_result(result):
+    return '%-14s n=%5d m=%5d d=%5d %12.6f s %10.5f us/cell' % (
+        result['engine'], result['n'], result['m'], result['d'],
+        result['seconds'], result['us_per_cell'])
+
+def scaling_exponents(results):
+    """
+    Fit time ~ n**k for each engine and target_d.
+
+    Returns dictionary mapping (engine, target_d) to the least squares
+    slope k of log(seconds) against log(n).  Needs at least two sizes.
+
+    >>> results = [{'engine': 'e', 'target_d': 0, 'n': n, 'seconds': t}
+    ...            for (n, t) in [(10, 0.02), (100, 2.0), (1000, 200.0)]]
+    >>> scaling_exponents(results)
+    {('e', 0): 2.0}
+    """
+    points = {}
+    for r in results:
+        if r['seconds'] > 0:
+            points.setdefault((r['engine'], r['target_d']), []).append(
+                (math.log(r['n']), math.log(r['seconds'])))
+    exponents = {}
+    for (key, xy) in points.items():
+        if len(set(x for (x, y) in xy)) < 2:
+            continue
+        mx = sum(x for (x, y) in xy) / len(xy)
+        my = sum(y for (x, y) in xy) / len(xy)
+        sxx = sum((x - mx) ** 2 for (x, y) in xy)
+        sxy = sum((x - mx) * (y - my) for (x, y) in xy)
+        exponents[key] = round(sxy / sxx, 3)
+    return exponents
+
+class Regression(object):
+    """
+    Result that is slower than its baseline by more than the threshold.
+    """
+    def __init__(self, result, baseline):
+        self.result = result
+        self.baseline = baseline
+    @property
+    def ratio(self):
+        return self.result['seconds'] / self.baseline['seconds']
+    def __repr__(self):
+        return '<%s %s n=%d target_d=%d %.6f s vs %.6f s (%.2fx)>' % (
+            self.__class__.__name__, self.result['engine'],
+            self.result['n'], self.result['target_d'],
+            self.result['seconds'], self.baseline['seconds'], self.ratio)
+
+def result_key(result):
+    return (result['engine'], result['n'], result['target_d'])
+
+def compare(results, baseline, threshold=DEFAULT_THRESHOLD,
+            min_seconds=DEFAULT_MIN_SECONDS):
+    """
+    Find the results that regressed compared to baseline results.
+
+    A result regressed if it took more than (1 + threshold) times the
+    time of the baseline result of the same engine and grid point.
+    Baseline times under min_seconds are too noisy to compare and are
+    skipped, as are points missing from the baseline.
+
+    >>> base = [{'engine': 'e', 'n': 10, 'target_d': 0, 'seconds': 0.01}]
+    >>> new = [dict(base[0], seconds=0.02)]
+    >>> compare(new, base)
+    [<Regression e n=10 target_d=0 0.020000 s vs 0.010000 s (2.00x)>]
+    >>> compare(new, base, threshold=1.5)
+    []
+    """
+    baseline_by_key = dict((result_key(r), r) for r in baseline)
+    regressions = []
+    for result in results:
+        base = baseline_by_key.get(result_key(result))
+        if base is None or base['seconds'] < min_seconds:
+            continue
+        if result['seconds'] > (1 + threshold) * base['seconds']:
+            regressions.append(Regression(result, base))
+    return regressions
+
+def write_results(results, out_stream, repeat=DEFAULT_REPEAT):
+    document = {
+        'format': RESULT_FORMAT,
+        'python': platform.python_version(),
+        'implementation': platform.python_implementation(),
+        'machine': platform.machine(),
+        'repeat': repeat,
+        'results': results,
+    }
+    json.dump(document, out_stream, indent=2, sort_keys=True)
+    out_stream.write('\n')
+
+def read_results(in_stream):
+    return json.load(in_stream)['results']
+
+def main(sys):
+    """
+    Benchmark the LCS engines and compare the results to a baseline.
+
+    Usage: diff_bench [--quick] [-e ENGINE]... [-o OUTPUT] [-b BASELINE]
+                      [-t THRESHOLD]
+
+    Writes the results as JSON to OUTPUT and exits with status 2 if
+    some result is more than THRESHOLD (default 0.25) times slower than
+    in BASELINE.  Points whose baseline time is under 2 ms are not
+    compared, since their timings are mostly noise.
+    """
+    (sizes, repeat, names) = (DEFAULT_SIZES, DEFAULT_REPEAT, None)
+    (output, baseline, threshold) = (None, None, DEFAULT_THRESHOLD)
+    try:
+        args = sys.argv[1:]
+        while args:
+            arg = args.pop(0)
+            if arg == '--quick':
+                sizes = QUICK_SIZES
+            elif arg == '-e':
+                names = (names or []) + [args.pop(0)]
+            elif arg == '-o':
+                output = args.pop(0)
+            elif arg == '-b':
+                baseline = args.pop(0)
+            elif arg == '-t':
+                threshold = float(args.pop(0))
+            else:
+                raise Exception('Unknown argument')
+        engines = find_engines(names)
+    except Exception:
+        print(main.__doc__.split('\n\n', 1)[1].rstrip())
+        sys.exit(1)
+    results = run_benchmark(
+        engines, sizes, repeat=repeat,
+        report=lambda result: sys.stdout.write(format_result(result) + '\n'))
+    print('')
+    for ((name, d), k) in sorted(scaling_exponents(results).items()):
+        print('%-14s d=%5d time ~ n^%.2f' % (name, d, k))
+    if output:
+        with open(output, 'w') as f:
+            write_results(results, f, repeat)
+    if baseline:
+        with open(baseline) as f:
+            regressions = compare(results, read_results(f), threshold)
+        print('')
+        for regression in regressions:
+            print('REGRESSION %r' % regression)
+        print('%d regressions in %d results' % (
+            len(regressions), len(results)))
+        if regressions:
+            sys.exit(2)
+
+if __name__ == '__main__':
+    import sys
+    main(sys)
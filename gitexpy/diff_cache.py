@@ -0,0 +1,153 @@
+"""
+Cache of diff results keyed by Git object ids.
+
+Since blobs are immutable, a diff of two blobs can be identified by
+their object ids, the LCS algorithm and its options, and the contents
+themselves need not be kept or even read on a cache hit.  The results
+are stored as serialized EditScripts in an LRU cache bounded by their
+total size in bytes, and optionally in a directory on disk, so that
+repeated history analyses (like blame) can reuse them across runs.
+"""
+
+import hashlib
+import os
+import tempfile
+from collections import OrderedDict
+from .diff import EditScript, lcs_best
+from .git_object_model import ObjectId
+
+DEFAULT_MAX_BYTES = 64 * 2**20
+
+# Estimated memory taken by an entry in addition to the script data
+ENTRY_OVERHEAD = 200
+
+class DiffCache(object):
+    """
+    Byte-bounded LRU cache of EditScripts with optional disk storage.
+
+    The object ids can be ObjectIds, or their 20 byte or 40 character
+    hexadecimal forms.  The options are keyword arguments given to
+    the LCS algorithm.
+
+    >>> cache = DiffCache(max_bytes=1000)
+    >>> blobs = {'1' * 40: 'foobar', '2' * 40: 'moocowbat'}
+    >>> cache.edit_script('1' * 40, '2' * 40, blobs.get).apply('foobar')
+    'moocowbat'
+    >>> cache.edit_script('1' * 40, '2' * 40, blobs.get).size()
+    7
+    >>> cache
+    <DiffCache entries=1 bytes=215/1000 hits=1 misses=1 disk_hits=0 evictions=0>
+    >>> cache.hit_rate()
+    0.5
+    """
+    def __init__(self, max_bytes=DEFAULT_MAX_BYTES, directory=None):
+        self.max_bytes = max_bytes
+        self.directory = directory
+        self.entries = OrderedDict()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.disk_hits = 0
+        self.evictions = 0
+    def __len__(self):
+        return len(self.entries)
+    def __repr__(self):
+        return ('<%s entries=%d bytes=%d/%d hits=%d misses=%d disk_hits=%d '
+                'evictions=%d>' % (
+                    self.__class__.__name__, len(self), self.bytes,
+                    self.max_bytes, self.hits, self.misses, self.disk_hits,
+                    self.evictions))
+    def hit_rate(self):
+        """Fraction of lookups found in memory or on disk."""
+        lookups = self.hits + self.misses
+        return float(self.hits) / lookups if lookups else 0.0
+    def get(self, old_oid, new_oid, algorithm=lcs_best, options=None):
+        """
+        Get cached EditScript from old to new object, or None.
+        """
+        key = make_key(old_oid, new_oid, algorithm, options)
+        data = self.entries.pop(key, None)
+        if data is None and self.directory:
+            data = self.read_file(key)
+            if data is not None:
+                self.disk_hits += 1
+                self.store(key, data)
+        elif data is not None:
+            self.entries[key] = data
+        if data is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return EditScript.from_bytes(data)
+    def put(self, old_oid, new_oid, script, algorithm=lcs_best,
+            options=None):
+        key = make_key(old_oid, new_oid, algorithm, options)
+        data = script.to_bytes()
+        if self.directory:
+            self.write_file(key, data)
+        if key in self.entries:
+            self.bytes -= entry_size(self.entries.pop(key))
+        self.store(key, data)
+    def edit_script(self, old_oid, new_oid, load, algorithm=lcs_best,
+                    options=None):
+        """
+        Get EditScript from old to new object, calculating it if needed.
+
+        Load is called with an object id to get the contents of the
+        object as a sequence (e.g. a list of lines) only on a miss.
+        """
+        script = self.get(old_oid, new_oid, algorithm, options)
+        if script is None:
+            (a, b) = (load(old_oid), load(new_oid))
+            lcs = algorithm(a, b, **(options or {}))
+            script = EditScript.from_lcs(a, b, lcs)
+            self.put(old_oid, new_oid, script, algorithm, options)
+        return script
+    def store(self, key, data):
+        size = entry_size(data)
+        if size > self.max_bytes:
+            return
+        self.entries[key] = data
+        self.bytes += size
+        while self.bytes > self.max_bytes:
+            (old_key, old_data) = self.entries.popitem(last=False)
+            self.bytes -= entry_size(old_data)
+            self.evictions += 1
+    def file_path(self, key):
+        digest = hashlib.sha1(key.encode('utf-8')).hexdigest()
+        return os.path.join(self.directory, digest[:2], digest[2:])
+    def read_file(self, key):
+        try:
+            with open(self.file_path(key), 'rb') as f:
+                (stored_key, data) = f.read().split(b'\n', 1)
+        except (IOError, OSError, ValueError):
+            return None
+        if stored_key.decode('utf-8') != key:
+            return None
+        return data
+    def write_file(self, key, data):
+        path = self.file_path(key)
+        dirname = os.path.dirname(path)
+        if not os.path.isdir(dirname):
+            os.makedirs(dirname)
+        # Write to a temporary file and rename it, so that concurrent
+        # readers never see a partial file
+        (fd, tmp_path) = tempfile.mkstemp(dir=dirname)
+        with os.fdopen(fd, 'wb') as f:
+            f.write(key.encode('utf-8') + b'\n' + data)
+        os.rename(tmp_path, path)
+
+def entry_size(data):
+    return len(data) + ENTRY_OVERHEAD
+
+def make_key(old_oid, new_oid, algorithm, options):
+    """
+    Make cache key of a diff.
+
+    >>> make_key('1' * 40, '2' * 40, lcs_best, {'b': 2, 'a': 1})[81:]
+    " lcs_adaptive [('a', 1), ('b', 2)]"
+    """
+    return '%s %s %s %r' % (
+        ObjectId(old_oid), ObjectId(new_oid),
+        getattr(algorithm, '__name__', algorithm),
+        sorted((options or {}).items()))
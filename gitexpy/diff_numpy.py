@@ -0,0 +1,192 @@
+"""
+LCS calculation with NumPy.
+
+The dynamic programming table of LCS lengths is filled along the
+anti-diagonals, since the cells of an anti-diagonal depend only on the
+two previous anti-diagonals and can be calculated with vector
+operations.  The lengths are stored as uint16 or uint32.
+
+Long sequences are split with the Hirschberg technique, which needs
+only the last rows of the tables, until the parts are small enough to
+be traced back from a full table.
+
+Without NumPy, lcs_numpy falls back to diff.lcs_xa.
+"""
+
+import six
+from six.moves import xrange
+from .diff import lcs_xa
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+DEFAULT_TABLE_CELLS = 2**22
+
+def lcs_numpy(a, b, table_cells=DEFAULT_TABLE_CELLS):
+    """
+    Calculate LCS of a and b with NumPy in linear space.
+
+    Parts with at most table_cells cells in their table are traced
+    back from a full table like in diff.lcs_d2.  Larger parts are
+    split in two halves with the Hirschberg technique.
+
+    Returns same as diff.lcs_r.
+
+    >>> lcs_numpy('dbcbcbcac', 'adcadcac')
+    ((0, 1), (2, 2), (6, 5), (7, 6), (8, 7))
+    >>> lcs_numpy(b'foobar', b'moocowbat')
+    ((1, 2), (2, 4), (3, 6), (4, 7))
+    >>> len(lcs_numpy([1, 2, 3, 4] * 10, [4, 3, 2, 1] * 10, 16))
+    19
+    """
+    if numpy is None:
+        return lcs_xa(a, b)
+    (x, y) = to_tokens(a, b)
+    result = []
+    stack = [(0, 0, len(x), len(y))]
+    while stack:
+        (apos, bpos, amax, bmax) = stack.pop()
+        t = common_prefix_length(x[apos:amax], y[bpos:bmax])
+        result.extend((apos + i, bpos + i) for i in xrange(t))
+        (apos, bpos) = (apos + t, bpos + t)
+        t = common_prefix_length(x[apos:amax][::-1], y[bpos:bmax][::-1])
+        result.extend((amax - t + i, bmax - t + i) for i in xrange(t))
+        (amax, bmax) = (amax - t, bmax - t)
+        (n, m) = (amax - apos, bmax - bpos)
+        if not n or not m:
+            continue
+        if n * m <= table_cells or n == 1:
+            table = lcs_table(x[apos:amax], y[bpos:bmax])
+            result.extend(
+                (apos + i, bpos + j)
+                for (i, j) in traceback(x[apos:amax], y[bpos:bmax], table))
+            continue
+        mid = apos + n // 2
+        forward = lcs_row(x[apos:mid], y[bpos:bmax])
+        reverse = lcs_row(x[mid:amax][::-1], y[bpos:bmax][::-1])[::-1]
+        k = bpos + int(numpy.argmax(
+            forward.astype(numpy.int64) + reverse.astype(numpy.int64)))
+        stack.append((mid, k, amax, bmax))
+        stack.append((apos, bpos, mid, k))
+    result.sort()
+    return tuple(result)
+
+def to_tokens(a, b):
+    """
+    Convert sequences a and b to NumPy arrays of integer tokens.
+
+    Bytes are used as is and characters of strings are converted to
+    their code points.  Elements of other sequences are mapped to
+    integers with a dictionary shared by a and b.
+
+    >>> (x, y) = to_tokens(['foo', 'bar'], ['bar', 'baz'])
+    >>> (x.tolist(), y.tolist())
+    ([0, 1], [1, 2])
+    """
+    if isinstance(a, (bytes, bytearray)) and isinstance(b, (bytes, bytearray)):
+        return (numpy.frombuffer(bytes(a), dtype=numpy.uint8),
+                numpy.frombuffer(bytes(b), dtype=numpy.uint8))
+    if isinstance(a, six.text_type) and isinstance(b, six.text_type):
+        return (numpy.frombuffer(a.encode('utf-32-le'), dtype=numpy.uint32),
+                numpy.frombuffer(b.encode('utf-32-le'), dtype=numpy.uint32))
+    ids = {}
+    return tuple(
+        numpy.array([ids.setdefault(x, len(ids)) for x in seq],
+                    dtype=numpy.int64)
+        for seq in (a, b))
+
+def length_dtype(n, m):
+    return numpy.uint16 if min(n, m) < 2**16 else numpy.uint32
+
+def common_prefix_length(x, y):
+    """
+    Length of the common prefix of arrays x and y.
+
+    >>> common_prefix_length(numpy.array([1, 2, 3]), numpy.array([1, 2, 4]))
+    2
+    """
+    n = min(len(x), len(y))
+    differs = numpy.flatnonzero(x[:n] != y[:n])
+    return int(differs[0]) if len(differs) else n
+
+def lcs_row(x, y):
+    """
+    Calculate the last row of the LCS length table of x and y.
+
+    Returns array of L[len(x)][j] for j in 0..len(y), where L[i][j] is
+    the length of LCS(x[:i], y[:j]).  Keeps only three anti-diagonals
+    in memory.
+
+    >>> lcs_row(*to_tokens('abcb', 'bdcab')).tolist()
+    [0, 1, 1, 2, 2, 3]
+    """
+    (n, m) = (len(x), len(y))
+    dtype = length_dtype(n, m)
+    row = numpy.zeros(m + 1, dtype)
+    if not n or not m:
+        return row
+    y_reversed = y[::-1]
+    # Diagonal s contains cells (i, s - i) and is indexed with i
+    prev2 = numpy.zeros(n + 1, dtype)
+    prev1 = numpy.zeros(n + 1, dtype)
+    cur = numpy.zeros(n + 1, dtype)
+    for s in xrange(2, n + m + 1):
+        (lo, hi) = (max(1, s - m), min(n, s - 1))
+        # x[i-1] == y[s-i-1] for i in lo..hi
+        equal = x[lo-1:hi] == y_reversed[m-s+lo:m-s+hi+1]
+        cur[lo:hi+1] = numpy.where(
+            equal, prev2[lo-1:hi] + 1,
+            numpy.maximum(prev1[lo-1:hi], prev1[lo:hi+1]))
+        cur[0] = 0
+        if s <= n:
+            cur[s] = 0
+        if hi == n:
+            row[s - n] = cur[n]
+        (prev2, prev1, cur) = (prev1, cur, prev2)
+    return row
+
+def lcs_table(x, y):
+    """
+    Calculate the LCS length table of x and y.
+
+    The anti-diagonals are strided views to the flattened table, since
+    cell (i, s - i) is at s + i * len(y) in it.
+
+    >>> lcs_table(*to_tokens('abcb', 'bdcab'))[-1].tolist()
+    [0, 1, 1, 2, 2, 3]
+    """
+    (n, m) = (len(x), len(y))
+    table = numpy.zeros((n + 1, m + 1), length_dtype(n, m))
+    if not n or not m:
+        return table
+    flat = table.reshape(-1)
+    y_reversed = y[::-1]
+    for s in xrange(2, n + m + 1):
+        (lo, hi) = (max(1, s - m), min(n, s - 1))
+        start = s + lo * m
+        stop = s + hi * m + 1
+        equal = x[lo-1:hi] == y_reversed[m-s+lo:m-s+hi+1]
+        flat[start:stop:m] = numpy.where(
+            equal, flat[start-m-2:stop-m-2:m] + 1,
+            numpy.maximum(flat[start-m-1:stop-m-1:m],
+                          flat[start-1:stop-1:m]))
+    return table
+
+def traceback(x, y, table):
+    """
+    Trace back LCS from a table of LCS lengths like diff.lcs_d2 does.
+    """
+    result = []
+    (i, j) = (len(x), len(y))
+    while i and j:
+        if x[i-1] == y[j-1]:
+            (i, j) = (i - 1, j - 1)
+            result.append((i, j))
+        elif table.item(i - 1, j) >= table.item(i, j - 1):
+            i -= 1
+        else:
+            j -= 1
+    result.reverse()
+    return result
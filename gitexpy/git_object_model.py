@@ -11,6 +11,9 @@ from .sixx import astr
 
 PACKFILE_CACHE = {}
 
+TREE_MODE = b'40000'
+SUBMODULE_MODE = b'160000'
+
 
 class Error(Exception):
     """GOM Error"""
@@ -324,10 +327,127 @@ class TreeObject(GitObject):
         return cls(entries)
 
 
-# class CommitObject(GitObject):
-#     """NYI: CommitObject"""
-#     def get_object_type(self):
-#         return b'commit'
+def tree_entries(get, tree_oid, prefix=b''):
+    """
+    Get dictionary of path to (mode, oid) of the blobs of a tree.
+
+    Get is called with an ObjectId to get a Git object.
+    """
+    entries = {}
+    if tree_oid is None:
+        return entries
+    for (mode, name, oid) in get(tree_oid).entries:
+        if mode == TREE_MODE:
+            entries.update(tree_entries(get, oid, prefix + name + b'/'))
+        else:
+            entries[prefix + name] = (mode, oid)
+    return entries
+
+
+def find_blob(get, tree_oid, path, trees=None):
+    """
+    Find object id of the blob at path in a tree, or None.
+
+    The path is a list of bytes components.  The found ids are stored
+    to dictionary trees keyed by the tree id and depth, so that
+    subtrees shared by many commits are read once.
+    """
+    if trees is None:
+        trees = {}
+    for (depth, name) in enumerate(path):
+        key = (tree_oid.bytes, depth)
+        if key not in trees:
+            trees[key] = None
+            for (mode, entry_name, oid) in get(tree_oid).entries:
+                if entry_name == name:
+                    trees[key] = (mode, oid)
+        if trees[key] is None:
+            return None
+        (mode, tree_oid) = trees[key]
+    if mode in (TREE_MODE, SUBMODULE_MODE):
+        return None
+    return tree_oid
+
+
+class CommitObject(GitObject):
+    """
+    Git commit object.
+
+    The headers are kept as list of (key, value) pairs of bytes in
+    their original order.  Values of multi-line headers (like gpgsig)
+    have their continuation lines joined with newlines.
+
+    >>> commit = CommitObject.from_contents(
+    ...     b'tree 4b825dc642cb6eb9a060e54bf8d69288fbee4904\\n'
+    ...     b'parent 0102030405060708090a0b0c0d0e0f406080a0ff\\n'
+    ...     b'author A U Thor <a@example.com> 1300000000 +0200\\n'
+    ...     b'committer C O Mitter <c@example.com> 1300000001 +0200\\n'
+    ...     b'\\n'
+    ...     b'Message\\n')
+    >>> commit.tree
+    ObjectId('4b825dc642cb6eb9a060e54bf8d69288fbee4904')
+    >>> commit.parents
+    [ObjectId('0102030405060708090a0b0c0d0e0f406080a0ff')]
+    >>> commit.commit_time
+    1300000001
+    >>> CommitObject.from_contents(commit.get_contents()).get_contents() == (
+    ...     commit.get_contents())
+    True
+    """
+    def __init__(self, headers, message):
+        self.headers = headers
+        self.message = message
+
+    def get_object_type(self):
+        return b'commit'
+
+    def get_header(self, key):
+        """Get value of the first header with given key, or None."""
+        for (header_key, value) in self.headers:
+            if header_key == key:
+                return value
+        return None
+
+    @property
+    def tree(self):
+        """Object id of the tree of this commit."""
+        return ObjectId(astr(self.get_header(b'tree')))
+
+    @property
+    def parents(self):
+        """List of object ids of the parents of this commit."""
+        return [ObjectId(astr(value))
+                for (key, value) in self.headers if key == b'parent']
+
+    @property
+    def commit_time(self):
+        """Committer timestamp as seconds since the epoch."""
+        return int(self.get_header(b'committer').rsplit(b' ', 2)[1])
+
+    def iterate_contents(self):
+        for (key, value) in self.headers:
+            yield key + b' ' + value.replace(b'\n', b'\n ') + b'\n'
+        yield b'\n'
+        yield self.message
+
+    def pretty_str(self):
+        return astr(self.get_contents())
+
+    def get_named_links(self):
+        yield ('tree', self.tree)
+
+    @classmethod
+    def from_contents(cls, contents):
+        (header_data, message) = contents.split(b'\n\n', 1)
+        headers = []
+        for line in header_data.split(b'\n'):
+            if line.startswith(b' '):
+                (key, value) = headers.pop()
+                headers.append((key, value + b'\n' + line[1:]))
+            else:
+                (key, value) = line.split(b' ', 1)
+                headers.append((key, value))
+        return cls(headers, message)
 
 
 # class TagObject(GitObject):
@@ -339,7 +459,7 @@ class TreeObject(GitObject):
 GIT_OBJECT_TYPES = {
     'blob': BlobObject,
     'tree': TreeObject,
-    #'commit': CommitObject,
+    'commit': CommitObject,
     #'tag': TagObject,
     }
 
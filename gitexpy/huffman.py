@@ -1,6 +1,32 @@
+import heapq
 import math
+import random
+import time
 from collections import defaultdict
 from six.moves import xrange
+from .bitstring import BitWriter, reverse_bits
+from .errors import *
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# Symbol count from which encode_packed uses NumPy, when available
+NUMPY_THRESHOLD = 4096
+
+# Number of symbols packed at once by the NumPy encoder
+NUMPY_CHUNK_SIZE = 2**16
+
+# Longest code the NumPy encoder packs (in int64 arrays)
+NUMPY_MAX_LENGTH = 63
+
+# Longest code HuffmanTable decodes, since its table has 2**max_length
+# entries.  Longer codes can be avoided with length_limited_code_lengths.
+MAX_TABLE_LENGTH = 24
+
+class HuffmanCodeError(Error):
+    """Huffman Code Error"""
 
 def is_leaf(x):
     try:
@@ -12,8 +38,6 @@ class Node(object):
     def __init__(self):
         self.left_child = None
         self.right_child = None
-    def __hash__(self):
-        return hash((self.left_child, self.right_child))
 
 def dict_union(x, y):
     result = dict(x)
@@ -26,19 +50,121 @@ def make_huffman_codemap(symbols, freqs):
 
 def make_huffman_tree(symbols, freqs):
     assert len(symbols) >= 2
-    nodes = list(symbols)
-    freqs = dict(freqs)
-    while len(nodes) >= 2:
-        nodes.sort(key=lambda x: freqs[x])
-        n1 = nodes[0]
-        n2 = nodes[1]
+    # Heap items are (freq, order, node); order breaks ties so that
+    # the nodes themselves are never compared
+    heap = [(freqs[x], i, x) for (i, x) in enumerate(symbols)]
+    heapq.heapify(heap)
+    order = len(heap)
+    while len(heap) >= 2:
+        (f1, dummy, n1) = heapq.heappop(heap)
+        (f2, dummy, n2) = heapq.heappop(heap)
         newnode = Node()
         newnode.left_child = n1
         newnode.right_child = n2
-        freqs[newnode] = freqs[n1] + freqs[n2]
-        nodes = [newnode] + nodes[2:]
-    assert len(nodes) == 1
-    return nodes[0]
+        heapq.heappush(heap, (f1 + f2, order, newnode))
+        order += 1
+    return heap[0][2]
+
+def code_lengths(freqs, max_length=None):
+    """
+    Calculate Huffman code lengths for symbol frequencies.
+
+    The freqs is a list indexed by symbol.  Symbols with zero
+    frequency get length 0.  A single used symbol gets length 1.  If
+    max_length is given and the Huffman code is longer, an optimal
+    length limited code is calculated with package-merge.
+
+    >>> code_lengths([10, 1, 1, 0, 5])
+    [1, 3, 3, 0, 2]
+    >>> code_lengths([0, 3, 0])
+    [0, 1, 0]
+    >>> code_lengths([2**i for i in range(20)], 7)
+    [7, 7, 7, 7, 7, 7, 7, 7, 7, 7, 7, 7, 7, 7, 6, 5, 5, 4, 2, 1]
+    """
+    lengths = huffman_code_lengths(freqs)
+    if max_length is not None and lengths and max(lengths) > max_length:
+        return length_limited_code_lengths(freqs, max_length)
+    return lengths
+
+def huffman_code_lengths(freqs):
+    """
+    Calculate Huffman code lengths with a heap in O(n log n) time.
+
+    >>> huffman_code_lengths([1, 1, 2, 4])
+    [3, 3, 2, 1]
+    >>> huffman_code_lengths([])
+    []
+    """
+    lengths = len(freqs) * [0]
+    symbols = [s for s in xrange(len(freqs)) if freqs[s]]
+    if len(symbols) == 1:
+        lengths[symbols[0]] = 1
+    if len(symbols) <= 1:
+        return lengths
+    heap = [(freqs[s], s) for s in symbols]
+    heapq.heapify(heap)
+    parent = {}
+    next_id = len(freqs)
+    while len(heap) > 1:
+        (w1, n1) = heapq.heappop(heap)
+        (w2, n2) = heapq.heappop(heap)
+        parent[n1] = parent[n2] = next_id
+        heapq.heappush(heap, (w1 + w2, next_id))
+        next_id += 1
+    # Parents are created after their children, so depths can be
+    # calculated from the root down in reverse creation order
+    depth = {next_id - 1: 0}
+    for node in xrange(next_id - 2, len(freqs) - 1, -1):
+        depth[node] = depth[parent[node]] + 1
+    for s in symbols:
+        lengths[s] = depth[parent[s]] + 1
+    return lengths
+
+def length_limited_code_lengths(freqs, max_length):
+    """
+    Calculate optimal length limited code lengths with package-merge.
+
+    >>> length_limited_code_lengths([1, 1, 2, 4], 2)
+    [2, 2, 2, 2]
+    >>> length_limited_code_lengths([1, 1, 2, 4], 3)
+    [3, 3, 2, 1]
+    >>> length_limited_code_lengths([1, 2, 3], 1)
+    Traceback (most recent call last):
+        ...
+    ValueError: 3 symbols do not fit in codes of length 1
+    """
+    lengths = len(freqs) * [0]
+    symbols = [s for s in xrange(len(freqs)) if freqs[s]]
+    if len(symbols) == 1:
+        lengths[symbols[0]] = 1
+    if len(symbols) <= 1:
+        return lengths
+    if len(symbols) > 2**max_length:
+        raise ValueError('%d symbols do not fit in codes of length %d' % (
+            len(symbols), max_length))
+    # Items are (weight, node), where node is a symbol or a package
+    # (pair of nodes).  Sorting is stable, so leaves go before
+    # packages of equal weight.
+    leaves = sorted(((freqs[s], s) for s in symbols), key=item_weight)
+    items = leaves
+    for dummy in xrange(max_length - 1):
+        packages = [
+            (items[i][0] + items[i + 1][0], (items[i][1], items[i + 1][1]))
+            for i in xrange(0, len(items) - 1, 2)]
+        items = sorted(leaves + packages, key=item_weight)
+    # Each symbol's code length is the number of times it appears in
+    # the 2n-2 cheapest items
+    stack = [node for (weight, node) in items[:2 * len(symbols) - 2]]
+    while stack:
+        node = stack.pop()
+        if isinstance(node, tuple):
+            stack.extend(node)
+        else:
+            lengths[node] += 1
+    return lengths
+
+def item_weight(item):
+    return item[0]
 
 def nodes_to_codemap(node, prefix=''):
     if is_leaf(node):
@@ -74,6 +200,10 @@ def is_prefix_code(code):
     """
     Test if given code is a prefix code.
 
+    If some codeword is a prefix of another, it is also a prefix of
+    the codeword following it in sorted order, so only the adjacent
+    codewords need to be compared.
+
     >>> is_prefix_code(['a', 'b', 'ca'])
     True
     >>> is_prefix_code(['ab', 'a'])
@@ -85,9 +215,9 @@ def is_prefix_code(code):
     """
     if not code:
         return False # Empty set is not a prefix code
-    codewords = code
-    for (c1, c2) in unordered_pairs(codewords):
-        if c1.startswith(c2) or c2.startswith(c1):
+    codewords = sorted(code)
+    for i in xrange(len(codewords) - 1):
+        if codewords[i + 1].startswith(codewords[i]):
             return False
     return True
 
@@ -95,17 +225,199 @@ def encode_with_codemap(string, codemap):
     return ''.join(codemap[c] for c in string)
 
 def decode_with_codemap(string, codemap, align=False):
-    left = string
-    decoded = ''
-    while left:
-        for (sym, codeword) in codemap.items():
-            if left.startswith(codeword):
-                if align:
-                    decoded += (len(codeword) - 1) * '`'
-                decoded += sym
-                left = left[len(codeword):]
-                break
-    return decoded
+    codeword_to_sym = dict((cw, sym) for (sym, cw) in codemap.items())
+    decoded = []
+    start = 0
+    end = 1
+    while start < len(string):
+        if end > len(string):
+            raise HuffmanCodeError(
+                'Cannot decode symbol at offset %d' % start)
+        sym = codeword_to_sym.get(string[start:end])
+        if sym is None:
+            end += 1
+            continue
+        if align:
+            decoded.append((end - start - 1) * '`')
+        decoded.append(sym)
+        start = end
+        end = start + 1
+    return ''.join(decoded)
+
+def canonical_codes(lengths):
+    """
+    Return canonical Huffman codes as ints for given code lengths.
+
+    The codes are the same as in normalized_huffman_code.  Unused
+    symbols (length 0) get code 0.
+
+    Runs in O(n + max_length) time.  For oversubscribed lengths, some
+    codes do not fit in their lengths (see HuffmanTable).
+
+    >>> canonical_codes([2, 1, 3, 3])
+    [2, 0, 6, 7]
+    >>> canonical_codes([2, 1, 3, 3, 3])
+    [2, 0, 6, 7, 8]
+    """
+    max_length = max(lengths) if lengths else 0
+    bl_count = (max_length + 1) * [0]
+    for l in lengths:
+        bl_count[l] += 1
+    bl_count[0] = 0
+    next_code = (max_length + 1) * [0]
+    code = 0
+    for bits in xrange(1, max_length + 1):
+        code = (code + bl_count[bits - 1]) << 1
+        next_code[bits] = code
+    codes = len(lengths) * [0]
+    for (sym, l) in enumerate(lengths):
+        if l:
+            codes[sym] = next_code[l]
+            next_code[l] += 1
+    return codes
+
+class HuffmanTable(object):
+    """
+    Lookup table for decoding canonical Huffman codes in deflate bit order.
+
+    The table is indexed with the next max_length bits of input (first
+    bit as the least significant) and has (symbol, length) entries.
+    Entries of unused code space are None.  Codes longer than
+    MAX_TABLE_LENGTH bits are not supported.
+
+    >>> t = HuffmanTable([2, 1, 3, 3])
+    >>> [t.table[i] for i in range(8)]
+    [(1, 1), (0, 2), (1, 1), (2, 3), (1, 1), (0, 2), (1, 1), (3, 3)]
+    >>> HuffmanTable([2, 1, 3, 3, 3])  # doctest: +IGNORE_EXCEPTION_DETAIL
+    Traceback (most recent call last):
+        ...
+    HuffmanCodeError: Oversubscribed Huffman code
+    """
+    def __init__(self, lengths):
+        self.max_length = max(lengths) if lengths else 0
+        if self.max_length > MAX_TABLE_LENGTH:
+            raise HuffmanCodeError(
+                'Code length %d exceeds maximum %d of decoding table' % (
+                    self.max_length, MAX_TABLE_LENGTH))
+        self.table = (1 << self.max_length) * [None]
+        for (sym, code) in enumerate(canonical_codes(lengths)):
+            length = lengths[sym]
+            if not length:
+                continue
+            if code >> length:
+                raise HuffmanCodeError('Oversubscribed Huffman code')
+            entry = (sym, length)
+            rev = reverse_bits(code, length)
+            for high in xrange(0, 1 << self.max_length, 1 << length):
+                self.table[high | rev] = entry
+
+def encode_packed(symbols, lengths, writer=None):
+    """
+    Encode symbols with canonical Huffman code of given code lengths.
+
+    The codes are packed to bytes in deflate bit order with BitWriter.
+    Long NumPy arrays are packed with encode_packed_numpy, if NumPy is
+    available.  Returns the writer.
+
+    >>> w = encode_packed([1, 0, 2, 3, 1], [2, 1, 3, 3])
+    >>> (w.tell(), list(bytearray(w.getvalue())))
+    (10, [218, 1])
+    """
+    if writer is None:
+        if (numpy is not None and isinstance(symbols, numpy.ndarray) and
+                len(symbols) >= NUMPY_THRESHOLD and
+                max(lengths) <= NUMPY_MAX_LENGTH):
+            return encode_packed_numpy(symbols, lengths)
+        writer = BitWriter()
+    rev_codes = [
+        reverse_bits(code, length)
+        for (code, length) in zip(canonical_codes(lengths), lengths)]
+    write = writer.write
+    for sym in symbols:
+        write(rev_codes[sym], lengths[sym])
+    return writer
+
+def encode_packed_numpy(symbols, lengths, chunk_size=NUMPY_CHUNK_SIZE):
+    """
+    Encode array of symbols with NumPy.
+
+    Produces the same result as encode_packed, but packs a chunk of
+    symbols at a time with array operations.  Codes may be at most
+    NUMPY_MAX_LENGTH bits long.
+
+    >>> w = encode_packed_numpy(numpy.array([1, 0, 2, 3, 1]), [2, 1, 3, 3])
+    >>> (w.tell(), list(bytearray(w.getvalue())))
+    (10, [218, 1])
+    """
+    # The transient arrays have an entry per output bit, so they are
+    # kept small (int32 unless the codes need more bits, chunks of
+    # NUMPY_CHUNK_SIZE symbols) to stay in the cache
+    max_length = max(lengths) if lengths else 0
+    if max_length > NUMPY_MAX_LENGTH:
+        raise HuffmanCodeError('Code length %d too long for NumPy' % (
+            max_length,))
+    code_type = numpy.int32 if max_length <= 31 else numpy.int64
+    lengths_arr = numpy.array(lengths, dtype=numpy.int32)
+    rev_codes = numpy.array([
+        reverse_bits(code, length)
+        for (code, length) in zip(canonical_codes(lengths), lengths)],
+        dtype=code_type)
+    writer = BitWriter()
+    leftover = numpy.zeros(0, dtype=numpy.uint8)
+    symbols = numpy.asarray(symbols)
+    for start in xrange(0, len(symbols), chunk_size):
+        chunk = symbols[start:start + chunk_size]
+        sym_lengths = lengths_arr[chunk]
+        total = int(sym_lengths.sum())
+        starts = numpy.cumsum(sym_lengths, dtype=numpy.int32) - sym_lengths
+        # Bit k of each code goes to position start + k
+        bit_index = numpy.arange(total, dtype=numpy.int32)
+        bit_index -= numpy.repeat(starts, sym_lengths)
+        bits = numpy.repeat(rev_codes[chunk], sym_lengths)
+        bits >>= bit_index
+        bits &= 1
+        bits = bits.astype(numpy.uint8)
+        bits = numpy.concatenate([leftover, bits])
+        full = len(bits) - len(bits) % 8
+        writer.write_bytes(
+            numpy.packbits(bits[:full], bitorder='little').tobytes())
+        leftover = bits[full:]
+    for bit in leftover:
+        writer.write(int(bit), 1)
+    return writer
+
+def decode_packed(data, lengths, count):
+    """
+    Decode count symbols encoded with encode_packed.
+
+    >>> decode_packed(bytearray([218, 1]), [2, 1, 3, 3], 5)
+    [1, 0, 2, 3, 1]
+    """
+    table = HuffmanTable(lengths)
+    entries = table.table
+    max_length = table.max_length
+    mask = (1 << max_length) - 1
+    data = bytearray(data)
+    result = []
+    append = result.append
+    bitbuf = 0
+    bitcount = 0
+    pos = 0
+    for dummy in xrange(count):
+        while bitcount < max_length and pos < len(data):
+            bitbuf |= data[pos] << bitcount
+            bitcount += 8
+            pos += 1
+        entry = entries[bitbuf & mask]
+        if entry is None or entry[1] > bitcount:
+            raise HuffmanCodeError(
+                'Cannot decode symbol at bit offset %d' % (
+                    8 * pos - bitcount))
+        (sym, length) = entry
+        append(sym)
+        bitbuf >>= length
+        bitcount -= length
+    return result
 
 def entropy(symbol_frequencies):
     totalfreq = float(sum(symbol_frequencies.values()))
@@ -156,38 +468,58 @@ def is_normalized_codemap(codemap):
     """
     if not is_prefix_codemap(codemap):
         return False # (i) fails
-    for (x1, cw1) in codemap.items():
-        for (x2, cw2) in codemap.items():
-            if len(cw1) < len (cw2):
-                if cw1 > cw2:
-                    return False # (ii) fails
-            elif len(cw1) == len(cw2):
-                if x1 < x2:
-                    if cw1 > cw2:
-                        return False # (iii) fails
+    # Both (ii) and (iii) hold if the codewords are in lexicographical
+    # order when ordered by length and symbol
+    items = sorted(codemap.items(), key=lambda x: (len(x[1]), x[0]))
+    for i in xrange(len(items) - 1):
+        if items[i][1] > items[i + 1][1]:
+            return False # (ii) or (iii) fails
     return True
 
 def normalized_huffman_code(lengths):
-    def binary(x, n):
-        if n == 0:
-            return ''
-        return '{x:0{n}b}'.format(x=x, n=n)
-    n = len(lengths)
-    def l(i):
-        return lengths[i-1]
-    def c(k):
-        return sum(1 for i in range(1, n+1) if l(i) == k)
-    def f(l):
-        return sum(2**(l-i)*c(i) for i in range(1, l))
-    assert f(0) == 0
-    assert f(1) == 0
-    assert f(2) == 2 * c(1)
-    def s(k):
-        return sum(1 for i in range(1, k) if l(i) == l(k))
-    assert s(0) == 0
-    assert s(1) == 0
-    def t(i):
-        return f(l(i)) + s(i)
-    def phi(i):
-        return binary(t(i), l(i))
-    return tuple(phi(i) for i in range(1,n+1))
+    """
+    Return codewords of the normalized Huffman code for given lengths.
+
+    >>> normalized_huffman_code([2, 1, 3, 3, 0])
+    ('10', '0', '110', '111', '')
+    """
+    return tuple(
+        '{x:0{n}b}'.format(x=code, n=length) if length else ''
+        for (code, length) in zip(canonical_codes(lengths), lengths))
+
+def random_frequencies(n, rnd=random):
+    """
+    Generate Zipf-like symbol frequencies with some unused symbols.
+    """
+    freqs = [int(10000 / (1 + rnd.random() * i)) for i in xrange(n)]
+    for dummy in xrange(n // 10):
+        freqs[rnd.randrange(n)] = 0
+    rnd.shuffle(freqs)
+    return freqs
+
+def speed_compare(rounds=2000, alphabet_size=286, max_length=15):
+    """
+    Compare speed of the code construction methods.
+    """
+    rnd = random.Random(32)
+    inputs = [random_frequencies(alphabet_size, rnd) for dummy in xrange(20)]
+    def tree_lengths(freqs):
+        symbols = [s for s in xrange(len(freqs)) if freqs[s]]
+        codemap = make_huffman_codemap(symbols, freqs)
+        return [len(codemap.get(s, '')) for s in xrange(len(freqs))]
+    methods = [
+        ('make_huffman_codemap', tree_lengths),
+        ('huffman_code_lengths', huffman_code_lengths),
+        ('length_limited_code_lengths',
+         lambda freqs: length_limited_code_lengths(freqs, max_length)),
+        ]
+    for (name, method) in methods:
+        t = time.time()
+        for i in xrange(rounds):
+            method(inputs[i % len(inputs)])
+        t = time.time() - t
+        print('%-35s %4d builds took %8.4f s = %8.2f us/build' % (
+            name, rounds, t, 1000000.0 * t / rounds))
+
+if __name__ == '__main__':
+    speed_compare()
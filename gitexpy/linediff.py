@@ -0,0 +1,309 @@
+"""
+Line oriented diff with unified output.
+
+The lines are interned to integers, so that the LCS is calculated on
+lists of integers and comparing two lines is cheap.  An interner can
+be shared by many diffs, e.g. by all files of a commit.
+"""
+
+from six.moves import xrange
+from .diff import common_prefix_length, common_suffix_length, lcs_xa
+
+DEFAULT_CONTEXT = 3
+
+DEFAULT_MAX_GREEDY_D = 64
+
+NO_NEWLINE = '\\ No newline at end of file\n'
+
+class LineInterner(object):
+    """
+    Mapping of lines to integers.
+
+    >>> interner = LineInterner()
+    >>> interner.intern(['a\\n', 'b\\n', 'a\\n'])
+    [0, 1, 0]
+    >>> interner.intern(['b\\n', 'c\\n'])
+    [1, 2]
+    >>> len(interner)
+    3
+    """
+    def __init__(self):
+        self.ids = {}
+    def __len__(self):
+        return len(self.ids)
+    def intern(self, lines):
+        ids = self.ids
+        return [ids.setdefault(line, len(ids)) for line in lines]
+
+def split_lines(text):
+    """
+    Split text to lines, keeping the line ends.
+
+    >>> split_lines('a\\nb\\n\\nc')
+    ['a\\n', 'b\\n', '\\n', 'c']
+    """
+    return text.splitlines(True)
+
+def matching_blocks(a_lines, b_lines, interner=None, max_cost=None):
+    """
+    Get matching blocks of two lists of lines.
+
+    Returns list of triples (i, j, n), meaning that a_lines[i:i+n] ==
+    b_lines[j:j+n].  The last triple is (len(a_lines), len(b_lines), 0).
+
+    >>> matching_blocks(['a', 'b', 'c', 'd'], ['a', 'c', 'd', 'e'])
+    [(0, 0, 1), (2, 1, 2), (4, 4, 0)]
+    """
+    (n, m) = (len(a_lines), len(b_lines))
+    # Only the lines between the common prefix and suffix are interned
+    # and diffed, since usually just a small part of a file is changed
+    prefix = common_prefix_length(a_lines, 0, n, b_lines, 0, m)
+    suffix = common_suffix_length(a_lines, prefix, n, b_lines, prefix, m)
+    if interner is None:
+        interner = LineInterner()
+    a = interner.intern(a_lines[prefix:n-suffix])
+    b = interner.intern(b_lines[prefix:m-suffix])
+    # Lines found from only one of the files cannot match, so they are
+    # dropped before calculating the LCS like LibXDiff does
+    (a_index, b_index) = (common_line_indices(a, b), common_line_indices(b, a))
+    lcs = lcs_xa([a[i] for i in a_index], [b[j] for j in b_index], max_cost)
+    blocks = []
+    (bi, bj, size) = (0, 0, prefix)
+    for (i, j) in ((prefix + a_index[i], prefix + b_index[j])
+                   for (i, j) in lcs):
+        if i == bi + size and j == bj + size:
+            size += 1
+        else:
+            if size:
+                blocks.append((bi, bj, size))
+            (bi, bj, size) = (i, j, 1)
+    if size:
+        blocks.append((bi, bj, size))
+    if suffix:
+        if blocks and blocks[-1][0] + blocks[-1][2] == n - suffix and (
+                blocks[-1][1] + blocks[-1][2] == m - suffix):
+            (bi, bj, size) = blocks.pop()
+            blocks.append((bi, bj, size + suffix))
+        else:
+            blocks.append((n - suffix, m - suffix, suffix))
+    blocks.append((n, m, 0))
+    return blocks
+
+def myers_blocks(a, b, max_d=DEFAULT_MAX_GREEDY_D):
+    """
+    Get matching blocks of a and b with the greedy Myers algorithm.
+
+    The diagonals are followed with common_prefix_length, which
+    compares slices instead of single lines, so this is fast for files
+    with few changes, but gives up and returns None if more than max_d
+    lines are inserted or deleted.  Returns same as matching_blocks.
+
+    >>> myers_blocks(['a', 'b', 'c', 'd'], ['a', 'c', 'd', 'e'])
+    [(0, 0, 1), (2, 1, 2), (4, 4, 0)]
+    >>> myers_blocks(['a', 'b'], ['c', 'd'], max_d=3) is None
+    True
+    """
+    (n, m) = (len(a), len(b))
+    offset = max_d + 1
+    v = [0] * (2 * max_d + 3)
+    # Copies of v after each d, for tracing the path back
+    trace = []
+    for d in xrange(max_d + 1):
+        for k in xrange(-d, d + 1, 2):
+            if k == -d or (k != d and v[offset + k - 1] < v[offset + k + 1]):
+                x = v[offset + k + 1]
+            else:
+                x = v[offset + k - 1] + 1
+            x += common_prefix_length(a, x, n, b, x - k, m)
+            v[offset + k] = x
+            if x >= n and x - k >= m:
+                return trace_blocks(trace, offset, n, m)
+        trace.append(v[:])
+    return None
+
+def trace_blocks(trace, offset, n, m):
+    blocks = []
+    (x, y) = (n, m)
+    for d in xrange(len(trace), 0, -1):
+        v = trace[d - 1]
+        k = x - y
+        if k == -d or (k != d and v[offset + k - 1] < v[offset + k + 1]):
+            prev_k = k + 1
+            snake_x = v[offset + prev_k]
+        else:
+            prev_k = k - 1
+            snake_x = v[offset + prev_k] + 1
+        if x > snake_x:
+            blocks.append((snake_x, snake_x - k, x - snake_x))
+        x = v[offset + prev_k]
+        y = x - prev_k
+    if x:
+        blocks.append((0, 0, x))
+    blocks.reverse()
+    blocks.append((n, m, 0))
+    return blocks
+
+def line_blocks(a_lines, b_lines, interner=None):
+    """
+    Get matching blocks of lines, trying myers_blocks first.
+
+    >>> line_blocks(['a', 'b', 'c'], ['a', 'c'])
+    [(0, 0, 1), (2, 1, 1), (3, 2, 0)]
+    """
+    blocks = myers_blocks(a_lines, b_lines)
+    if blocks is None:
+        blocks = matching_blocks(a_lines, b_lines, interner)
+    return blocks
+
+def common_line_indices(a, b):
+    """
+    Get indices of the lines of a which are also in b.
+
+    >>> common_line_indices([1, 2, 3, 2], [2, 4, 1])
+    [0, 1, 3]
+    """
+    b_lines = set(b)
+    return [i for (i, line) in enumerate(a) if line in b_lines]
+
+def opcodes(blocks):
+    """
+    Convert matching blocks to difflib style opcodes.
+
+    >>> for op in opcodes([(0, 0, 1), (2, 1, 2), (4, 4, 0)]): print(op)
+    ('equal', 0, 1, 0, 1)
+    ('delete', 1, 2, 1, 1)
+    ('equal', 2, 4, 1, 3)
+    ('insert', 4, 4, 3, 4)
+    """
+    (i, j) = (0, 0)
+    for (bi, bj, size) in blocks:
+        if i < bi and j < bj:
+            yield ('replace', i, bi, j, bj)
+        elif i < bi:
+            yield ('delete', i, bi, j, bj)
+        elif j < bj:
+            yield ('insert', i, bi, j, bj)
+        if size:
+            yield ('equal', bi, bi + size, bj, bj + size)
+        (i, j) = (bi + size, bj + size)
+
+def grouped_opcodes(ops, context=DEFAULT_CONTEXT):
+    """
+    Group opcodes to hunks with context lines around the changes.
+
+    The equal ranges are cut to context lines at the start and end of
+    hunks and the hunks are split at equal ranges longer than
+    2 * context.  Yields list of opcodes for each hunk.
+    """
+    ops = list(ops)
+    if not ops:
+        return
+    (tag, i1, i2, j1, j2) = ops[0]
+    if tag == 'equal':
+        ops[0] = (tag, max(i1, i2 - context), i2, max(j1, j2 - context), j2)
+    (tag, i1, i2, j1, j2) = ops[-1]
+    if tag == 'equal':
+        ops[-1] = (tag, i1, min(i2, i1 + context), j1, min(j2, j1 + context))
+    group = []
+    for (tag, i1, i2, j1, j2) in ops:
+        if tag == 'equal' and i2 - i1 > 2 * context:
+            group.append((tag, i1, i1 + context, j1, j1 + context))
+            yield group
+            group = []
+            (i1, j1) = (i2 - context, j2 - context)
+        group.append((tag, i1, i2, j1, j2))
+    if not (len(group) == 1 and group[0][0] == 'equal'):
+        yield group
+
+def format_range(start, stop):
+    """
+    Format line range of a hunk header.
+
+    >>> (format_range(3, 4), format_range(3, 7), format_range(3, 3))
+    ('4', '4,4', '3,0')
+    """
+    length = stop - start
+    if length == 1:
+        return '%d' % (start + 1)
+    if not length:
+        return '%d,0' % start
+    return '%d,%d' % (start + 1, length)
+
+def unified_diff(a_lines, b_lines, fromfile='a', tofile='b',
+                 context=DEFAULT_CONTEXT, interner=None, max_cost=None):
+    """
+    Yield lines of unified diff of two lists of lines.
+
+    The lines should include their line ends, see split_lines.
+
+    >>> a = split_lines('1\\n2\\n3\\n4\\n5\\n6\\n7\\n8\\n9\\n')
+    >>> b = split_lines('1\\n2\\nthree\\n4\\n5\\n6\\n7\\n8\\n9\\n10')
+    >>> print(''.join(unified_diff(a, b, context=1)).rstrip())
+    --- a
+    +++ b
+    @@ -2,3 +2,3 @@
+     2
+    -3
+    +three
+     4
+    @@ -9 +9,2 @@
+     9
+    +10
+    \\ No newline at end of file
+    """
+    blocks = matching_blocks(a_lines, b_lines, interner, max_cost)
+    started = False
+    for group in grouped_opcodes(opcodes(blocks), context):
+        if not started:
+            started = True
+            yield '--- %s\n' % fromfile
+            yield '+++ %s\n' % tofile
+        (first, last) = (group[0], group[-1])
+        yield '@@ -%s +%s @@\n' % (
+            format_range(first[1], last[2]), format_range(first[3], last[4]))
+        for (tag, i1, i2, j1, j2) in group:
+            if tag == 'equal':
+                for line in hunk_lines(' ', a_lines, i1, i2):
+                    yield line
+                continue
+            for line in hunk_lines('-', a_lines, i1, i2):
+                yield line
+            for line in hunk_lines('+', b_lines, j1, j2):
+                yield line
+
+def hunk_lines(prefix, lines, start, stop):
+    for line in lines[start:stop]:
+        yield prefix + line
+        if not line.endswith('\n'):
+            yield '\n' + NO_NEWLINE
+
+def diff_texts(a, b, fromfile='a', tofile='b', context=DEFAULT_CONTEXT,
+               interner=None, max_cost=None):
+    """
+    Get unified diff of two texts as a string.
+    """
+    return ''.join(unified_diff(
+        split_lines(a), split_lines(b), fromfile, tofile, context,
+        interner, max_cost))
+
+def main(sys):
+    """
+    Show unified diff of two files.
+
+    Usage: linediff FILE1 FILE2 [CONTEXT]
+    """
+    try:
+        (file1, file2) = sys.argv[1:3]
+        context = int(sys.argv[3]) if len(sys.argv) > 3 else DEFAULT_CONTEXT
+    except Exception:
+        print(main.__doc__.split('\n\n', 1)[1].rstrip())
+        sys.exit(1)
+    with open(file1) as f:
+        a = f.read()
+    with open(file2) as f:
+        b = f.read()
+    sys.stdout.write(diff_texts(a, b, file1, file2, context))
+
+if __name__ == '__main__':
+    import sys
+    main(sys)
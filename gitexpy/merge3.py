@@ -0,0 +1,348 @@
+"""
+Three-way merge of lines with conflict markers.
+
+The base is diffed once against ours and once against theirs, and the
+changed hunks of both diffs are merged in one pass in the order of
+the base.  Hunks changed on only one side are taken from that side,
+and hunks changed identically on both sides are taken once.  Hunks
+that overlap or touch, but differ, are conflicts.
+
+Trees are merged path by path like Git does.  Paths whose object ids
+are equal on both sides or equal to the base are resolved without
+reading the blobs, and the remaining content merges can be run in a
+pool of worker processes.
+"""
+
+import multiprocessing
+from .git_object_model import (
+    SUBMODULE_MODE, TREE_MODE, ObjectId, get_git_object_by_id, tree_entries)
+from .linediff import line_blocks, split_lines
+
+MARKER_SIZE = 7
+
+# Statuses of PathMerge
+TAKEN = 'taken'
+MERGED = 'merged'
+CONFLICT = 'conflict'
+DELETED = 'deleted'
+
+class MergeResult(object):
+    """
+    Merged lines and the number of conflicts in them.
+    """
+    def __init__(self, lines, conflicts=0):
+        self.lines = lines
+        self.conflicts = conflicts
+    def __repr__(self):
+        return '<%s lines=%d conflicts=%d>' % (
+            self.__class__.__name__, len(self.lines), self.conflicts)
+
+def merge3(base, ours, theirs, ours_label='ours', theirs_label='theirs',
+           base_label=None):
+    """
+    Merge changes from base to ours and from base to theirs.
+
+    The arguments are lists of lines (str or bytes, with their line
+    ends).  Conflicts are marked like Git does, and with base_label
+    the base lines of conflicts are shown too, like in diff3 style.
+
+    >>> base = ['a\\n', 'b\\n', 'c\\n', 'd\\n']
+    >>> merge3(base, ['a\\n', 'B\\n', 'c\\n', 'd\\n'],
+    ...        ['a\\n', 'b\\n', 'c\\n', 'D\\n']).lines
+    ['a\\n', 'B\\n', 'c\\n', 'D\\n']
+    >>> result = merge3(base, ['a\\n', 'X\\n', 'c\\n', 'd\\n'],
+    ...                 ['a\\n', 'Y\\n', 'c\\n', 'd\\n'])
+    >>> result.lines[1:6]
+    ['<<<<<<< ours\\n', 'X\\n', '=======\\n', 'Y\\n', '>>>>>>> theirs\\n']
+    >>> result.conflicts
+    1
+    """
+    if ours == theirs or theirs == base:
+        return MergeResult(list(ours))
+    if ours == base:
+        return MergeResult(list(theirs))
+    ours_hunks = change_hunks(line_blocks(base, ours))
+    theirs_hunks = change_hunks(line_blocks(base, theirs))
+    lines = []
+    conflicts = 0
+    pos = 0
+    for (start, end, ours_part, theirs_part) in merge_hunks(
+            ours_hunks, theirs_hunks):
+        lines.extend(base[pos:start])
+        pos = end
+        if ours_part is None:
+            lines.extend(theirs[theirs_part[0]:theirs_part[1]])
+            continue
+        ours_lines = ours[ours_part[0]:ours_part[1]]
+        if theirs_part is None:
+            lines.extend(ours_lines)
+            continue
+        theirs_lines = theirs[theirs_part[0]:theirs_part[1]]
+        if ours_lines == theirs_lines:
+            lines.extend(ours_lines)
+            continue
+        conflicts += 1
+        sample = (ours_lines or theirs_lines or base)[0]
+        add_section(lines, '<', ours_label, ours_lines, sample)
+        if base_label is not None:
+            add_section(lines, '|', base_label, base[start:end], sample)
+        add_section(lines, '=', None, theirs_lines, sample)
+        lines.append(marker('>', theirs_label, sample))
+    lines.extend(base[pos:])
+    return MergeResult(lines, conflicts)
+
+def change_hunks(blocks):
+    """
+    Convert matching blocks to hunks of changes.
+
+    Returns list of (base start, base end, start, end) for each range
+    of the base replaced by a range of the other side.
+
+    >>> change_hunks([(0, 0, 1), (2, 1, 2), (4, 4, 0)])
+    [(1, 2, 1, 1), (4, 4, 3, 4)]
+    """
+    hunks = []
+    (i, j) = (0, 0)
+    for (block_i, block_j, size) in blocks:
+        if block_i > i or block_j > j:
+            hunks.append((i, block_i, j, block_j))
+        (i, j) = (block_i + size, block_j + size)
+    return hunks
+
+def merge_hunks(ours_hunks, theirs_hunks):
+    """
+    Group hunks of both sides to regions of the base.
+
+    Hunks of different sides which overlap or touch are joined to the
+    same region.  Yields (base start, base end, ours range, theirs
+    range) for each region, where the ranges are (start, end) pairs of
+    the region in the side, or None if the side did not change it.
+
+    >>> list(merge_hunks([(1, 2, 1, 3)], [(2, 3, 2, 2), (5, 5, 4, 6)]))
+    [(1, 3, (1, 4), (1, 2)), (5, 5, None, (4, 6))]
+    """
+    (i, j) = (0, 0)
+    while i < len(ours_hunks) or j < len(theirs_hunks):
+        if j == len(theirs_hunks) or (
+                i < len(ours_hunks) and ours_hunks[i][0] <= theirs_hunks[j][0]):
+            (start, end) = ours_hunks[i][:2]
+        else:
+            (start, end) = theirs_hunks[j][:2]
+        (i0, j0) = (i, j)
+        while True:
+            if i < len(ours_hunks) and ours_hunks[i][0] <= end:
+                end = max(end, ours_hunks[i][1])
+                i += 1
+            elif j < len(theirs_hunks) and theirs_hunks[j][0] <= end:
+                end = max(end, theirs_hunks[j][1])
+                j += 1
+            else:
+                break
+        yield (start, end, side_range(ours_hunks[i0:i], start, end),
+               side_range(theirs_hunks[j0:j], start, end))
+
+def side_range(hunks, start, end):
+    if not hunks:
+        return None
+    (first, last) = (hunks[0], hunks[-1])
+    return (first[2] - (first[0] - start), last[3] + (end - last[1]))
+
+def to_type_of(text, sample):
+    return text.encode('utf-8') if isinstance(sample, bytes) else text
+
+def marker(char, label, sample):
+    return to_type_of(
+        char * MARKER_SIZE + (' ' + label if label else '') + '\n', sample)
+
+def add_section(lines, char, label, section, sample):
+    lines.append(marker(char, label, sample))
+    lines.extend(section)
+    # The marker after a last line without line end needs a new line
+    newline = to_type_of('\n', sample)
+    if section and not section[-1].endswith(newline):
+        lines[-1] += newline
+
+def merge3_texts(base, ours, theirs, ours_label='ours',
+                 theirs_label='theirs', base_label=None):
+    """
+    Merge texts and return (merged text, number of conflicts).
+    """
+    result = merge3(split_lines(base), split_lines(ours), split_lines(theirs),
+                    ours_label, theirs_label, base_label)
+    return (base[:0].join(result.lines), result.conflicts)
+
+class PathMerge(object):
+    """
+    Result of merging a path of trees.
+
+    Status is TAKEN if the blob oid of one side was taken as is,
+    DELETED if the path was deleted, MERGED if the contents were merged
+    cleanly and CONFLICT otherwise.  The lines are the merged contents,
+    which for conflicts of contents include the conflict markers.
+    """
+    def __init__(self, path, status, mode=None, oid=None, lines=None,
+                 conflicts=0):
+        self.path = path
+        self.status = status
+        self.mode = mode
+        self.oid = oid
+        self.lines = lines
+        self.conflicts = conflicts
+    def __repr__(self):
+        return '<%s %s %s conflicts=%d>' % (
+            self.__class__.__name__, self.path.decode('utf-8', 'replace'),
+            self.status, self.conflicts)
+
+def changed_entries(get, base, ours, theirs, prefix=b''):
+    """
+    Get blob entries of paths which differ between the three trees.
+
+    Returns dictionary of path to list of (mode, oid) or None for the
+    base, ours and theirs.  Subtrees with equal oids on both sides or
+    equal to the base are not read.
+    """
+    def oid_bytes(entry):
+        return entry and (entry[0], entry[1].bytes)
+    trees = [dict((name, (mode, oid)) for (mode, name, oid)
+                  in (get(tree).entries if tree else ()))
+             for tree in (base, ours, theirs)]
+    result = {}
+    for name in sorted(set().union(*trees)):
+        (b, o, t) = [tree.get(name) for tree in trees]
+        (kb, ko, kt) = [oid_bytes(entry) for entry in (b, o, t)]
+        if ko == kt or kb == ko or kb == kt:
+            continue
+        if any(entry and entry[0] == TREE_MODE for entry in (b, o, t)):
+            def subtree(entry):
+                return entry[1] if entry and entry[0] == TREE_MODE else None
+            result.update(changed_entries(
+                get, subtree(b), subtree(o), subtree(t),
+                prefix + name + b'/'))
+            for (k, entry) in enumerate((b, o, t)):
+                if entry and entry[0] != TREE_MODE:
+                    result.setdefault(prefix + name, [None] * 3)[k] = entry
+            continue
+        result[prefix + name] = [b, o, t]
+    return result
+
+def merge_job(job):
+    (path, mode, base, ours, theirs) = job
+    result = merge3(split_lines(base), split_lines(ours), split_lines(theirs))
+    return (path, mode, result)
+
+def merge_trees(base, ours, theirs, get_object=get_git_object_by_id,
+                workers=None, include_taken=False):
+    """
+    Merge three trees given by oids and return list of PathMerges.
+
+    Paths where one side can be taken as is (or which are deleted) are
+    resolved by oids; they are included in the result only if
+    include_taken is true.  The
+    blobs are read in this process and their contents merged in a
+    pool of worker processes, or in this process if workers is 1.
+    """
+    def get(oid):
+        return get_object(str(oid))
+    (base, ours, theirs) = [
+        ObjectId(oid) if oid is not None else None
+        for oid in (base, ours, theirs)]
+    changed = changed_entries(get, base, ours, theirs)
+    results = []
+    if include_taken:
+        (b, o, t) = [tree_entries(get, tree) for tree in (base, ours, theirs)]
+        for path in set(b).union(o, t).difference(changed):
+            # Unchanged paths are equal on one side and in the base
+            (kb, ko) = [entry and (entry[0], entry[1].bytes)
+                        for entry in (b.get(path), o.get(path))]
+            entry = t.get(path) if ko == kb else o.get(path)
+            if entry is not None:
+                results.append(PathMerge(path, TAKEN, entry[0], entry[1]))
+            else:
+                results.append(PathMerge(path, DELETED))
+    jobs = []
+    for (path, (b, o, t)) in sorted(changed.items()):
+        if o is None and t is None:
+            results.append(PathMerge(path, DELETED))
+        elif o is None or t is None:
+            if b is None:
+                (mode, oid) = o or t
+                results.append(PathMerge(path, TAKEN, mode, oid))
+            else:
+                # Modified on one side and deleted on the other
+                results.append(PathMerge(path, CONFLICT, conflicts=1))
+        elif SUBMODULE_MODE in (o[0], t[0]) or (
+                o[0] != t[0] and (b is None or b[0] not in (o[0], t[0]))):
+            results.append(PathMerge(path, CONFLICT, conflicts=1))
+        else:
+            mode = o[0] if b is None or o[0] != b[0] else t[0]
+            base_data = get(b[1]).contents if b is not None else b''
+            jobs.append((path, mode, base_data, get(o[1]).contents,
+                         get(t[1]).contents))
+    if workers == 1 or len(jobs) < 2:
+        merged = map(merge_job, jobs)
+        pool = None
+    else:
+        pool = multiprocessing.Pool(workers)
+        merged = pool.imap_unordered(merge_job, jobs)
+    try:
+        for (path, mode, result) in merged:
+            results.append(PathMerge(
+                path, CONFLICT if result.conflicts else MERGED, mode,
+                lines=result.lines, conflicts=result.conflicts))
+        if pool:
+            pool.close()
+    except:
+        if pool:
+            pool.terminate()
+        raise
+    finally:
+        if pool:
+            pool.join()
+    results.sort(key=lambda result: result.path)
+    return results
+
+def main(sys):
+    """
+    Merge files or trees.
+
+    Usage: merge3 BASE OURS THEIRS
+           merge3 --trees BASE_TREE OURS_TREE THEIRS_TREE [WORKERS]
+
+    Writes the merged file to stdout, or the merge status of each
+    changed path of the trees.  Exits with status 1 if there were
+    conflicts.
+    """
+    try:
+        args = sys.argv[1:]
+        trees = args[0] == '--trees'
+        if trees:
+            args.pop(0)
+        (base, ours, theirs) = args[:3]
+        workers = int(args[3]) if trees and len(args) > 3 else None
+        if len(args) > (4 if trees else 3):
+            raise Exception('Too many arguments')
+    except Exception:
+        print(main.__doc__.split('\n\n', 1)[1].rstrip())
+        sys.exit(2)
+    if trees:
+        results = merge_trees(base, ours, theirs, workers=workers)
+        for result in results:
+            print('%-8s %s' % (
+                result.status, result.path.decode('utf-8', 'replace')))
+        conflicts = sum(result.conflicts for result in results)
+    else:
+        data = []
+        for path in (base, ours, theirs):
+            with open(path, 'rb') as f:
+                data.append(f.read())
+        (text, conflicts) = merge3_texts(
+            data[0], data[1], data[2], ours, theirs)
+        try:
+            sys.stdout.buffer.write(text)
+        except AttributeError:
+            sys.stdout.write(text)
+    sys.exit(1 if conflicts else 0)
+
+if __name__ == '__main__':
+    import sys
+    main(sys)
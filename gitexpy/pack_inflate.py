@@ -0,0 +1,189 @@
+"""
+Inflate pack objects in parallel with the pure Python decoder.
+
+The objects of a pack are decoded with zlibstream in a pool of worker
+processes.  Each worker maps the pack file to memory by itself, so the
+tasks contain only the offsets of the zlib streams and the results are
+the DeflateStats of the streams.  When only the aggregated statistics
+are needed, each worker merges the stats of a chunk of objects and
+returns one DeflateStats per chunk.
+"""
+
+import mmap
+import multiprocessing
+import zlib
+from six import BytesIO
+from . import pack
+from . import zlibstream
+from .deflate import DeflateStats
+
+DEFAULT_CHUNKSIZE = 8
+
+# Number of objects whose stats a worker merges to one result
+DEFAULT_STATS_CHUNKSIZE = 256
+
+class OutputCounter(object):
+    """
+    Output stream which only counts the written bytes.
+
+    If recompress_level is given, the data is also compressed with
+    zlib at that level and the compressed size is counted.
+    """
+    def __init__(self, recompress_level=None):
+        self.size = 0
+        self.recompressed_size = None
+        self.compressor = None
+        if recompress_level is not None:
+            self.compressor = zlib.compressobj(recompress_level)
+            self.recompressed_size = 0
+    def write(self, data):
+        self.size += len(data)
+        if self.compressor:
+            self.recompressed_size += len(
+                self.compressor.compress(bytes(data)))
+    def close(self):
+        if self.compressor:
+            self.recompressed_size += len(self.compressor.flush())
+            self.compressor = None
+
+class ObjectStats(object):
+    """
+    Deflate statistics of a single pack object.
+    """
+    def __init__(self, offset, type, size, compressed_size, stats,
+                 recompressed_size=None):
+        self.offset = offset
+        self.type = type
+        self.size = size
+        self.compressed_size = compressed_size
+        self.stats = stats
+        self.recompressed_size = recompressed_size
+    @property
+    def type_name(self):
+        return pack.object_types.get(self.type, 'type=%d' % self.type)
+    def __repr__(self):
+        return '<%s %s offset=%d size=%d blocks=%d>' % (
+            self.__class__.__name__, self.type_name, self.offset,
+            self.size, len(self.stats.blockstats))
+
+worker_pack_data = None
+
+def init_worker(filename):
+    global worker_pack_data
+    f = open(filename, 'rb')
+    worker_pack_data = mmap.mmap(f.fileno(), length=0, access=mmap.ACCESS_READ)
+
+def worker_task(function_and_task):
+    (function, task) = function_and_task
+    return function(worker_pack_data, task)
+
+def inflate_task(data, task):
+    return inflate_object(data, *task)
+
+def inflate_chunk_stats(data, tasks):
+    """Inflate objects of tasks and return their merged DeflateStats."""
+    total = DeflateStats(None)
+    for task in tasks:
+        total.merge(inflate_object(data, *task).stats)
+    return total
+
+def inflate_object(data, offset, type, start, end, recompress_level=None):
+    out = OutputCounter(recompress_level)
+    stats = zlibstream.parse(BytesIO(data[start:end]), out, None)
+    out.close()
+    return ObjectStats(
+        offset, type, out.size, end - start, stats, out.recompressed_size)
+
+def iterate_tasks(packfile, recompress_level=None):
+    for obj in packfile:
+        yield (obj.offset, obj.type, obj.start, obj.end, recompress_level)
+
+def iterate_chunks(iterable, size):
+    """
+    Split iterable to lists of size items.
+
+    >>> list(iterate_chunks(range(5), 2))
+    [[0, 1], [2, 3], [4]]
+    """
+    chunk = []
+    for item in iterable:
+        chunk.append(item)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+def map_pack(packfile, function, tasks, processes=None,
+             chunksize=DEFAULT_CHUNKSIZE):
+    """
+    Yield function(pack data, task) for each task in order.
+
+    The function is run in a pool of worker processes, or in this
+    process if processes is 1.
+    """
+    if processes == 1:
+        for task in tasks:
+            yield function(packfile.data, task)
+        return
+    pool = multiprocessing.Pool(
+        processes, init_worker, (packfile.filename,))
+    try:
+        for result in pool.imap(
+                worker_task, ((function, task) for task in tasks), chunksize):
+            yield result
+        pool.close()
+    except:
+        pool.terminate()
+        raise
+    finally:
+        pool.join()
+
+def inflate_pack(packfile, processes=None, chunksize=DEFAULT_CHUNKSIZE,
+                 recompress_level=None):
+    """
+    Inflate all objects of packfile and yield their ObjectStats.
+
+    The results are yielded in pack order.  If processes is 1, the
+    objects are inflated in this process.  If recompress_level is
+    given, the size of the data recompressed with zlib at that level
+    is stored to the results too.
+    """
+    return map_pack(packfile, inflate_task,
+                    iterate_tasks(packfile, recompress_level),
+                    processes, chunksize)
+
+def inflate_pack_stats(packfile, processes=None,
+                       chunksize=DEFAULT_STATS_CHUNKSIZE):
+    """
+    Inflate all objects of packfile and return aggregated DeflateStats.
+
+    The stats of each chunk of chunksize objects are merged in the
+    worker, so only one DeflateStats per chunk is passed back.
+    """
+    total = DeflateStats(None)
+    chunks = iterate_chunks(iterate_tasks(packfile), chunksize)
+    for stats in map_pack(packfile, inflate_chunk_stats, chunks, processes,
+                          chunksize=1):
+        total.merge(stats)
+    return total
+
+def main(sys):
+    """
+    Inflate all objects of a pack and print deflate statistics.
+
+    Usage: pack_inflate PACKFILE [PROCESSES]
+    """
+    try:
+        filename = sys.argv[1]
+        processes = int(sys.argv[2]) if len(sys.argv) > 2 else None
+    except Exception:
+        print(main.__doc__.split('\n\n', 1)[1].rstrip())
+        sys.exit(1)
+    stats = inflate_pack_stats(pack.Packfile(filename), processes)
+    for (name, value) in sorted(stats.totals().items()):
+        print('%-35s= %s' % (name, value))
+
+if __name__ == '__main__':
+    import sys
+    main(sys)
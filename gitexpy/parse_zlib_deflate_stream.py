@@ -21,7 +21,7 @@ def main(sys):
         stats.sort_stats('cumulative')
         stats.print_stats()
     else:
-        zlibstream.parse(stream)
+        zlibstream.parse(stream, container=zlibstream.CONTAINER_AUTO)
 
 if __name__ == '__main__':
     import sys
@@ -0,0 +1,271 @@
+"""
+Rename and copy detection for tree diffs.
+
+Diffing every deleted file against every added one takes time
+proportional to the number of pairs times the file size.  Instead the
+source files are split to content-defined chunks (see blockify.py),
+and an inverted index from chunk hash to the sources containing it
+gives for each added file the sources sharing chunks with it, scored
+by the number of shared bytes.  Only the best candidates are
+confirmed with a line diff.
+
+Similarity is the number of bytes in matching lines divided by the
+size of the larger file, like in Git.  Files with equal object ids are
+paired without reading them.
+"""
+
+from __future__ import division
+
+from collections import Counter
+from .blockify import blockify, sha1
+from .git_object_model import (
+    SUBMODULE_MODE, ObjectId, get_git_object_by_id, tree_entries)
+from .linediff import line_blocks, split_lines
+
+DEFAULT_THRESHOLD = 0.5
+DEFAULT_MAX_CANDIDATES = 10
+
+# Chunk sizes for blockify, small enough to survive edits in typical
+# source files
+CHUNK_AVG_SIZE = 64
+CHUNK_MIN_SIZE = 16
+CHUNK_MAX_SIZE = 512
+
+# Statuses of Rename
+RENAMED = 'renamed'
+COPIED = 'copied'
+
+class Rename(object):
+    """
+    Pair of old and new path with their similarity.
+    """
+    def __init__(self, old_path, new_path, similarity, status=RENAMED):
+        self.old_path = old_path
+        self.new_path = new_path
+        self.similarity = similarity
+        self.status = status
+    def __repr__(self):
+        return '<%s %s %r -> %r %.2f>' % (
+            self.__class__.__name__, self.status, self.old_path,
+            self.new_path, self.similarity)
+
+class RenameStats(object):
+    """
+    Number of exact matches, possible pairs and confirming diffs.
+
+    Pairs counts the inexact pairs a pairwise search would diff.
+    """
+    def __init__(self):
+        self.exact = 0
+        self.pairs = 0
+        self.diffs = 0
+    def __repr__(self):
+        return '<%s exact=%d pairs=%d diffs=%d>' % (
+            self.__class__.__name__, self.exact, self.pairs, self.diffs)
+
+def chunk_counts(data):
+    """
+    Get Counter of chunk hash to number of occurrences in data.
+
+    Returns also a dictionary of chunk hash to chunk size.
+    """
+    counts = Counter()
+    sizes = {}
+    for chunk in blockify([data], CHUNK_AVG_SIZE, CHUNK_MIN_SIZE,
+                          CHUNK_MAX_SIZE):
+        key = sha1(chunk)
+        counts[key] += 1
+        sizes[key] = len(chunk)
+    return (counts, sizes)
+
+class SimilarityIndex(object):
+    """
+    Inverted index from chunk hash to the sources containing it.
+
+    >>> index = SimilarityIndex()
+    >>> text = b''.join(b'line %d of the file\\n' % k for k in range(40))
+    >>> index.add('old', text)
+    >>> index.add('other', b'something else entirely\\n' * 20)
+    >>> index.candidates(text.replace(b'line 3 ', b'LINE 3 '))[0][1]
+    'old'
+    """
+    def __init__(self):
+        self.sources = {}
+        self.chunks = {}
+    def __len__(self):
+        return len(self.sources)
+    def add(self, key, data):
+        counts = chunk_counts(data)[0]
+        self.sources[key] = len(data)
+        for (chunk, count) in counts.items():
+            self.chunks.setdefault(chunk, []).append((key, count))
+    def shared_bytes(self, data):
+        """Get dictionary of source key to bytes in chunks shared with data."""
+        (counts, sizes) = chunk_counts(data)
+        shared = {}
+        for (chunk, count) in counts.items():
+            for (key, source_count) in self.chunks.get(chunk, ()):
+                shared[key] = shared.get(key, 0) + (
+                    min(count, source_count) * sizes[chunk])
+        return shared
+    def candidates(self, data, limit=DEFAULT_MAX_CANDIDATES, threshold=0.0):
+        """
+        Get list of (estimated similarity, source key) for data.
+
+        The list is sorted by descending estimate and has at most
+        limit sources.  Sources whose size alone makes the similarity
+        lower than threshold are left out.
+        """
+        size = len(data)
+        result = []
+        for (key, shared) in self.shared_bytes(data).items():
+            larger = max(size, self.sources[key])
+            if min(size, self.sources[key]) < threshold * larger:
+                continue
+            result.append((shared / larger, key))
+        result.sort(key=lambda item: (-item[0], item[1]))
+        return result[:limit]
+
+def similarity(old, new):
+    """
+    Get the fraction of bytes in matching lines of old and new data.
+
+    >>> similarity(b'a\\nb\\nc\\nd\\n', b'a\\nb\\nx\\nd\\n')
+    0.75
+    """
+    larger = max(len(old), len(new))
+    if not larger:
+        return 1.0
+    old_lines = split_lines(old)
+    matched = sum(len(line)
+                  for (i, j, n) in line_blocks(old_lines, split_lines(new))
+                  for line in old_lines[i:i + n])
+    return matched / larger
+
+def detect_renames(deleted, added, load, sources=None,
+                   threshold=DEFAULT_THRESHOLD,
+                   max_candidates=DEFAULT_MAX_CANDIDATES, stats=None):
+    """
+    Pair added paths with deleted ones (and other sources).
+
+    Deleted, added and sources are dictionaries of path to object id.
+    Sources are unchanged paths that can be copied from.  Load is
+    called with an object id to get its contents.  Returns list of
+    Renames sorted by new path.  Each deleted path is renamed at most
+    once.  If sources is given, other pairs of the same deleted path
+    are copies, otherwise (like git diff -M) they are left out.
+    """
+    if stats is None:
+        stats = RenameStats()
+    find_copies = sources is not None
+    sources = dict(sources or {})
+    sources.update(deleted)
+    by_oid = {}
+    for (path, oid) in sorted(sources.items()):
+        by_oid.setdefault(ObjectId(oid).bytes, []).append(path)
+    pairs = []
+    inexact = []
+    for (path, oid) in sorted(added.items()):
+        same = by_oid.get(ObjectId(oid).bytes)
+        if same:
+            # Prefer a deleted path to an unchanged one
+            old = min(same, key=lambda old: (old not in deleted, old))
+            pairs.append((1.0, old, path))
+            stats.exact += 1
+        else:
+            inexact.append(path)
+    if inexact and sources:
+        contents = {}
+        def get(oid):
+            key = ObjectId(oid).bytes
+            if key not in contents:
+                contents[key] = load(oid)
+            return contents[key]
+        index = SimilarityIndex()
+        for (path, oid) in sorted(sources.items()):
+            if len(get(oid)):
+                index.add(path, get(oid))
+        for path in inexact:
+            data = get(added[path])
+            if not data:
+                continue
+            stats.pairs += len(index)
+            for (estimate, old) in index.candidates(
+                    data, max_candidates, threshold):
+                stats.diffs += 1
+                score = similarity(get(sources[old]), data)
+                if score >= threshold:
+                    pairs.append((score, old, path))
+    pairs.sort(key=lambda pair: (-pair[0], pair[1], pair[2]))
+    renamed = set()
+    result = {}
+    for (score, old, new) in pairs:
+        if new in result:
+            continue
+        if old in deleted and old not in renamed:
+            renamed.add(old)
+            status = RENAMED
+        elif find_copies:
+            status = COPIED
+        else:
+            continue
+        result[new] = Rename(old, new, score, status)
+    return [result[new] for new in sorted(result)]
+
+def tree_renames(old_tree, new_tree, get_object=get_git_object_by_id,
+                 find_copies=False, threshold=DEFAULT_THRESHOLD,
+                 max_candidates=DEFAULT_MAX_CANDIDATES, stats=None):
+    """
+    Detect renames (and copies) between two trees given by oids.
+
+    With find_copies all paths of the old tree are sources of copies,
+    otherwise only the deleted paths are.
+    """
+    def get(oid):
+        return get_object(str(oid))
+    (old, new) = [
+        dict((path, oid) for (path, (mode, oid))
+             in tree_entries(get, ObjectId(tree)).items()
+             if mode != SUBMODULE_MODE)
+        for tree in (old_tree, new_tree)]
+    deleted = dict((path, oid) for (path, oid) in old.items()
+                   if path not in new)
+    added = dict((path, oid) for (path, oid) in new.items()
+                 if path not in old)
+    sources = old if find_copies else None
+    return detect_renames(deleted, added, lambda oid: get(oid).contents,
+                          sources, threshold, max_candidates, stats)
+
+def main(sys):
+    """
+    Show renamed and copied files between two trees.
+
+    Usage: renames [-C] [-t THRESHOLD] OLD_TREE NEW_TREE
+
+    Option -C finds copies from all files of the old tree.
+    """
+    try:
+        args = sys.argv[1:]
+        find_copies = '-C' in args
+        if find_copies:
+            args.remove('-C')
+        threshold = DEFAULT_THRESHOLD
+        if args[0] == '-t':
+            threshold = float(args[1])
+            args = args[2:]
+        (old_tree, new_tree) = args
+    except Exception:
+        print(main.__doc__.split('\n\n', 1)[1].rstrip())
+        sys.exit(1)
+    stats = RenameStats()
+    for rename in tree_renames(old_tree, new_tree, find_copies=find_copies,
+                               threshold=threshold, stats=stats):
+        print('%s%03d %s -> %s' % (
+            rename.status[0].upper(), int(rename.similarity * 100),
+            rename.old_path.decode('utf-8', 'replace'),
+            rename.new_path.decode('utf-8', 'replace')))
+    sys.stderr.write('%r\n' % stats)
+
+if __name__ == '__main__':
+    import sys
+    main(sys)
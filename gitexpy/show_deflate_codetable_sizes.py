@@ -1,5 +1,8 @@
+import csv
+import json
 import os
 import re
+from collections import OrderedDict
 from . import zlibstream
 
 rx_codes_offset = re.compile('^BLOCK\[[0-9]+\]: codes_start_offset=([0-9]+)$')
@@ -17,7 +20,164 @@ class InfoStream(object):
                 codes_size = codes_stop - self.codes_start
                 print(codes_size)
 
+report_fields = [
+    'objects',
+    'uncompressed_bytes',
+    'compressed_bytes',
+    'ratio',
+    'stored_blocks',
+    'fixed_blocks',
+    'dynamic_blocks',
+    'header_bits',
+    'codes_bits',
+    'data_bits',
+    'recompressible_objects',
+    'recompression_savings_bytes',
+    ]
+
+flagged_fields = [
+    'offset',
+    'type',
+    'compressed_bytes',
+    'recompressed_bytes',
+    'savings_bytes',
+    ]
+
+class PackCompressionReport(object):
+    """
+    Streaming aggregator of deflate statistics per object type.
+
+    Only the totals are kept, so the memory usage does not depend on
+    the number of objects.  The objects which would get smaller by
+    recompression are written as CSV rows to flagged_stream, if
+    given, as they are added.
+
+    >>> from .pack_inflate import inflate_object
+    >>> import zlib
+    >>> data = zlib.compress(b'abc' * 100)
+    >>> report = PackCompressionReport()
+    >>> report.add(inflate_object(data, 0, 3, 0, len(data), 9))
+    >>> rows = report.rows()
+    >>> [(r['type'], r['objects'], r['uncompressed_bytes']) for r in rows]
+    [('blob', 1, 300), ('total', 1, 300)]
+    """
+    def __init__(self, flagged_stream=None):
+        self.totals = OrderedDict()
+        self.flagged_writer = None
+        if flagged_stream is not None:
+            self.flagged_writer = csv.writer(
+                flagged_stream, lineterminator='\n')
+            self.flagged_writer.writerow(flagged_fields)
+    def add(self, result):
+        """Add ObjectStats of a pack object."""
+        totals = self.get_totals(result.type_name)
+        stats_totals = result.stats.totals()
+        totals['objects'] += 1
+        totals['uncompressed_bytes'] += result.size
+        totals['compressed_bytes'] += result.compressed_size
+        totals['stored_blocks'] += stats_totals['type 1 blocks']
+        totals['fixed_blocks'] += stats_totals['type 2 blocks']
+        totals['dynamic_blocks'] += stats_totals['type 3 blocks']
+        totals['header_bits'] += stats_totals['overhead size']
+        totals['codes_bits'] += stats_totals['codes size']
+        totals['data_bits'] += stats_totals['data size']
+        if result.recompressed_size is not None:
+            savings = result.compressed_size - result.recompressed_size
+            if savings > 0:
+                totals['recompressible_objects'] += 1
+                totals['recompression_savings_bytes'] += savings
+                if self.flagged_writer:
+                    self.flagged_writer.writerow([
+                        result.offset, result.type_name,
+                        result.compressed_size, result.recompressed_size,
+                        savings])
+    def get_totals(self, type_name):
+        if type_name not in self.totals:
+            self.totals[type_name] = OrderedDict(
+                (field, 0) for field in report_fields if field != 'ratio')
+        return self.totals[type_name]
+    def rows(self):
+        """Return list of result rows, one per type and a total row."""
+        rows = []
+        grand_total = OrderedDict(
+            (field, 0) for field in report_fields if field != 'ratio')
+        for (type_name, totals) in sorted(self.totals.items()):
+            rows.append(make_row(type_name, totals))
+            for (field, value) in totals.items():
+                grand_total[field] += value
+        rows.append(make_row('total', grand_total))
+        return rows
+    def write_csv(self, out_stream):
+        writer = csv.writer(out_stream, lineterminator='\n')
+        writer.writerow(['type'] + report_fields)
+        for row in self.rows():
+            writer.writerow(list(row.values()))
+    def write_json(self, out_stream):
+        json.dump(self.rows(), out_stream, indent=2)
+        out_stream.write('\n')
+
+def make_row(type_name, totals):
+    row = OrderedDict([('type', type_name)])
+    for field in report_fields:
+        if field == 'ratio':
+            row[field] = (
+                round(float(totals['uncompressed_bytes']) /
+                      totals['compressed_bytes'], 4)
+                if totals['compressed_bytes'] else None)
+        else:
+            row[field] = totals[field]
+    return row
+
+def report_pack(filename, out_stream, output_format='csv', processes=None,
+                recompress_level=9, flagged_stream=None):
+    from .pack import Packfile
+    from .pack_inflate import inflate_pack
+    report = PackCompressionReport(flagged_stream)
+    packfile = Packfile(filename)
+    for result in inflate_pack(
+            packfile, processes, recompress_level=recompress_level):
+        report.add(result)
+    if output_format == 'json':
+        report.write_json(out_stream)
+    else:
+        report.write_csv(out_stream)
+
 def main(sys):
+    """
+    Show code table sizes of a zlib stream or a compression report of a pack.
+
+    Usage: show_deflate_codetable_sizes < ZFILE
+           show_deflate_codetable_sizes pack [--json] [--flagged CSVFILE]
+                                        PACKFILE [PROCESSES]
+
+    With --flagged, the objects which would get smaller when
+    recompressed are written to CSVFILE.
+    """
+    if len(sys.argv) > 1:
+        try:
+            args = sys.argv[1:]
+            if args.pop(0) != 'pack':
+                raise Exception('Unknown cmd')
+            output_format = 'csv'
+            if args[0] == '--json':
+                output_format = 'json'
+                args.pop(0)
+            flagged = None
+            if args[0] == '--flagged':
+                flagged = args[1]
+                args = args[2:]
+            filename = args[0]
+            processes = int(args[1]) if len(args) > 1 else None
+        except Exception:
+            print(main.__doc__.split('\n\n', 1)[1].rstrip())
+            sys.exit(1)
+        if flagged is None:
+            report_pack(filename, sys.stdout, output_format, processes)
+            return
+        with open(flagged, 'w') as flagged_stream:
+            report_pack(filename, sys.stdout, output_format, processes,
+                        flagged_stream=flagged_stream)
+        return
     devnull = open(os.devnull, 'wb')
     try:
         sys.stdin = sys.stdin.detach()
@@ -0,0 +1,237 @@
+"""
+Streaming byte statistics for sizing compression of large inputs.
+
+The input is read in chunks (from a stream, a file or an mmap) and
+byte histograms of order 0 (single bytes) and order 1 (byte pairs) are
+collected.  From those the entropies and the expected cost of a
+Huffman code are calculated per chunk and for the whole input.
+
+NumPy is used for counting when available.  Without it the order-0
+histogram is counted with bytes.count per byte value.
+"""
+
+import math
+import mmap
+from collections import Counter
+from six.moves import xrange
+from .huffman import code_lengths
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+DEFAULT_CHUNK_SIZE = 2**24
+
+MAX_CODE_LENGTH = 15
+
+single_bytes = [bytes(bytearray([value])) for value in xrange(256)]
+
+class ByteHistogram(object):
+    """
+    Order-0 and order-1 byte histogram.
+
+    >>> h = ByteHistogram()
+    >>> h.update(b'abab')
+    >>> h.update(b'a')
+    >>> counts = h.count_list()
+    >>> (h.total, counts[ord('a')], counts[ord('b')])
+    (5, 3, 2)
+    >>> h.pair_count(ord('b'), ord('a'))
+    2
+    >>> round(h.entropy(), 4)
+    0.971
+    >>> h.conditional_entropy()
+    0.0
+    """
+    def __init__(self, use_numpy=True):
+        self.use_numpy = use_numpy and numpy is not None
+        self.total = 0
+        self.last = None
+        if self.use_numpy:
+            self.counts = numpy.zeros(256, dtype=numpy.int64)
+            self.pairs = numpy.zeros(256 * 256, dtype=numpy.int64)
+        else:
+            self.counts = 256 * [0]
+            self.pairs = Counter()
+    def update(self, chunk):
+        """Add bytes of chunk, continuing from the previous chunk."""
+        if not len(chunk):
+            return
+        if self.use_numpy:
+            self.update_numpy(chunk)
+        else:
+            self.update_python(bytes(chunk))
+        self.total += len(chunk)
+    def update_numpy(self, chunk):
+        data = numpy.frombuffer(chunk, dtype=numpy.uint8)
+        self.counts += numpy.bincount(data, minlength=256)
+        pair_index = data[:-1].astype(numpy.int64) * 256 + data[1:]
+        self.pairs += numpy.bincount(pair_index, minlength=256 * 256)
+        if self.last is not None:
+            self.pairs[self.last * 256 + int(data[0])] += 1
+        self.last = int(data[-1])
+    def update_python(self, chunk):
+        for (value, byte) in enumerate(single_bytes):
+            self.counts[value] += chunk.count(byte)
+        data = bytearray(chunk)
+        self.pairs.update(zip(data[:-1], data[1:]))
+        if self.last is not None:
+            self.pairs[(self.last, data[0])] += 1
+        self.last = data[-1]
+    def pair_count(self, first, second):
+        if self.use_numpy:
+            return int(self.pairs[first * 256 + second])
+        return self.pairs[(first, second)]
+    def count_list(self):
+        return [int(x) for x in self.counts]
+    def pair_rows(self):
+        """Yield list of 256 counts of the following bytes for each byte."""
+        if self.use_numpy:
+            for row in self.pairs.reshape(256, 256):
+                yield row
+        else:
+            rows = [256 * [0] for dummy in xrange(256)]
+            for ((first, second), count) in self.pairs.items():
+                rows[first][second] = count
+            for row in rows:
+                yield row
+    def entropy(self):
+        """Order-0 entropy in bits per byte."""
+        return entropy(self.counts)
+    def conditional_entropy(self):
+        """Order-1 entropy (of a byte given the previous) in bits per byte."""
+        total = 0
+        bits = 0.0
+        for row in self.pair_rows():
+            row_total = int(sum(row))
+            if row_total:
+                bits += row_total * entropy(row)
+                total += row_total
+        return bits / total if total else 0.0
+    def huffman_cost(self, max_length=MAX_CODE_LENGTH):
+        """Cost of the data coded with an order-0 Huffman code in bits."""
+        counts = self.count_list()
+        lengths = code_lengths(counts, max_length)
+        return sum(c * l for (c, l) in zip(counts, lengths))
+    def summary(self):
+        cost = self.huffman_cost()
+        return {
+            'bytes': self.total,
+            'entropy': self.entropy(),
+            'conditional_entropy': self.conditional_entropy(),
+            'huffman_bits': cost,
+            'huffman_bits_per_byte':
+                float(cost) / self.total if self.total else 0.0,
+            }
+
+def entropy(counts):
+    """
+    Entropy of a distribution given as counts, in bits per symbol.
+
+    >>> entropy([1, 1, 2, 0])
+    1.5
+    """
+    if numpy is not None and isinstance(counts, numpy.ndarray):
+        counts = counts[counts > 0].astype(numpy.float64)
+        total = counts.sum()
+        if not total:
+            return 0.0
+        probs = counts / total
+        return float(-(probs * numpy.log2(probs)).sum())
+    total = float(sum(counts))
+    s = 0.0
+    for count in counts:
+        if count:
+            prob = count / total
+            s -= prob * math.log(prob, 2)
+    return s
+
+def iterate_chunks(source, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Iterate chunks of a stream or a buffer (e.g. bytes or mmap).
+    """
+    if hasattr(source, 'read'):
+        while True:
+            chunk = source.read(chunk_size)
+            if not chunk:
+                break
+            yield chunk
+    else:
+        for start in xrange(0, len(source), chunk_size):
+            yield source[start:start + chunk_size]
+
+def iterate_file_chunks(filename, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Iterate chunks of a file mapped to memory.
+    """
+    with open(filename, 'rb') as f:
+        try:
+            data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:  # empty file cannot be mapped
+            return
+        try:
+            for chunk in iterate_chunks(data, chunk_size):
+                yield chunk
+        finally:
+            data.close()
+
+def analyze(source, chunk_size=DEFAULT_CHUNK_SIZE, use_numpy=True):
+    """
+    Analyze the chunks of source, a stream or a buffer.
+
+    Yields (chunk number, summary dict) for each chunk and finally
+    ('total', summary dict) for the whole input.
+
+    >>> results = list(analyze(b'abcd' * 100, chunk_size=100))
+    >>> [(name, s['bytes'], s['entropy']) for (name, s) in results]
+    [(0, 100, 2.0), (1, 100, 2.0), (2, 100, 2.0), (3, 100, 2.0), \
+('total', 400, 2.0)]
+    >>> total = results[-1][1]
+    >>> (total['conditional_entropy'], total['huffman_bits'])
+    (0.0, 800)
+    """
+    return analyze_chunks(iterate_chunks(source, chunk_size), use_numpy)
+
+def analyze_file(filename, chunk_size=DEFAULT_CHUNK_SIZE, use_numpy=True):
+    """
+    Analyze the chunks of a file like analyze.
+    """
+    return analyze_chunks(
+        iterate_file_chunks(filename, chunk_size), use_numpy)
+
+def analyze_chunks(chunks, use_numpy=True):
+    overall = ByteHistogram(use_numpy)
+    for (i, chunk) in enumerate(chunks):
+        histogram = ByteHistogram(use_numpy)
+        histogram.update(chunk)
+        overall.update(chunk)
+        yield (i, histogram.summary())
+    yield ('total', overall.summary())
+
+def main(sys):
+    """
+    Show byte statistics of files per chunk and overall.
+
+    Usage: symbol_stats FILE [CHUNK_SIZE]
+    """
+    try:
+        filename = sys.argv[1]
+        chunk_size = int(sys.argv[2]) if len(sys.argv) > 2 else (
+            DEFAULT_CHUNK_SIZE)
+    except Exception:
+        print(main.__doc__.split('\n\n', 1)[1].rstrip())
+        sys.exit(1)
+    fields = ['bytes', 'entropy', 'conditional_entropy', 'huffman_bits',
+              'huffman_bits_per_byte']
+    print('%-8s %s' % ('chunk', ' '.join('%22s' % f for f in fields)))
+    for (name, summary) in analyze_file(filename, chunk_size):
+        print('%-8s %s' % (name, ' '.join(
+            '%22s' % (
+                '%.6f' % summary[f] if isinstance(summary[f], float)
+                else summary[f])
+            for f in fields)))
+
+if __name__ == '__main__':
+    import sys
+    main(sys)
@@ -0,0 +1,215 @@
+import random
+from nose.tools import *
+
+from .blame import *
+from .diff_cache import DiffCache
+from .git_object_model import BlobObject, CommitObject, FileMode, TreeObject
+from .linediff import myers_blocks
+
+class Repository(object):
+    """
+    Git objects in memory.
+    """
+    def __init__(self):
+        self.objects = {}
+        self.time = 1000000000
+    def add(self, obj):
+        oid = obj.get_object_id()
+        self.objects[str(oid)] = obj
+        return oid
+    def get(self, oid):
+        return self.objects[oid]
+    def commit(self, files, parents=()):
+        """Add commit of dictionary files of path to lines."""
+        tree = self.add_tree(dict(
+            (tuple(path.split('/')), ''.join(lines).encode('utf-8'))
+            for (path, lines) in files.items()))
+        self.time += 1
+        headers = [(b'tree', str(tree).encode('ascii'))]
+        headers.extend((b'parent', str(parent).encode('ascii'))
+                       for parent in parents)
+        signature = ('A U Thor <a@example.com> %d +0000' % self.time)
+        headers.append((b'author', signature.encode('ascii')))
+        headers.append((b'committer', signature.encode('ascii')))
+        return self.add(CommitObject(headers, b'Commit\n'))
+    def add_tree(self, files):
+        entries = []
+        subtrees = {}
+        for (parts, data) in files.items():
+            if len(parts) > 1:
+                subtrees.setdefault(parts[0], {})[parts[1:]] = data
+            else:
+                entries.append((FileMode(b'100644'), parts[0].encode('utf-8'),
+                                self.add(BlobObject(data))))
+        for (name, subfiles) in subtrees.items():
+            entries.append((FileMode(b'40000'), name.encode('utf-8'),
+                            self.add_tree(subfiles)))
+        return self.add(TreeObject(sorted(entries, key=lambda e: e[1])))
+
+def blame_lines(entries):
+    result = []
+    for entry in entries:
+        eq_(entry.start, len(result))
+        result.extend([str(entry.commit)] * entry.length)
+    return result
+
+def reference_blame(history):
+    """Blame of linear history of line lists with per-line lists."""
+    (commit, lines) = history[-1]
+    final_lines = list(range(len(lines)))
+    result = [None] * len(lines)
+    for ((commit, lines), (parent, parent_lines)) in zip(
+            reversed(history), reversed(history[:-1])):
+        mapped = [None] * len(parent_lines)
+        blocks = line_blocks(parent_lines, lines, None)
+        for (i, j, n) in blocks:
+            for k in range(n):
+                mapped[i + k] = final_lines[j + k]
+        for final in set(final_lines) - set(mapped) - set([None]):
+            result[final] = str(commit)
+        final_lines = mapped
+    for final in final_lines:
+        if final is not None:
+            result[final] = str(history[0][0])
+    return result
+
+def random_edit(lines, count, rnd, tag):
+    lines = list(lines)
+    for k in range(count):
+        p = rnd.randrange(len(lines) + 1)
+        r = rnd.random()
+        if r < 0.3 and p < len(lines):
+            del lines[p]
+        elif r < 0.6 or p == len(lines):
+            lines.insert(p, '%s %d\n' % (tag, k))
+        else:
+            lines[p] = '%s changed %d\n' % (tag, k)
+    return lines
+
+def test_linear_history():
+    def check(seed, edits):
+        rnd = random.Random(seed)
+        repo = Repository()
+        lines = ['line %d\n' % rnd.randrange(20) for dummy in range(50)]
+        history = []
+        parents = ()
+        for c in range(15):
+            lines = random_edit(lines, edits, rnd, 'c%d' % c)
+            commit = repo.commit({'dir/file.txt': lines}, parents)
+            history.append((commit, [line.encode('utf-8') for line in lines]))
+            parents = (commit,)
+        entries = blame(str(commit), 'dir/file.txt', repo.get)
+        eq_(blame_lines(entries), reference_blame(history))
+    for seed in range(5):
+        for edits in (1, 3, 10):
+            yield (check, seed, edits)
+
+def test_cache():
+    rnd = random.Random(47)
+    repo = Repository()
+    lines = ['line %d\n' % k for k in range(30)]
+    commit = repo.commit({'f': lines})
+    for c in range(8):
+        lines = random_edit(lines, 3, rnd, 'c%d' % c)
+        commit = repo.commit({'f': lines}, [commit])
+    cache = DiffCache()
+    stats = BlameStats()
+    expected = blame_lines(blame(commit, 'f', repo.get))
+    eq_(blame_lines(blame(commit, 'f', repo.get, stats, cache)), expected)
+    eq_((stats.diffs, stats.cached, cache.hits), (8, 0, 0))
+    eq_(len(cache), 8)
+    stats = BlameStats()
+    eq_(blame_lines(blame(commit, 'f', repo.get, stats, cache)), expected)
+    eq_((stats.diffs, stats.cached, cache.hits), (0, 8, 8))
+
+def test_unchanged_file():
+    repo = Repository()
+    first = repo.commit({'a': ['1\n', '2\n'], 'b': ['x\n']})
+    second = repo.commit({'a': ['1\n', '2\n'], 'b': ['y\n']}, [first])
+    third = repo.commit({'a': ['1\n', '2\n', '3\n'], 'b': ['y\n']}, [second])
+    stats = BlameStats()
+    entries = blame(third, 'a', repo.get, stats)
+    eq_(blame_lines(entries), [str(first)] * 2 + [str(third)])
+    eq_((stats.commits, stats.diffs, stats.unchanged), (3, 1, 1))
+    eq_([(e.start, e.length, e.orig_start) for e in entries],
+        [(0, 2, 0), (2, 1, 2)])
+
+def test_stops_when_all_attributed():
+    repo = Repository()
+    commit = repo.commit({'a': ['old\n']})
+    for k in range(10):
+        commit = repo.commit({'a': ['old %d\n' % k]}, [commit])
+    top = repo.commit({'a': ['new\n']}, [commit])
+    stats = BlameStats()
+    eq_(blame_lines(blame(top, 'a', repo.get, stats)), [str(top)])
+    eq_((stats.commits, stats.diffs), (1, 1))
+
+def test_added_file():
+    repo = Repository()
+    first = repo.commit({'a': ['1\n']})
+    second = repo.commit({'a': ['1\n'], 'b': ['2\n', '3\n']}, [first])
+    third = repo.commit({'a': ['1\n'], 'b': ['2\n', '4\n', '3\n']}, [second])
+    eq_(blame_lines(blame(third, 'b', repo.get)),
+        [str(second), str(third), str(second)])
+    assert_raises(PathNotFound, blame, third, 'c', repo.get)
+    assert_raises(PathNotFound, blame, first, 'b', repo.get)
+
+def test_merge():
+    repo = Repository()
+    base_lines = ['%d\n' % k for k in range(10)]
+    base = repo.commit({'f': base_lines})
+    left = repo.commit({'f': ['top\n'] + base_lines}, [base])
+    right = repo.commit({'f': base_lines + ['bottom\n']}, [base])
+    merged_lines = ['top\n'] + base_lines + ['bottom\n', 'merge\n']
+    merge = repo.commit({'f': merged_lines}, [left, right])
+    stats = BlameStats()
+    eq_(blame_lines(blame(merge, 'f', repo.get, stats)),
+        [str(left)] + [str(base)] * 10 + [str(right), str(merge)])
+    eq_(stats.commits, 4)
+
+def test_empty_file():
+    repo = Repository()
+    commit = repo.commit({'a': []})
+    eq_(blame(commit, 'a', repo.get), [])
+
+def test_line_blocks_fallback():
+    a = ['%d\n' % k for k in range(100)]
+    b = a[::-1]
+    eq_(myers_blocks(a, b), None)
+    blocks = line_blocks(a, b, None)
+    eq_(sum(n for (i, j, n) in blocks), 1)
+    eq_(blocks[-1], (100, 100, 0))
+
+def test_map_ranges():
+    rnd = random.Random(48)
+    def check(ranges, blocks):
+        parent_line = {}
+        for (i, j, n) in blocks:
+            for k in range(n):
+                parent_line[j + k] = i + k
+        (passed, remaining) = map_ranges(ranges, blocks)
+        expected_passed = []
+        expected_remaining = []
+        for (start, length, final) in ranges:
+            for k in range(length):
+                if start + k in parent_line:
+                    expected_passed.append((parent_line[start + k], final + k))
+                else:
+                    expected_remaining.append((start + k, final + k))
+        def expand(ranges):
+            return [(start + k, final + k)
+                    for (start, length, final) in ranges
+                    for k in range(length)]
+        eq_(expand(passed), expected_passed)
+        eq_(expand(remaining), expected_remaining)
+    for dummy in range(30):
+        a = [rnd.choice('abc') for dummy in range(rnd.randrange(30))]
+        b = [rnd.choice('abc') for dummy in range(rnd.randrange(30))]
+        ranges = []
+        pos = 0
+        while pos < len(b):
+            length = rnd.randint(1, 5)
+            if rnd.random() < 0.7:
+                add_range(ranges, pos, min(length, len(b) - pos), pos + 100)
+            pos += length
+        yield (check, ranges, line_blocks(a, b, None))
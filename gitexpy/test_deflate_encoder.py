@@ -0,0 +1,62 @@
+import random
+import zlib
+from nose.tools import *
+from six import BytesIO, StringIO
+
+from . import deflate_encoder
+from . import zlibstream
+from .deflate_encoder import MODE_GREEDY, MODE_LAZY, MODE_OPTIMAL
+from .test_zlibstream import parse_info
+
+modes = [MODE_GREEDY, MODE_LAZY, MODE_OPTIMAL]
+
+def get_testdata():
+    rnd = random.Random(26)
+    source = open(deflate_encoder.__file__.replace('.pyc', '.py'), 'rb').read()
+    noise = bytes(bytearray(rnd.randint(0, 255) for dummy in range(3000)))
+    return {
+        'empty': b'',
+        'one byte': b'x',
+        'repeated text': 50 * b'Hello Deflate! ',
+        'zeros': 20000 * b'\0',
+        'noise': noise,
+        'source': source[:8000],
+        'mixed': source[:3000] + noise + source[3000:6000],
+        }
+
+def test_zlib_can_decompress():
+    def check(mode, name, data):
+        eq_(zlib.decompress(deflate_encoder.compress(data, mode)), data)
+        eq_(zlib.decompress(deflate_encoder.compress_raw(data, mode), -15),
+            data)
+    for (name, data) in sorted(get_testdata().items()):
+        for mode in modes:
+            yield (check, mode, name, data)
+
+def test_stats_match_decoder_stats():
+    def check(mode, name, data):
+        encoder_info = StringIO()
+        compressed = deflate_encoder.compress(data, mode, encoder_info)
+        result = BytesIO()
+        decoder_info = StringIO()
+        zlibstream.parse(BytesIO(compressed), result, decoder_info)
+        eq_(result.getvalue(), data)
+        eq_(parse_info(encoder_info.getvalue()),
+            parse_info(decoder_info.getvalue()))
+    for (name, data) in sorted(get_testdata().items()):
+        for mode in modes:
+            yield (check, mode, name, data)
+
+def test_optimal_is_smallest():
+    data = get_testdata()['mixed']
+    sizes = [len(deflate_encoder.compress_raw(data, mode)) for mode in modes]
+    assert_less_equal(sizes[2], sizes[1])
+    assert_less_equal(sizes[2], len(zlib.compress(data, 9)) - 6)
+
+def test_block_splitting():
+    data = get_testdata()['mixed']
+    encoder = deflate_encoder.DeflateEncoder(MODE_OPTIMAL)
+    encoder.encode(data)
+    types = [bs['type'] for bs in encoder.stats.blockstats]
+    assert_in(deflate_encoder.BTYPE_STORED, types)
+    assert_greater(len(types), 1)
@@ -0,0 +1,59 @@
+import random
+import zlib
+from nose.tools import *
+from six import BytesIO
+
+from . import deflate_encoder
+from . import zlibstream
+from .deflate_index import DeflateIndex
+
+def generate_data():
+    rnd = random.Random(27)
+    words = [b'alpha', b'beta', b'gamma', b'delta', b'\n']
+    text = b' '.join(
+        rnd.choice(words) + str(rnd.randint(0, 99)).encode('ascii')
+        for dummy in range(8000))
+    noise = bytes(bytearray(rnd.randint(0, 255) for dummy in range(5000)))
+    return text[:15000] + noise + text[15000:30000]
+
+def zlib_compress_with_small_blocks(data):
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 15, 1)
+    return compressor.compress(data) + compressor.flush()
+
+def get_compressed_streams(data):
+    return {
+        # small memLevel makes zlib emit many small blocks
+        'zlib': zlib_compress_with_small_blocks(data),
+        # lazy encoder mixes stored and compressed blocks
+        'deflate_encoder': deflate_encoder.compress(
+            data, deflate_encoder.MODE_LAZY, block_symbols=2000),
+        }
+
+def test_read_at():
+    data = generate_data()
+    streams = get_compressed_streams(data)
+    indexes = {}
+    for name in streams:
+        stream = BytesIO(b'garbage' + streams[name])
+        stream.seek(7)
+        indexes[name] = zlibstream.build_index(stream, span=2000)
+    def check(name, offset, length):
+        index = indexes[name]
+        assert_greater(len(index.checkpoints), 2)
+        eq_(index.total_out, len(data))
+        stream = BytesIO(b'garbage' + streams[name])
+        eq_(index.read_at(stream, offset, length),
+            data[offset:offset+length])
+    for name in sorted(streams):
+        for (offset, length) in [
+                (0, 10), (1, 100000), (9000, 1), (14000, 3000),
+                (len(data) - 5, 10), (len(data), 10)]:
+            yield (check, name, offset, length)
+
+def test_saved_index():
+    data = generate_data()
+    compressed = zlib.compress(data)
+    index_file = BytesIO()
+    zlibstream.build_index(BytesIO(compressed), span=10000).save(index_file)
+    index = DeflateIndex.load(BytesIO(index_file.getvalue()))
+    eq_(index.read_at(BytesIO(compressed), 17000, 123), data[17000:17123])
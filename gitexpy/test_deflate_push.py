@@ -0,0 +1,97 @@
+import random
+import zlib
+from nose.tools import *
+from six import BytesIO
+
+from . import deflate_encoder
+from .bitstring import EndOfStreamError
+from .deflate import DeflateBitString, DeflateError
+from .deflate_push import PushDecoder
+from .test_deflate_index import generate_data
+
+def raw_deflate(data, level=6, mem_level=8):
+    compressor = zlib.compressobj(level, zlib.DEFLATED, -15, mem_level)
+    return compressor.compress(data) + compressor.flush()
+
+def pull_decode(compressed):
+    binstr = DeflateBitString(BytesIO(compressed))
+    return b''.join(bytes(data) for data in binstr.decode_blocks())
+
+def push_decode(compressed, chunk_sizes):
+    decoder = PushDecoder()
+    output = []
+    pos = 0
+    i = 0
+    while pos < len(compressed):
+        size = chunk_sizes[i % len(chunk_sizes)]
+        output += decoder.feed(compressed[pos:pos+size])
+        pos += size
+        i += 1
+    output += decoder.finish()
+    return (b''.join(output), decoder)
+
+def get_streams():
+    data = generate_data()
+    return {
+        'zlib': raw_deflate(data),
+        'zlib_small_blocks': raw_deflate(data, 6, 1),
+        'zlib_stored': raw_deflate(data[:20000], 0),
+        'fixed': raw_deflate(b'abc' * 50 + data[:200]),
+        'deflate_encoder': deflate_encoder.compress_raw(
+            data, deflate_encoder.MODE_LAZY, block_symbols=2000),
+        }
+
+def test_matches_pull_decoder():
+    streams = get_streams()
+    def check(name, chunk_sizes):
+        compressed = streams[name]
+        (result, decoder) = push_decode(compressed, chunk_sizes)
+        assert_equal(result, pull_decode(compressed))
+        assert_true(decoder.eof)
+        assert_equal(decoder.unused_data, b'')
+    for name in sorted(streams):
+        for chunk_sizes in [[len(streams[name])], [1], [2, 3, 5], [4096]]:
+            yield (check, name, chunk_sizes)
+
+def test_random_chunks():
+    rnd = random.Random(28)
+    data = generate_data()[:8000]
+    compressed = raw_deflate(data, 9, 1)
+    for dummy in range(20):
+        sizes = [rnd.randint(1, 40) for dummy in range(10)]
+        assert_equal(push_decode(compressed, sizes)[0], data)
+
+def test_unused_data():
+    compressed = raw_deflate(b'Hello, world!' * 10)
+    def check(chunk_sizes):
+        (result, decoder) = push_decode(
+            compressed + b'TRAILER', chunk_sizes)
+        assert_equal(result, b'Hello, world!' * 10)
+        assert_equal(decoder.unused_data, b'TRAILER')
+        assert_equal(decoder.feed(b'!'), [])
+        assert_equal(decoder.unused_data, b'TRAILER!')
+    for chunk_sizes in [[1], [3], [1000]]:
+        yield (check, chunk_sizes)
+
+def test_truncated_input():
+    compressed = raw_deflate(generate_data()[:5000])
+    def check(length):
+        decoder = PushDecoder()
+        decoder.feed(compressed[:length])
+        assert_false(decoder.eof)
+        assert_raises(EndOfStreamError, decoder.finish)
+    for length in [0, 1, 2, 10, len(compressed) // 2, len(compressed) - 1]:
+        yield (check, length)
+
+def test_erroneous_input():
+    def check(compressed, message):
+        decoder = PushDecoder()
+        with assert_raises(DeflateError) as cm:
+            for i in range(len(compressed)):
+                decoder.feed(compressed[i:i+1])
+        assert_in(message, str(cm.exception))
+    yield (check, b'\x07', 'Invalid block type 4')
+    yield (check, b'\x01\x01\x00\x00\x00',
+           'Uncompressed block length decode error')
+    # fixed block with a match before any output
+    yield (check, b'\x03\x02\x00', 'Invalid distance 1')
@@ -32,6 +32,9 @@ lcs_functions = [
     lcs_m1,
     lcs_m,
     lcs_x,
+    lcs_xa,
+    lcs_bp,
+    lcs_adaptive,
     ]
 
 # All LCS functions do not always give the same results. That is OK as
@@ -46,6 +49,7 @@ known_lcs_specials = {
     (lcs_m1, 'abcuixaduhae', 'kaicxahaoehxeh'): ((0,1),(4,2),(5,4),(6,5),(9,6),(10,7),(11,9)),
     (lcs_m, 'ffec','ecbcd'): ((2,0),(3,1)),
     (lcs_x, 'ffec','ecbcd'): ((2,0),(3,1)),
+    (lcs_xa, 'ffec','ecbcd'): ((2,0),(3,1)),
 }
 
 def assert_is_lcs(x, a, b):
@@ -176,3 +180,217 @@ def test_edit_distance():
         ('aa', 'aba', 1),
         ]:
         yield (check_edit_distance, a, b, expected_dist)
+
+def test_lcs_xa_same_as_lcs_x():
+    def check(a, b):
+        eq_(lcs_xa(a, b), lcs_x(a, b))
+        eq_(lcs_xa(b, a), lcs_x(b, a))
+    randomstring.seed(36)
+    for dummy in xrange(30):
+        yield (check,) + randomstring.get_random_stringpair()
+    for (a, b) in generate_wordpairs(3):
+        yield (check, a, b)
+    a = list(range(50)) + [7, 8, 9]
+    yield (check, a, [1, 2, 3] + a[10:])
+    yield (check, 'x' * 30 + 'ab', 'ba')
+    yield (check, 'ba', 'x' * 30 + 'ab')
+
+def levenshtein(a, b):
+    row = list(range(len(b) + 1))
+    for (i, x) in enumerate(a):
+        prev = row
+        row = [i + 1]
+        for (j, y) in enumerate(b):
+            row.append(min(prev[j+1] + 1, row[j] + 1, prev[j] + (x != y)))
+    return row[-1]
+
+def test_bitparallel():
+    def check(a, b):
+        eq_(lcs_bp(a, b), lcs_d2(a, b))
+        eq_(lcs_len_bitparallel(a, b), len(lcs_d2(a, b)))
+        eq_(edit_distance_bitparallel(a, b), edit_distance(a, b))
+        eq_(levenshtein_bitparallel(a, b), levenshtein(a, b))
+    for (a, b) in generate_wordpairs(3):
+        yield (check, a, b)
+    randomstring.seed(37)
+    for dummy in xrange(20):
+        yield (check,) + randomstring.get_random_stringpair()
+    yield (check, 'x' * 100 + 'abc', 'abc' + 'y' * 200)
+    yield (check, list(range(70)), list(range(5, 140, 2)))
+
+def test_editscript_with_lcs_bp():
+    es = EditScript.from_strings('foobar', 'moocowbat', lcs_bp)
+    eq_(es.size(), 7)
+    eq_(es.apply('foobar'), 'moocowbat')
+
+def test_lcs_xa_max_cost():
+    def check(a, b, max_cost):
+        stats = DiffStats()
+        result = lcs_xa(a, b, max_cost, stats)
+        assert_is_cs(result, a, b)
+        eq_(stats.pairs, 1)
+        if not stats.heuristic_splits:
+            eq_(result, lcs_x(a, b))
+    randomstring.seed(38)
+    for dummy in xrange(20):
+        (a, b) = randomstring.get_random_stringpair()
+        for max_cost in (0, 1, 2, 5, 1000):
+            yield (check, a, b, max_cost)
+    for (a, b) in generate_wordpairs(3):
+        yield (check, a, b, 1)
+
+def test_differ_max_cost():
+    d = Differ('phef', 'eb', max_cost=1)
+    eq_(d.lcs(), ())
+    eq_(d.edit_distance(), 6)
+    eq_(d.edit_script().apply('phef'), 'eb')
+    eq_(d.stats.heuristic_pairs, 3)
+    eq_(Differ('phef', 'eb', max_cost=10).edit_distance(),
+        edit_distance('phef', 'eb'))
+
+def test_editscript_apply():
+    def check(a, b):
+        es = EditScript.from_strings(a, b)
+        eq_(es.apply(a), b)
+        eq_(es.size(), edit_distance(a, b))
+    for (a, b) in generate_wordpairs(2):
+        yield (check, a, b)
+    randomstring.seed(39)
+    for dummy in xrange(20):
+        yield (check,) + randomstring.get_random_stringpair()
+
+def test_patience_and_histogram():
+    def check(f, a, b):
+        result = f(a, b)
+        assert_is_cs(result, a, b)
+        eq_(list(result), sorted(result))
+    randomstring.seed(40)
+    pairs = list(generate_wordpairs(3)) + [
+        randomstring.get_random_stringpair() for dummy in xrange(20)]
+    for f in (lcs_patience, lcs_histogram):
+        for (a, b) in pairs:
+            yield (check, f, a, b)
+
+def test_unique_lines_as_anchors():
+    # Myers matches one of the closing braces, but patience and
+    # histogram diffs prefer the line occurring only once
+    a = ['}\n', '}\n', 'return\n']
+    b = ['x = 1\n', 'return\n', '}\n']
+    def check(f, expected):
+        eq_(f(a, b), expected)
+    yield (check, lcs_x, ((0, 2),))
+    yield (check, lcs_patience, ((2, 1),))
+    yield (check, lcs_histogram, ((2, 1),))
+
+def test_differ_with_patience():
+    d = Differ('foobar', 'moocowbat', lcs_patience)
+    eq_(d.edit_script().apply('foobar'), 'moocowbat')
+
+def test_edit_distance_within():
+    def check(a, b, k):
+        expected = edit_distance(a, b)
+        eq_(edit_distance_within(a, b, k), expected if expected <= k else None)
+    for (a, b) in generate_wordpairs(3):
+        for k in (0, 1, 2, 3, 6):
+            yield (check, a, b, k)
+    randomstring.seed(43)
+    for dummy in xrange(20):
+        (a, b) = randomstring.get_random_stringpair()
+        d = edit_distance(a, b)
+        for k in (0, d - 1, d, d + 1):
+            yield (check, a, b, k)
+
+def test_candidates_within():
+    def check(query, k, q):
+        expected = [
+            (i, edit_distance(query, c)) for (i, c) in enumerate(candidates)
+            if edit_distance(query, c) <= k]
+        eq_(list(candidates_within(query, candidates, k, q)), expected)
+    randomstring.seed(44)
+    candidates = [randomstring.get_random_stringpair()[0]
+                  for dummy in xrange(30)]
+    candidates += [c[1:] + 'x' for c in candidates[:10]]
+    for query in candidates[:5]:
+        for k in (0, 2, 5, 20):
+            for q in (1, 2, 3):
+                yield (check, query, k, q)
+
+def test_editscript_ops():
+    def check(a, b):
+        es = EditScript.from_strings(a, b)
+        old = EditScript(es.delset, es.insmap)
+        eq_(old.ops, es.ops)
+        eq_(EditScript.from_bytes(es.to_bytes()).ops, es.ops)
+        a_bytes = a.encode('utf-8')
+        es_bytes = EditScript.from_strings(a_bytes, b.encode('utf-8'))
+        eq_(es_bytes.apply(a_bytes), b.encode('utf-8'))
+        eq_(EditScript.from_bytes(es_bytes.to_bytes()).apply(a_bytes),
+            b.encode('utf-8'))
+    for (a, b) in generate_wordpairs(2):
+        yield (check, a, b)
+    randomstring.seed(44)
+    for dummy in xrange(20):
+        yield (check,) + randomstring.get_random_stringpair()
+    yield (check, u'\xe4iti', u'is\xe4')
+
+def test_editscript_of_lines():
+    def check(a, b):
+        es = EditScript.from_strings(a, b)
+        eq_(es.apply(a), b)
+        eq_(EditScript.from_bytes(es.to_bytes()).apply(a), b)
+    a = ['1\n', '2\n', '3\n', '4\n']
+    b = ['0\n', '1\n', '3\n', 'x\n', 'y\n', '4\n']
+    yield (check, a, b)
+    yield (check, [line.encode('ascii') for line in a],
+           [line.encode('ascii') for line in b])
+    yield (check, [u'\xe4\n', u'b\n'], [u'b\n', u'\xe4\n', u'\n'])
+    yield (check, [], ['a\n'])
+
+def test_histogram_chain_length():
+    def check(count, expected):
+        a = ['x'] * count
+        eq_(len(histogram_anchors(a, ['x'], 0, 0, count, 1)), expected)
+    yield (check, MAX_CHAIN_LENGTH, 1)
+    yield (check, MAX_CHAIN_LENGTH + 1, 1)
+    yield (check, MAX_CHAIN_LENGTH + 2, 0)
+
+def test_editscript_blocks():
+    def check(a, b):
+        lcs = lcs_best(a, b)
+        blocks = [(i, j, 1) for (i, j) in lcs] + [(len(a), len(b), 0)]
+        es = EditScript.from_blocks(a, b, blocks)
+        eq_(es.apply(a), b)
+        eq_(sum(n for (i, j, n) in es.matching_blocks(len(a))), len(lcs))
+        eq_(EditScript.from_blocks(a, b, es.matching_blocks(len(a))).ops,
+            es.ops)
+    for (a, b) in known_lcs:
+        yield (check, a, b)
+
+def test_choose_lcs_algorithm():
+    a = 'abcdefgh' * 100
+    similar = a[:20] + 'xy' + a[20:700] + a[705:]
+    randomstring.seed(45)
+    (x, y) = randomstring.randomstringpair(
+        minlen=500, maxlen=500, maxeditdistance=500)
+    def check(a, b, model, expected):
+        choice = choose_lcs_algorithm(a, b, model)
+        eq_(choice.algorithm.__name__, expected)
+        assert_is_lcs(lcs_adaptive(a, b, model), a, b)
+    yield (check, a, similar, None, 'lcs_xa')
+    yield (check, x, y, None, 'lcs_bp')
+    yield (check, a, a, None, 'lcs_xa')
+    from . import diff_numpy
+    yield (check, x, y,
+           CostModel(myers_unit=1.0, max_bitparallel_bytes=100),
+           'lcs_numpy' if diff_numpy.numpy is not None else 'lcs_xa')
+    yield (check, a, similar, CostModel(myers_unit=1.0), 'lcs_bp')
+
+def test_calibrate_cost_model():
+    randomstring.seed(45)
+    pairs = [randomstring.randomstringpair(minlen=n, maxlen=n,
+                                           maxeditdistance=n // 2)
+             for n in (50, 100, 200)]
+    model = calibrate_cost_model(pairs)
+    ok_(model.myers_unit > 0)
+    ok_(model.bitparallel_unit > 0)
+    ok_(model.dp_unit >= 0 and model.dp_diagonal_unit >= 0)
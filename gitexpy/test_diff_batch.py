@@ -0,0 +1,62 @@
+import os
+import shutil
+import tempfile
+from nose.tools import *
+
+from . import randomstring
+from .diff import lcs_xa, lcs_patience
+from .diff_batch import *
+
+def make_pairs():
+    randomstring.seed(42)
+    return [randomstring.get_random_stringpair() for dummy in range(12)]
+
+def test_diff_many():
+    pairs = make_pairs()
+    def check(workers, algorithm):
+        stats = BatchStats()
+        results = list(diff_many(pairs, workers, algorithm, stats=stats))
+        eq_(sorted(r.index for r in results), list(range(len(pairs))))
+        for r in results:
+            eq_(r.lcs, algorithm(*pairs[r.index]))
+            eq_(r.cost, estimate_cost(pairs[r.index]))
+        eq_(stats.pairs, len(pairs))
+        eq_(sum(count for (bound, count) in stats.histogram_rows()),
+            len(pairs))
+        eq_(stats.capped_pairs, [])
+    yield (check, 1, lcs_xa)
+    yield (check, 2, lcs_xa)
+    yield (check, 2, lcs_patience)
+
+def test_capped_pairs():
+    pairs = [('abc', 'abc'), ('phef', 'eb'), ('x' * 50, 'y' * 50)]
+    stats = BatchStats()
+    results = dict(
+        (r.index, r) for r in diff_many(pairs, 1, max_cost=1, stats=stats))
+    eq_(sorted(stats.capped_pairs), [1, 2])
+    eq_(results[0].lcs, ((0, 0), (1, 1), (2, 2)))
+    eq_(results[1].lcs, ())
+
+def test_file_pairs():
+    tmpdir = tempfile.mkdtemp()
+    try:
+        paths = []
+        for (name, text) in [('a', b'1\n2\n3\n'), ('b', b'1\n3\n4\n')]:
+            paths.append(os.path.join(tmpdir, name))
+            with open(paths[-1], 'wb') as f:
+                f.write(text)
+        results = list(diff_many([FilePair(*paths)], 2))
+        eq_([r.lcs for r in results], [((0, 0), (2, 1))])
+        eq_(results[0].cost, 12)
+    finally:
+        shutil.rmtree(tmpdir)
+
+def test_make_shards():
+    costs = [7, 1, 3, 3, 2, 8, 5, 1]
+    shards = make_shards(costs, 3)
+    eq_(sorted(sum(shards, [])), list(range(len(costs))))
+    totals = [sum(costs[i] for i in shard) for shard in shards]
+    eq_(totals, sorted(totals, reverse=True))
+    ok_(max(totals) - min(totals) <= max(costs))
+    eq_(make_shards([], 4), [])
+    eq_(make_shards([1, 2], 4), [[1], [0]])
@@ -0,0 +1,100 @@
+import os
+import shutil
+import tempfile
+from six import StringIO
+from nose.tools import *
+
+from .diff_bench import *
+
+def test_run_benchmark():
+    engines = find_engines(['lcs_d2', 'lcs_xa', 'lcs_patience'])
+    results = run_benchmark(engines, (16, 64), (0, 4, 64), repeat=1)
+    eq_(len(results), 3 * 5)
+    for r in results:
+        (a, b) = make_pair(r['n'], r['target_d'])
+        eq_((len(a), len(b)), (r['n'], r['m']))
+        ok_(r['d'] <= r['target_d'])
+        ok_(r['seconds'] >= 0)
+        assert_almost_equal(
+            r['us_per_cell'], 1000000.0 * r['seconds'] / (r['n'] * r['m']))
+
+def test_max_cells():
+    engines = [Engine(lcs_numpy), Engine(diff.lcs_d2, max_cells=16 * 20)]
+    results = run_benchmark(engines, (16, 64), (0,), repeat=1)
+    eq_([(r['engine'], r['n']) for r in results],
+        [('lcs_numpy', 16), ('lcs_d2', 16), ('lcs_numpy', 64)])
+
+def test_time_limit():
+    results = run_benchmark(
+        find_engines(['lcs_xa']), (16, 64), (0, 4), repeat=1, time_limit=0)
+    eq_([(r['n'], r['target_d']) for r in results], [(16, 0)])
+
+def test_wrong_result():
+    def lcs_empty(a, b):
+        return ()
+    def check(exact, error):
+        engines = [Engine(lcs_empty, exact=exact)]
+        if error:
+            assert_raises(WrongResult, run_benchmark, engines, (16,), (4,))
+        else:
+            eq_(len(run_benchmark(engines, (16,), (4,))), 1)
+    yield (check, True, True)
+    yield (check, False, False)
+
+def test_compare():
+    baseline = [
+        {'engine': 'e', 'n': 16, 'target_d': 0, 'seconds': 0.01},
+        {'engine': 'e', 'n': 64, 'target_d': 0, 'seconds': 0.01},
+        {'engine': 'e', 'n': 256, 'target_d': 0, 'seconds': 0.00001},
+    ]
+    results = [
+        {'engine': 'e', 'n': 16, 'target_d': 0, 'seconds': 0.012},
+        {'engine': 'e', 'n': 64, 'target_d': 0, 'seconds': 0.02},
+        {'engine': 'e', 'n': 256, 'target_d': 0, 'seconds': 0.001},
+        {'engine': 'f', 'n': 16, 'target_d': 0, 'seconds': 1.0},
+    ]
+    def check(threshold, expected):
+        eq_([r.result['n'] for r in compare(results, baseline, threshold)],
+            expected)
+    yield (check, 0.1, [16, 64])
+    yield (check, 0.25, [64])
+    yield (check, 1.0, [])
+
+class FakeSys(object):
+    def __init__(self, argv):
+        self.argv = argv
+        self.stdout = StringIO()
+    def exit(self, status):
+        raise SystemExit(status)
+
+def test_main_skips_fast_baseline_points():
+    tmpdir = tempfile.mkdtemp()
+    try:
+        path = os.path.join(tmpdir, 'baseline.json')
+        results = run_benchmark(find_engines(['lcs_xa']), QUICK_SIZES)
+        baseline = [dict(r, seconds=1e-7) for r in results]
+        with open(path, 'w') as f:
+            write_results(baseline, f)
+        # Everything is slower than the baseline, but under min_seconds
+        ok_(compare(results, baseline, min_seconds=0))
+        main(FakeSys(['diff_bench', '--quick', '-e', 'lcs_xa', '-b', path]))
+    finally:
+        shutil.rmtree(tmpdir)
+
+def test_write_and_read_results():
+    results = run_benchmark(find_engines(['lcs_bp']), (16,), (0, 1), 1)
+    tmpdir = tempfile.mkdtemp()
+    try:
+        path = os.path.join(tmpdir, 'results.json')
+        with open(path, 'w') as f:
+            write_results(results, f, 1)
+        with open(path) as f:
+            eq_(read_results(f), results)
+    finally:
+        shutil.rmtree(tmpdir)
+
+def test_scaling_exponents():
+    results = [{'engine': 'e', 'target_d': d, 'n': n, 'seconds': n * 1e-6}
+               for n in (16, 64, 256) for d in (0, 4)]
+    results.append({'engine': 'f', 'target_d': 0, 'n': 16, 'seconds': 1.0})
+    eq_(scaling_exponents(results), {('e', 0): 1.0, ('e', 4): 1.0})
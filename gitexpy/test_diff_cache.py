@@ -0,0 +1,103 @@
+import shutil
+import tempfile
+from nose.tools import *
+
+from . import randomstring
+from .diff import lcs_xa, lcs_patience
+from .diff_cache import *
+from .git_object_model import BlobObject, ObjectId
+
+def make_blobs(count):
+    randomstring.seed(47)
+    blobs = {}
+    for dummy in range(count):
+        data = randomstring.randomstring(20, 40).encode('ascii')
+        blobs[str(BlobObject(data).get_object_id())] = data
+    return blobs
+
+def test_edit_script():
+    blobs = make_blobs(6)
+    oids = sorted(blobs)
+    cache = DiffCache()
+    loads = []
+    def load(oid):
+        loads.append(oid)
+        return blobs[oid]
+    for dummy in range(3):
+        for (old, new) in zip(oids, oids[1:]):
+            script = cache.edit_script(old, new, load)
+            eq_(script.apply(blobs[old]), blobs[new])
+    eq_(len(loads), 2 * 5)
+    eq_((cache.hits, cache.misses, len(cache)), (10, 5, 5))
+    assert_almost_equal(cache.hit_rate(), 10.0 / 15)
+
+def test_key_forms():
+    (old, new) = ('ab' * 20, 'cd' * 20)
+    cache = DiffCache()
+    blobs = {old: 'foobar', new: 'moocowbat'}
+    cache.edit_script(old, new, blobs.get)
+    ok_(cache.get(ObjectId(old), ObjectId(new).bytes) is not None)
+    eq_(cache.get(new, old), None)
+    eq_(cache.get(old, new, lcs_patience), None)
+    eq_(cache.get(old, new, lcs_xa, {'max_cost': 4}), None)
+    cache.edit_script(old, new, blobs.get, lcs_xa, {'max_cost': 4})
+    ok_(cache.get(old, new, lcs_xa, {'max_cost': 4}) is not None)
+
+def test_eviction():
+    blobs = make_blobs(11)
+    oids = sorted(blobs)
+    pairs = list(zip(oids, oids[1:]))
+    cache = DiffCache()
+    sizes = [entry_size(cache.edit_script(old, new, blobs.get).to_bytes())
+             for (old, new) in pairs]
+    max_bytes = sum(sizes[-4:])
+    cache = DiffCache(max_bytes)
+    for (old, new) in pairs:
+        cache.edit_script(old, new, blobs.get)
+        ok_(cache.bytes <= max_bytes)
+    eq_(len(cache), 4)
+    eq_(cache.evictions, len(pairs) - 4)
+    eq_(cache.bytes, max_bytes)
+    eq_(cache.get(*pairs[0]), None)
+    ok_(cache.get(*pairs[-4]) is not None)
+    cache.edit_script(pairs[0][0], pairs[0][1], blobs.get)
+    # pairs[-4] was used recently, so pairs[-3] got evicted
+    ok_(cache.get(*pairs[-4]) is not None)
+    eq_(cache.get(*pairs[-3]), None)
+
+def test_too_large_entry():
+    cache = DiffCache(max_bytes=ENTRY_OVERHEAD)
+    blobs = {'1' * 40: b'abc', '2' * 40: b'xyz'}
+    eq_(cache.edit_script('1' * 40, '2' * 40, blobs.get).apply(b'abc'),
+        b'xyz')
+    eq_((len(cache), cache.bytes), (0, 0))
+
+def test_directory():
+    blobs = make_blobs(4)
+    oids = sorted(blobs)
+    tmpdir = tempfile.mkdtemp()
+    try:
+        cache = DiffCache(directory=tmpdir)
+        for (old, new) in zip(oids, oids[1:]):
+            cache.edit_script(old, new, blobs.get)
+        cache = DiffCache(directory=tmpdir)
+        def load(oid):
+            raise AssertionError('Should be read from the disk')
+        for (old, new) in zip(oids, oids[1:]):
+            script = cache.edit_script(old, new, load)
+            eq_(script.apply(blobs[old]), blobs[new])
+        eq_((cache.hits, cache.disk_hits, cache.misses), (3, 3, 0))
+        cache.edit_script(oids[0], oids[1], load)
+        eq_((cache.hits, cache.disk_hits), (4, 3))
+    finally:
+        shutil.rmtree(tmpdir)
+
+def test_lines():
+    blobs = {'1' * 40: ['a\n', 'b\n', 'c\n'], '2' * 40: ['a\n', 'x\n', 'c\n']}
+    tmpdir = tempfile.mkdtemp()
+    try:
+        DiffCache(directory=tmpdir).edit_script('1' * 40, '2' * 40, blobs.get)
+        script = DiffCache(directory=tmpdir).get('1' * 40, '2' * 40)
+        eq_(script.apply(blobs['1' * 40]), blobs['2' * 40])
+    finally:
+        shutil.rmtree(tmpdir)
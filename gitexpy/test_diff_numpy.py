@@ -0,0 +1,48 @@
+from nose.plugins.skip import SkipTest
+from nose.tools import *
+
+from . import randomstring
+from .diff import Differ, lcs_d2, lcs_len_bitparallel
+from . import diff_numpy
+from .diff_numpy import lcs_numpy
+
+def assert_is_lcs(result, a, b):
+    eq_(len(result), lcs_len_bitparallel(a, b))
+    ok_(all(a[i] == b[j] for (i, j) in result))
+    for k in range(1, len(result)):
+        ok_(result[k-1][0] < result[k][0] and result[k-1][1] < result[k][1])
+
+def test_lcs_numpy():
+    if diff_numpy.numpy is None:
+        raise SkipTest('NumPy not available')
+    def check(a, b, table_cells):
+        assert_is_lcs(lcs_numpy(a, b, table_cells), a, b)
+    randomstring.seed(41)
+    for dummy in range(20):
+        (a, b) = randomstring.get_random_stringpair()
+        for table_cells in (1, 10, 1000, diff_numpy.DEFAULT_TABLE_CELLS):
+            yield (check, a, b, table_cells)
+            yield (check, a.encode('ascii'), b.encode('ascii'), table_cells)
+    yield (check, u'äöx€', u'x€ä', 2)
+    yield (check, [10**20, 'foo', None], ['foo', None, 10**20, None], 2)
+    yield (check, '', 'abc', 1)
+
+def test_tables():
+    if diff_numpy.numpy is None:
+        raise SkipTest('NumPy not available')
+    def check(a, b):
+        (x, y) = diff_numpy.to_tokens(a, b)
+        table = diff_numpy.lcs_table(x, y)
+        eq_(table[-1].tolist(), diff_numpy.lcs_row(x, y).tolist())
+        eq_(table[-1, -1], len(lcs_d2(a, b)))
+        eq_(tuple(diff_numpy.traceback(x, y, table)), lcs_d2(a, b))
+    randomstring.seed(42)
+    for dummy in range(20):
+        yield (check,) + randomstring.get_random_stringpair()
+    yield (check, 'a', 'bab')
+    yield (check, 'bab', 'a')
+
+def test_differ_with_lcs_numpy():
+    d = Differ('foobar', 'moocowbat', lcs_numpy)
+    eq_(d.lcs(), ((1, 2), (2, 4), (3, 6), (4, 7)))
+    eq_(d.edit_script().apply('foobar'), 'moocowbat')
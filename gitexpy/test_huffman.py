@@ -1,3 +1,5 @@
+from nose.tools import *
+
 from . import huffman
 from .randomstring import generate_random_string
 
@@ -52,3 +54,125 @@ def test_deflate_mode2_code():
     assert deflate_mode2_code[280] == '11000000'
     assert deflate_mode2_code[287] == '11000111'
     print('test_deflate_mode2_code: OK')
+
+def code_cost(freqs, lengths):
+    return sum(f * l for (f, l) in zip(freqs, lengths))
+
+def kraft_sum(lengths):
+    return sum(2.0**-l for l in lengths if l)
+
+def brute_force_min_cost(freqs, max_length):
+    import itertools
+    used = [f for f in freqs if f]
+    best = None
+    for lengths in itertools.product(range(1, max_length + 1), repeat=len(used)):
+        if kraft_sum(lengths) <= 1:
+            cost = code_cost(used, lengths)
+            if best is None or cost < best:
+                best = cost
+    return best
+
+def test_code_lengths():
+    import random
+    rnd = random.Random(32)
+    def check(freqs, max_length):
+        lengths = huffman.length_limited_code_lengths(freqs, max_length)
+        assert max(lengths) <= max_length
+        assert kraft_sum(lengths) == 1.0
+        assert [l == 0 for l in lengths] == [f == 0 for f in freqs]
+        eq_(code_cost(freqs, lengths), brute_force_min_cost(freqs, max_length))
+        unlimited = huffman.huffman_code_lengths(freqs)
+        eq_(code_cost(freqs, unlimited), brute_force_min_cost(freqs, 6))
+        eq_(huffman.code_lengths(freqs, max_length), lengths
+            if max(unlimited) > max_length else unlimited)
+    for dummy in range(15):
+        n = rnd.randint(2, 6)
+        freqs = [rnd.choice([0, 1, 1, 2, 3, 5, 8, 13, 100]) for i in range(n)]
+        if sum(1 for f in freqs if f) < 2:
+            freqs[0] = freqs[1] = 1
+        yield (check, freqs, rnd.randint(3, 4))
+
+def test_length_limit_in_deflate_alphabet():
+    freqs = huffman.random_frequencies(286)
+    freqs[:30] = [2**i for i in range(30)]
+    def check(max_length):
+        lengths = huffman.code_lengths(freqs, max_length)
+        eq_(max(lengths), max_length)
+        eq_(kraft_sum(lengths), 1.0)
+        codes = huffman.normalized_huffman_code(lengths)
+        assert huffman.is_prefix_code([c for c in codes if c])
+    for max_length in [9, 12, 15]:
+        yield (check, max_length)
+
+def test_packed_coding():
+    import random
+    rnd = random.Random(33)
+    freqs = huffman.random_frequencies(286, rnd)
+    lengths = huffman.code_lengths(freqs, 15)
+    population = [s for s in range(286) if freqs[s]]
+    symbols = [rnd.choice(population) for dummy in range(5000)]
+    def check(symbols):
+        writer = huffman.encode_packed(symbols, lengths)
+        eq_(writer.tell(), sum(lengths[s] for s in symbols))
+        eq_(huffman.decode_packed(writer.getvalue(), lengths, len(symbols)),
+            list(symbols))
+    yield (check, symbols)
+    yield (check, symbols[:1])
+    yield (check, [])
+
+def test_packed_coding_with_numpy():
+    from nose.plugins.skip import SkipTest
+    if huffman.numpy is None:
+        raise SkipTest('NumPy is not available')
+    import random
+    rnd = random.Random(33)
+    lengths = huffman.code_lengths([rnd.randint(0, 100) for i in range(50)])
+    population = [s for s in range(50) if lengths[s]]
+    symbols = [rnd.choice(population) for dummy in range(3000)]
+    expected = huffman.encode_packed(symbols, lengths)
+    def check(chunk_size):
+        writer = huffman.encode_packed_numpy(
+            huffman.numpy.array(symbols), lengths, chunk_size)
+        eq_(writer.tell(), expected.tell())
+        eq_(writer.getvalue(), expected.getvalue())
+    for chunk_size in [7, 1000, 2**20]:
+        yield (check, chunk_size)
+
+def test_packed_coding_with_numpy_long_codes():
+    from nose.plugins.skip import SkipTest
+    if huffman.numpy is None:
+        raise SkipTest('NumPy is not available')
+    import random
+    rnd = random.Random(33)
+    lengths = list(range(1, 16)) + [15]
+    symbols = [rnd.randrange(16) for dummy in range(70000)]
+    expected = huffman.encode_packed(symbols, lengths)
+    writer = huffman.encode_packed_numpy(huffman.numpy.array(symbols), lengths)
+    eq_(writer.tell(), expected.tell())
+    eq_(writer.getvalue(), expected.getvalue())
+
+def test_packed_coding_with_numpy_very_long_codes():
+    from nose.plugins.skip import SkipTest
+    if huffman.numpy is None:
+        raise SkipTest('NumPy is not available')
+    import random
+    rnd = random.Random(33)
+    def check(max_length):
+        lengths = list(range(1, max_length + 1)) + [max_length]
+        symbols = [rnd.randrange(len(lengths)) for dummy in range(5000)]
+        expected = huffman.encode_packed(symbols, lengths)
+        writer = huffman.encode_packed(huffman.numpy.array(symbols), lengths)
+        eq_(writer.tell(), expected.tell())
+        eq_(writer.getvalue(), expected.getvalue())
+    for max_length in (31, 32, 39, 63, 64, 70):
+        yield (check, max_length)
+
+def test_table_length_limit():
+    lengths = list(range(1, huffman.MAX_TABLE_LENGTH + 1))
+    lengths.append(huffman.MAX_TABLE_LENGTH)
+    eq_(huffman.HuffmanTable(lengths).max_length, huffman.MAX_TABLE_LENGTH)
+    too_long = list(range(1, huffman.MAX_TABLE_LENGTH + 2))
+    too_long.append(huffman.MAX_TABLE_LENGTH + 1)
+    assert_raises(huffman.HuffmanCodeError, huffman.HuffmanTable, too_long)
+    assert_raises(huffman.HuffmanCodeError, huffman.decode_packed,
+                  b'\0', too_long, 1)
@@ -0,0 +1,98 @@
+import difflib
+import random
+from nose.tools import *
+
+from . import linediff
+
+def apply_unified(a_lines, diff_lines):
+    result = []
+    i = 0
+    for line in diff_lines:
+        if line.startswith('@@'):
+            start = int(line.split()[1][1:].split(',')[0])
+            length = line.split()[1].split(',')
+            if len(length) > 1 and int(length[1]) == 0:
+                start += 1
+            result.extend(a_lines[i:start - 1])
+            i = start - 1
+        elif line.startswith(('---', '+++', '\\')):
+            continue
+        elif line.startswith('-'):
+            i += 1
+        elif line.startswith(' '):
+            result.append(a_lines[i])
+            i += 1
+        elif line.startswith('+'):
+            result.append(line[1:])
+    result.extend(a_lines[i:])
+    return result
+
+def split_diff(diff):
+    lines = []
+    for line in linediff.split_lines(diff):
+        if line == linediff.NO_NEWLINE:
+            lines[-1] = lines[-1][:-1]
+        else:
+            lines.append(line)
+    return lines
+
+def random_edit(lines, count, rnd):
+    lines = list(lines)
+    for k in range(count):
+        p = rnd.randrange(len(lines) + 1)
+        r = rnd.random()
+        if r < 0.3 and p < len(lines):
+            del lines[p]
+        elif r < 0.6 or p == len(lines):
+            lines.insert(p, 'new %d\n' % k)
+        else:
+            lines[p] = 'changed %d\n' % k
+    return lines
+
+def test_unified_diff_applies():
+    rnd = random.Random(39)
+    def check(a, b, context):
+        diff = linediff.diff_texts(''.join(a), ''.join(b), context=context)
+        eq_(''.join(apply_unified(a, split_diff(diff))), ''.join(b))
+    for count in (0, 1, 2, 5, 20):
+        for context in (0, 1, 3):
+            a = ['line %d\n' % rnd.randrange(30) for dummy in range(60)]
+            yield (check, a, random_edit(a, count, rnd), context)
+    yield (check, ['a\n', 'b'], ['a\n', 'b\n'], 3)
+    yield (check, [], ['a\n'], 3)
+    yield (check, ['a\n'], [], 3)
+
+def test_same_as_difflib():
+    def check(a, b):
+        eq_(list(linediff.unified_diff(a, b)),
+            list(difflib.unified_diff(a, b, 'a', 'b')))
+    a = ['line %d\n' % i for i in range(40)]
+    yield (check, a, a)
+    yield (check, a, a[:10] + a[11:])
+    yield (check, a, a[:10] + ['new\n'] + a[10:])
+    yield (check, a, a[:3] + ['x\n'] + a[4:30] + ['y\n'] + a[30:])
+    yield (check, a, a[:20] + ['x\n'] + a[21:29] + a[30:])
+
+def test_shared_interner():
+    interner = linediff.LineInterner()
+    a = ['a\n', 'b\n', 'c\n']
+    linediff.matching_blocks(a, ['c\n', 'b\n'], interner)
+    eq_(len(interner), 3)
+    eq_(linediff.matching_blocks(['c\n', 'd\n'], a, interner),
+        [(0, 2, 1), (2, 3, 0)])
+    eq_(len(interner), 4)
+
+def test_myers_blocks():
+    rnd = random.Random(48)
+    def check(a, b):
+        blocks = linediff.myers_blocks(a, b)
+        reference = linediff.matching_blocks(a, b)
+        eq_(sum(n for (i, j, n) in blocks), sum(n for (i, j, n) in reference))
+        for (i, j, n) in blocks:
+            eq_(a[i:i + n], b[j:j + n])
+        eq_(blocks[-1], (len(a), len(b), 0))
+    for count in (0, 1, 5, 20):
+        a = ['line %d\n' % rnd.randrange(10) for dummy in range(40)]
+        yield (check, a, random_edit(a, count, rnd))
+    yield (check, [], ['a\n'])
+    yield (check, ['a\n'], [])
@@ -0,0 +1,146 @@
+import random
+from nose.tools import *
+
+from .merge3 import *
+from .test_blame import Repository
+
+def lines(text):
+    return [line + '\n' for line in text.split()]
+
+def test_clean_merges():
+    def check(base, ours, theirs, expected):
+        result = merge3(lines(base), lines(ours), lines(theirs))
+        eq_(result.lines, lines(expected))
+        eq_(result.conflicts, 0)
+        # Swapping the sides gives the same clean result
+        eq_(merge3(lines(base), lines(theirs), lines(ours)).lines,
+            lines(expected))
+    yield (check, 'a b c', 'a b c', 'a b c', 'a b c')
+    yield (check, 'a b c', 'a x c', 'a b c', 'a x c')
+    yield (check, 'a b c d e', 'x b c d e', 'a b c d y', 'x b c d y')
+    yield (check, 'a b c d', 'a b x c d', 'a b c d', 'a b x c d')
+    yield (check, 'a b c d', 'b c d', 'a b c d e', 'b c d e')
+    yield (check, 'a b c d', 'a x c d', 'a x c d', 'a x c d')
+    yield (check, '', 'a', '', 'a')
+    yield (check, 'a b c', '', 'a b c', '')
+
+def test_conflicts():
+    def check(base, ours, theirs, expected, conflicts):
+        result = merge3(lines(base), lines(ours), lines(theirs))
+        eq_(result.lines, [line.replace('_', ' ') for line in lines(expected)])
+        eq_(result.conflicts, conflicts)
+    yield (check, 'a b c', 'a x c', 'a y c',
+           'a <<<<<<<_ours x ======= y >>>>>>>_theirs c', 1)
+    # Adjacent changes conflict
+    yield (check, 'a b c d', 'a x c d', 'a b y d',
+           'a <<<<<<<_ours x c ======= b y >>>>>>>_theirs d', 1)
+    yield (check, 'a b c d e', 'x b c d y', 'z b c d w',
+           '<<<<<<<_ours x ======= z >>>>>>>_theirs b c d '
+           '<<<<<<<_ours y ======= w >>>>>>>_theirs', 2)
+    # Deleted on one side and changed on the other
+    yield (check, 'a b c', 'a c', 'a x c',
+           'a <<<<<<<_ours ======= x >>>>>>>_theirs c', 1)
+    # Added differently at the same place
+    yield (check, 'a c', 'a x c', 'a y c',
+           'a <<<<<<<_ours x ======= y >>>>>>>_theirs c', 1)
+
+def test_diff3_style():
+    result = merge3(lines('a b c'), lines('a x c'), lines('a y c'),
+                    'HEAD', 'other', 'base')
+    eq_(result.lines, ['a\n', '<<<<<<< HEAD\n', 'x\n', '||||||| base\n',
+                       'b\n', '=======\n', 'y\n', '>>>>>>> other\n', 'c\n'])
+
+def test_missing_line_end():
+    result = merge3(['a\n', 'b'], ['a\n', 'x'], ['a\n', 'y'])
+    eq_(result.lines, ['a\n', '<<<<<<< ours\n', 'x\n', '=======\n', 'y\n',
+                       '>>>>>>> theirs\n'])
+    eq_(merge3(['a\n', 'm\n', 'b'], ['x\n', 'm\n', 'b'],
+               ['a\n', 'm\n', 'b\n']).lines,
+        ['x\n', 'm\n', 'b\n'])
+
+def test_bytes():
+    (text, conflicts) = merge3_texts(b'a\nb\nc\n', b'a\nx\nc\n', b'a\ny\nc\n')
+    eq_(text, b'a\n<<<<<<< ours\nx\n=======\ny\n>>>>>>> theirs\nc\n')
+    eq_(conflicts, 1)
+    eq_(merge3_texts(b'a\nb\n', b'x\nb\n', b'a\nb\ny\n'),
+        (b'x\nb\ny\n', 0))
+
+def test_random_one_sided():
+    rnd = random.Random(49)
+    def check(base, ours):
+        eq_(merge3(base, ours, base).lines, ours)
+        eq_(merge3(base, base, ours).lines, ours)
+        eq_(merge3(base, ours, ours).lines, ours)
+    for dummy in range(20):
+        base = [rnd.choice('abcd') + '\n' for dummy in range(20)]
+        ours = [rnd.choice('abcdx') + '\n' for dummy in range(20)]
+        yield (check, base, ours)
+
+def test_random_separate_changes():
+    rnd = random.Random(49)
+    def check(base, ours, theirs, expected):
+        result = merge3(base, ours, theirs)
+        eq_((result.lines, result.conflicts), (expected, 0))
+    for dummy in range(20):
+        base = ['%d\n' % k for k in range(40)]
+        ours = list(base)
+        theirs = list(base)
+        for k in range(0, 20, 4):
+            ours[k] = 'ours %d\n' % k
+        for k in range(22, 40, 4):
+            theirs[k] = 'theirs %d\n' % k
+        expected = ours[:20] + theirs[20:]
+        yield (check, base, ours, theirs, expected)
+
+def tree_of(repo, commit):
+    return repo.get(str(commit)).tree
+
+def test_merge_trees():
+    repo = Repository()
+    base = repo.commit({
+        'same': lines('1 2'), 'dir/ours': lines('a b c'),
+        'dir/both': lines('a b c d'), 'conflict': lines('a b c'),
+        'deleted': lines('x'), 'modified_deleted': lines('m'),
+        'other/file': lines('o')})
+    ours = repo.commit({
+        'same': lines('1 2'), 'dir/ours': lines('a x c'),
+        'dir/both': lines('x b c d'), 'conflict': lines('a o c'),
+        'modified_deleted': lines('n'), 'other/file': lines('o'),
+        'added': lines('new')})
+    theirs = repo.commit({
+        'same': lines('1 2'), 'dir/ours': lines('a b c'),
+        'dir/both': lines('a b c y'), 'conflict': lines('a t c'),
+        'other/file': lines('o')})
+    (base, ours, theirs) = [tree_of(repo, c) for c in (base, ours, theirs)]
+    def check(workers, include_taken):
+        results = merge_trees(base, ours, theirs, repo.get, workers,
+                              include_taken)
+        statuses = dict((r.path, r.status) for r in results)
+        expected = {
+            b'dir/both': MERGED, b'conflict': CONFLICT,
+            b'modified_deleted': CONFLICT}
+        if include_taken:
+            expected.update({
+                b'same': TAKEN, b'dir/ours': TAKEN, b'other/file': TAKEN,
+                b'added': TAKEN, b'deleted': DELETED})
+        eq_(statuses, expected)
+        by_path = dict((r.path, r) for r in results)
+        eq_(by_path[b'dir/both'].lines, [b'x\n', b'b\n', b'c\n', b'y\n'])
+        eq_(by_path[b'conflict'].conflicts, 1)
+        if include_taken:
+            eq_(repo.get(str(by_path[b'dir/ours'].oid)).contents,
+                b'a\nx\nc\n')
+        eq_(sum(r.conflicts for r in results), 2)
+    for workers in (1, 2):
+        for include_taken in (False, True):
+            yield (check, workers, include_taken)
+
+def test_merge_trees_added_on_both_sides():
+    repo = Repository()
+    base = repo.commit({'a': lines('a')})
+    ours = repo.commit({'a': lines('a'), 'new': lines('x y')})
+    theirs = repo.commit({'a': lines('a'), 'new': lines('x z')})
+    results = merge_trees(tree_of(repo, base), tree_of(repo, ours),
+                          tree_of(repo, theirs), repo.get, 1)
+    eq_([(r.path, r.status, r.conflicts) for r in results],
+        [(b'new', CONFLICT, 1)])
@@ -0,0 +1,139 @@
+import hashlib
+import os
+import pickle
+import shutil
+import struct
+import tempfile
+import zlib
+from nose.tools import *
+
+from . import pack
+from . import pack_inflate
+
+def encode_object_header(type, size):
+    header = bytearray([(type << 4) | (size & 0x0f)])
+    size >>= 4
+    while size:
+        header[-1] |= 0x80
+        header.append(size & 0x7f)
+        size >>= 7
+    return header
+
+def make_pack_data(objects):
+    """
+    Make pack data from list of (type, data, compression_level).
+    """
+    data = bytearray(b'PACK' + struct.pack('>LL', 2, len(objects)))
+    for (type, obj_data, level) in objects:
+        data += encode_object_header(type, len(obj_data))
+        data += zlib.compress(obj_data, level)
+    return bytes(data + hashlib.sha1(data).digest())
+
+test_objects = [
+    (pack.OBJ_TYPE_BLOB, b'Hello World!\n', 9),
+    (pack.OBJ_TYPE_BLOB, ''.join(
+        'line %d of a longer blob\n' % i for i in range(2000)).encode(), 6),
+    (pack.OBJ_TYPE_TREE, b'100644 file\0' + 20 * b'\x01', 0),
+    (pack.OBJ_TYPE_COMMIT, b'tree 0123\n\nmessage\n', 1),
+    (pack.OBJ_TYPE_BLOB, b'', 9),
+    ]
+
+def with_packfile(func):
+    def wrapper():
+        tmpdir = tempfile.mkdtemp()
+        try:
+            filename = os.path.join(tmpdir, 'test.pack')
+            with open(filename, 'wb') as f:
+                f.write(make_pack_data(test_objects))
+            for x in func(pack.Packfile(filename)):
+                yield x
+        finally:
+            shutil.rmtree(tmpdir)
+    wrapper.__name__ = func.__name__
+    return wrapper
+
+@with_packfile
+def test_inflate_pack(packfile):
+    def check(processes):
+        results = list(pack_inflate.inflate_pack(packfile, processes, 2))
+        eq_([r.type for r in results], [t for (t, d, l) in test_objects])
+        eq_([r.size for r in results], [len(d) for (t, d, l) in test_objects])
+        eq_([r.offset for r in results], [obj.offset for obj in packfile])
+        eq_([r.stats.blockstats[0]['type'] for r in results],
+            [2, 3, 1, 2, 2])
+    yield (check, 1)
+    yield (check, 2)
+
+@with_packfile
+def test_inflate_pack_stats(packfile):
+    expected = [
+        (bs['type'], bs.sizes()['size'])
+        for result in pack_inflate.inflate_pack(packfile, 1)
+        for bs in result.stats.blockstats]
+    def check(processes, chunksize):
+        stats = pack_inflate.inflate_pack_stats(packfile, processes, chunksize)
+        totals = stats.totals()
+        eq_(totals['uncompressed size'],
+            8 * sum(len(d) for (t, d, l) in test_objects))
+        eq_(totals['blocks'], len(stats.blockstats))
+        eq_(totals['type 1 blocks'], 1)
+        eq_([bs.blocknumber for bs in stats.blockstats],
+            list(range(len(stats.blockstats))))
+        eq_([(bs['type'], bs.sizes()['size']) for bs in stats.blockstats],
+            expected)
+    for processes in (1, 3):
+        for chunksize in (2, pack_inflate.DEFAULT_STATS_CHUNKSIZE):
+            yield (check, processes, chunksize)
+
+def test_pickle_stats():
+    (type, obj_data, level) = test_objects[1]
+    data = make_pack_data([test_objects[1]])
+    start = 12 + len(encode_object_header(type, len(obj_data)))
+    result = pack_inflate.inflate_object(
+        data, 12, type, start, len(data) - 20, 9)
+    eq_(result.size, len(obj_data))
+    eq_(result.compressed_size, len(zlib.compress(obj_data, level)))
+    eq_(result.recompressed_size, len(zlib.compress(obj_data, 9)))
+    unpickled = pickle.loads(pickle.dumps(result))
+    eq_(unpickled.size, result.size)
+    eq_(unpickled.stats.blockstats, result.stats.blockstats)
+    eq_(unpickled.stats.totals(), result.stats.totals())
+
+@with_packfile
+def test_compression_report(packfile):
+    from six import StringIO
+    from .show_deflate_codetable_sizes import PackCompressionReport
+    flagged = StringIO()
+    report = PackCompressionReport(flagged)
+    for result in pack_inflate.inflate_pack(packfile, 1, recompress_level=9):
+        report.add(result)
+    rows = dict((row['type'], row) for row in report.rows())
+    def check(type_name, objects, stored, fixed, dynamic, recompressible):
+        row = rows[type_name]
+        eq_([row['objects'], row['stored_blocks'], row['fixed_blocks'],
+             row['dynamic_blocks'], row['recompressible_objects']],
+            [objects, stored, fixed, dynamic, recompressible])
+    yield (check, 'blob', 3, 0, 2, 1, 0)
+    yield (check, 'tree', 1, 1, 0, 0, 1)
+    yield (check, 'commit', 1, 0, 1, 0, 0)
+    yield (check, 'total', 5, 1, 3, 1, 1)
+    def check_csv():
+        out = StringIO()
+        report.write_csv(out)
+        lines = out.getvalue().splitlines()
+        eq_(len(lines), 5)
+        ok_(lines[0].startswith('type,objects,'))
+        ok_(lines[-1].startswith('total,5,'))
+    yield (check_csv,)
+    def check_flagged():
+        lines = flagged.getvalue().splitlines()
+        eq_(lines[0],
+            'offset,type,compressed_bytes,recompressed_bytes,savings_bytes')
+        eq_(len(lines), 2)
+        (offset, type_name, compressed, recompressed, savings) = (
+            lines[1].split(','))
+        tree = [obj for obj in packfile if obj.type == 2][0]
+        eq_((int(offset), type_name), (tree.offset, 'tree'))
+        eq_(int(compressed) - int(recompressed), int(savings))
+        ok_(int(savings) > 0)
+    yield (check_flagged,)
@@ -0,0 +1,128 @@
+import random
+from nose.tools import *
+
+from .blockify import blockify
+from .renames import *
+from .test_blame import Repository
+
+def make_file(rnd, lines=60):
+    return ''.join('%s %d\n' % (rnd.choice(['foo', 'bar', 'baz', 'qux']),
+                                rnd.randrange(10**6))
+                   for dummy in range(lines))
+
+def edit(rnd, text, count):
+    lines = text.splitlines(True)
+    for dummy in range(count):
+        lines[rnd.randrange(len(lines))] = 'edited %d\n' % rnd.randrange(1000)
+    return ''.join(lines)
+
+def test_blockify_keeps_all_data():
+    rnd = random.Random(50)
+    def check(size):
+        data = bytes(bytearray(rnd.randrange(256) for dummy in range(size)))
+        blocks = list(blockify([data], 64, 16, 512))
+        eq_(b''.join(blocks), data)
+        ok_(all(len(block) <= 512 for block in blocks))
+    for size in (0, 1, 15, 100, 3000):
+        yield (check, size)
+
+def test_similarity_index():
+    rnd = random.Random(50)
+    files = [make_file(rnd).encode('ascii') for dummy in range(20)]
+    index = SimilarityIndex()
+    for (k, data) in enumerate(files):
+        index.add(k, data)
+    def check(k, edits):
+        data = edit(rnd, files[k].decode('ascii'), edits).encode('ascii')
+        candidates = index.candidates(data, 3)
+        eq_(candidates[0][1], k)
+        ok_(len(candidates) <= 3)
+        ok_(candidates[0][0] <= similarity(files[k], data) + 1e-9)
+    for k in range(0, 20, 4):
+        for edits in (1, 5):
+            yield (check, k, edits)
+
+def test_detect_renames():
+    rnd = random.Random(50)
+    texts = [make_file(rnd).encode('ascii') for dummy in range(30)]
+    blobs = dict(('%040x' % k, data) for (k, data) in enumerate(texts))
+    def oid(k):
+        return '%040x' % k
+    def add(data):
+        key = '%040x' % (1000 + len(blobs))
+        blobs[key] = data
+        return key
+    deleted = dict((('old%d' % k).encode('ascii'), oid(k)) for k in range(20))
+    added = {
+        b'exact': oid(3),
+        b'edited': add(edit(rnd, texts[5].decode('ascii'), 5).encode('ascii')),
+        b'new': add(make_file(rnd).encode('ascii')),
+        b'copy': add(edit(rnd, texts[25].decode('ascii'), 2).encode('ascii'))}
+    sources = {b'kept': oid(25)}
+    stats = RenameStats()
+    renames = detect_renames(deleted, added, blobs.get, sources, stats=stats)
+    eq_([(r.old_path, r.new_path, r.status) for r in renames],
+        [(b'kept', b'copy', COPIED), (b'old5', b'edited', RENAMED),
+         (b'old3', b'exact', RENAMED)])
+    eq_(renames[2].similarity, 1.0)
+    ok_(0.5 < renames[1].similarity < 1.0)
+    eq_(stats.exact, 1)
+    eq_(stats.pairs, 3 * 21)
+    ok_(stats.diffs < stats.pairs)
+
+def test_threshold_and_limit():
+    old = b''.join(b'line %d\n' % k for k in range(100))
+    new = b''.join(b'line %d\n' % k for k in range(60)) + b'x' * 300
+    blobs = {'1' * 40: old, '2' * 40: new}
+    def renames(**options):
+        return [(r.old_path, r.new_path) for r in detect_renames(
+            {b'a': '1' * 40}, {b'b': '2' * 40}, blobs.get, **options)]
+    eq_(renames(threshold=0.5), [(b'a', b'b')])
+    eq_(renames(threshold=0.9), [])
+    eq_(renames(max_candidates=0), [])
+
+def test_one_rename_per_source():
+    data = b''.join(b'line %d\n' % k for k in range(100))
+    blobs = {'1' * 40: data, '2' * 40: data + b'end\n',
+             '3' * 40: b'start\n' + data + b'more\n'}
+    def check(sources, expected):
+        renames = detect_renames({b'a': '1' * 40},
+                                 {b'b': '2' * 40, b'c': '3' * 40}, blobs.get,
+                                 sources)
+        eq_([(r.old_path, r.new_path, r.status) for r in renames], expected)
+    # Without copy detection the other file is a plain addition
+    yield (check, None, [(b'a', b'b', RENAMED)])
+    yield (check, {}, [(b'a', b'b', RENAMED), (b'a', b'c', COPIED)])
+
+def test_tree_renames():
+    rnd = random.Random(50)
+    text = make_file(rnd).splitlines(True)
+    other = make_file(rnd).splitlines(True)
+    repo = Repository()
+    first = repo.commit({'dir/a.py': text, 'b.py': other, 'empty': []})
+    second = repo.commit({'lib/a.py': text[:-1] + ['changed\n'],
+                          'b.py': other, 'b_copy.py': other + ['x\n'],
+                          'empty2': []}, [first])
+    (old, new) = [repo.get(str(commit)).tree for commit in (first, second)]
+    eq_([(r.old_path, r.new_path, r.status)
+         for r in tree_renames(old, new, repo.get)],
+        [(b'empty', b'empty2', RENAMED), (b'dir/a.py', b'lib/a.py', RENAMED)])
+    eq_([(r.old_path, r.new_path, r.status)
+         for r in tree_renames(old, new, repo.get, find_copies=True)],
+        [(b'b.py', b'b_copy.py', COPIED), (b'empty', b'empty2', RENAMED),
+         (b'dir/a.py', b'lib/a.py', RENAMED)])
+
+def test_tree_renames_one_source():
+    rnd = random.Random(50)
+    text = make_file(rnd).splitlines(True)
+    repo = Repository()
+    first = repo.commit({'a.py': text})
+    second = repo.commit({'b.py': text + ['end\n'],
+                          'c.py': ['start\n'] + text + ['more\n']}, [first])
+    (old, new) = [repo.get(str(commit)).tree for commit in (first, second)]
+    eq_([(r.old_path, r.new_path, r.status)
+         for r in tree_renames(old, new, repo.get)],
+        [(b'a.py', b'b.py', RENAMED)])
+    eq_([(r.old_path, r.new_path, r.status)
+         for r in tree_renames(old, new, repo.get, find_copies=True)],
+        [(b'a.py', b'b.py', RENAMED), (b'a.py', b'c.py', COPIED)])
@@ -0,0 +1,73 @@
+import os
+import random
+import tempfile
+from nose.tools import *
+from six import BytesIO
+
+from . import symbol_stats
+
+def generate_data():
+    rnd = random.Random(35)
+    text = ' '.join(
+        rnd.choice(['alpha', 'beta', 'gamma', 'delta']) for i in range(3000))
+    noise = bytearray(rnd.randint(0, 255) for i in range(3000))
+    return text.encode('ascii') + bytes(noise) + b'\0' * 1000
+
+def test_numpy_and_python_agree():
+    if symbol_stats.numpy is None:
+        from nose.plugins.skip import SkipTest
+        raise SkipTest('NumPy is not available')
+    data = generate_data()
+    def check(chunk_size):
+        with_numpy = list(symbol_stats.analyze(data, chunk_size, True))
+        without = list(symbol_stats.analyze(data, chunk_size, False))
+        eq_(len(with_numpy), len(without))
+        for ((n1, s1), (n2, s2)) in zip(with_numpy, without):
+            eq_(n1, n2)
+            eq_(s1['bytes'], s2['bytes'])
+            eq_(s1['huffman_bits'], s2['huffman_bits'])
+            assert_almost_equal(s1['entropy'], s2['entropy'])
+            assert_almost_equal(
+                s1['conditional_entropy'], s2['conditional_entropy'])
+    for chunk_size in [999, 100000]:
+        yield (check, chunk_size)
+
+def test_sources():
+    data = generate_data()
+    expected = list(symbol_stats.analyze(data, 5000))
+    def check(source):
+        eq_(list(symbol_stats.analyze(source, 5000)), expected)
+    def check_file(filename):
+        eq_(list(symbol_stats.analyze_file(filename, 5000)), expected)
+    def check_name_as_data(filename):
+        # Bytes are data even if they look like a file name (on Python 2)
+        name = filename.encode('utf-8')
+        results = list(symbol_stats.analyze(name, 5000))
+        eq_(results[-1][1]['bytes'], len(name))
+    (fd, filename) = tempfile.mkstemp()
+    try:
+        os.write(fd, data)
+        os.close(fd)
+        yield (check, BytesIO(data))
+        yield (check, bytearray(data))
+        yield (check, data)
+        yield (check_file, filename)
+        yield (check_name_as_data, filename)
+    finally:
+        os.remove(filename)
+
+def test_bounds():
+    def check(use_numpy):
+        data = generate_data()
+        histogram = symbol_stats.ByteHistogram(use_numpy)
+        for i in range(0, len(data), 777):
+            histogram.update(data[i:i + 777])
+        summary = histogram.summary()
+        eq_(summary['bytes'], len(data))
+        ok_(summary['conditional_entropy'] <= summary['entropy'])
+        ok_(summary['entropy'] <= summary['huffman_bits_per_byte'])
+        ok_(summary['huffman_bits_per_byte'] < summary['entropy'] + 1)
+        eq_(sum(histogram.pair_count(a, b)
+                for a in range(256) for b in range(256)), len(data) - 1)
+    yield (check, True)
+    yield (check, False)
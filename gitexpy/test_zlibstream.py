@@ -117,6 +117,8 @@ def parse_info(info):
     for line in info.split('\n'):
         if (line.startswith('BLOCK HEADER:') or
             line.startswith('HEADER') or
+            line.startswith('GZIP HEADER') or
+            line.startswith('TRAILER') or
             line.startswith('BLOCK[')):
             continue
         if not '=' in line:
@@ -161,3 +163,103 @@ def test_erroneous_input():
                 (str(e), errormsg))
     for idx in erroneous_testdata:
         yield (check, idx)
+
+def zlib_compress_with_dict(data, zdict):
+    import zlib
+    compressor = zlib.compressobj(9, zlib.DEFLATED, 15, 9, 0, zdict)
+    return compressor.compress(data) + compressor.flush()
+
+def gzip_compress(data, filename=''):
+    import gzip
+    out = BytesIO()
+    f = gzip.GzipFile(filename, 'wb', 9, out, mtime=0)
+    f.write(data)
+    f.close()
+    return out.getvalue()
+
+def gzip_with_header_crc(data):
+    import struct
+    import zlib
+    from .crc import crc32
+    header = bytearray(b'\x1f\x8b\x08\x1e\0\0\0\0\x02\xff')
+    header += b'\x03\0xyzname\0comment\0'
+    compressor = zlib.compressobj(9, zlib.DEFLATED, -15)
+    return bytes(
+        header + struct.pack('<H', crc32(header) & 0xffff) +
+        compressor.compress(data) + compressor.flush() +
+        struct.pack('<II', crc32(data), len(data)))
+
+def run_parse(compressed, **kwargs):
+    in_stream = BytesIO(compressed)
+    result = BytesIO()
+    zlibstream.parse(in_stream, result, None, **kwargs)
+    return result.getvalue()
+
+def test_containers():
+    import zlib
+    data = 50 * b'Hello Container! ' + bytes(bytearray(range(256)))
+    zdict = b'Hello Container! Preset dictionary'
+    streams = {
+        'zlib': zlib.compress(data),
+        'raw': zlib.compress(data)[2:-4],
+        'gzip': gzip_compress(data),
+        'gzip with filename': gzip_compress(data, 'name.txt'),
+        'gzip with header crc': gzip_with_header_crc(data),
+        }
+    def check(name, container):
+        eq_(run_parse(streams[name], container=container), data)
+    for name in sorted(streams):
+        container = name.split()[0]
+        yield (check, name, container)
+        yield (check, name, zlibstream.CONTAINER_AUTO)
+    def check_multi_member(container):
+        compressed = gzip_compress(data[:100]) + gzip_compress(data[100:])
+        eq_(run_parse(compressed, container=container), data)
+    yield (check_multi_member, zlibstream.CONTAINER_GZIP)
+    yield (check_multi_member, zlibstream.CONTAINER_AUTO)
+    def check_zero_padding(padding, container):
+        compressed = (gzip_compress(data[:100]) + gzip_compress(data[100:]) +
+                      b'\0' * padding)
+        eq_(run_parse(compressed, container=container), data)
+    for padding in (1, 512):
+        yield (check_zero_padding, padding, zlibstream.CONTAINER_GZIP)
+        yield (check_zero_padding, padding, zlibstream.CONTAINER_AUTO)
+    def check_zdict(compressed, container):
+        eq_(run_parse(compressed, container=container, zdict=zdict), data)
+    compressed = zlib_compress_with_dict(data, zdict)
+    yield (check_zdict, compressed, zlibstream.CONTAINER_ZLIB)
+    yield (check_zdict, compressed, zlibstream.CONTAINER_AUTO)
+    yield (check_zdict, zlib_compress_with_dict(data, zdict)[6:-4],
+           zlibstream.CONTAINER_RAW)
+
+def test_container_errors():
+    import zlib
+    data = b'Checksummed data ' * 10
+    def check(errormsg, compressed, container=zlibstream.CONTAINER_ZLIB,
+              zdict=None):
+        with assert_raises(Exception) as cm:
+            run_parse(compressed, container=container, zdict=zdict)
+        assert_in(errormsg, str(cm.exception))
+    def modify(compressed, pos, xor=1):
+        compressed = bytearray(compressed)
+        compressed[pos] ^= xor
+        return bytes(compressed)
+    compressed = zlib.compress(data)
+    yield (check, 'Adler-32 checksum mismatch', modify(compressed, -1))
+    compressed = gzip_compress(data)
+    yield (check, 'CRC32 checksum mismatch', modify(compressed, -5),
+           zlibstream.CONTAINER_GZIP)
+    yield (check, 'GZIP size mismatch', modify(compressed, -1),
+           zlibstream.CONTAINER_GZIP)
+    yield (check, 'Invalid GZIP magic', compressed[1:],
+           zlibstream.CONTAINER_GZIP)
+    yield (check, 'Non-zero byte in padding', compressed + b'\0\0x',
+           zlibstream.CONTAINER_GZIP)
+    yield (check, 'GZIP header CRC mismatch',
+           modify(gzip_with_header_crc(data), 12),
+           zlibstream.CONTAINER_GZIP)
+    compressed = zlib_compress_with_dict(data, b'dictionary')
+    yield (check, 'Preset dictionary', compressed)
+    yield (check, 'Preset dictionary checksum mismatch', compressed,
+           zlibstream.CONTAINER_ZLIB, b'wrong dictionary')
+    yield (check, 'Unknown container format', compressed, 'zip')
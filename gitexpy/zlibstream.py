@@ -1,17 +1,212 @@
 import sys
-from .binfielddecoder import BfdMsbL
+from .adler32 import adler32
+from .binfielddecoder import BfdMsb, BfdMsbL
+from .crc import crc32
 from .errors import *
-from .deflate import DeflateBitString
+from .deflate import DeflateBitString, WINDOW_SIZE
 from .fieldlist import FieldList
 from .infoprint import iprint
+from .outputwindow import OutputWindow
 
-def parse(in_stream=sys.stdin, out_stream=sys.stdout, info_stream=sys.stderr):
+CONTAINER_ZLIB = 'zlib'
+CONTAINER_GZIP = 'gzip'
+CONTAINER_RAW = 'raw'
+CONTAINER_AUTO = 'auto'
+
+containers = (CONTAINER_ZLIB, CONTAINER_GZIP, CONTAINER_RAW, CONTAINER_AUTO)
+
+GZIP_MAGIC = bytearray(b'\x1f\x8b')
+
+ZLIB_FDICT = 0x20
+
+GZIP_FHCRC = 0x02
+GZIP_FEXTRA = 0x04
+GZIP_FNAME = 0x08
+GZIP_FCOMMENT = 0x10
+
+def parse(in_stream=sys.stdin, out_stream=sys.stdout, info_stream=sys.stderr,
+          container=CONTAINER_ZLIB, zdict=None):
+    """
+    Decompress a zlib, gzip or raw deflate stream.
+
+    The checksums in the zlib and gzip trailers are verified.  With
+    container=CONTAINER_AUTO, the container format is detected from
+    the first bytes.  Preset dictionary for zlib or raw deflate
+    streams can be given as zdict.
+
+    Returns DeflateStats of the (last) deflate stream.
+    """
+    if container not in containers:
+        raise Error('Unknown container format %r' % (container,))
     binstr = DeflateBitString(in_stream, info_stream)
+    if container == CONTAINER_AUTO:
+        container = detect_container(binstr)
+    if container == CONTAINER_GZIP:
+        parse_gzip_members(binstr, out_stream, info_stream)
+    elif container == CONTAINER_ZLIB:
+        parse_zlib(binstr, out_stream, info_stream, zdict)
+    else:
+        for data in binstr.decode_blocks(window=make_window(zdict)):
+            out_stream.write(data)
+    return binstr.stats
+
+def detect_container(binstr):
+    """
+    Detect container format from the first two bytes of binstr.
+
+    >>> from six import BytesIO
+    >>> import zlib
+    >>> detect = lambda x: detect_container(DeflateBitString(BytesIO(x)))
+    >>> detect(zlib.compress(b'abc'))
+    'zlib'
+    >>> detect(b'\\x1f\\x8b\\x08\\x00')
+    'gzip'
+    >>> detect(zlib.compress(b'abc')[2:])
+    'raw'
+    """
+    bits = binstr.peek(16)
+    first = bytearray(
+        BfdMsb(0)(''.join(reversed(bits[i:i+8]))) for i in (0, 8))
+    if first == GZIP_MAGIC:
+        return CONTAINER_GZIP
+    (cmf, flg) = first
+    if (cmf & 0x0f) == 8 and (cmf >> 4) <= 7 and (cmf * 256 + flg) % 31 == 0:
+        return CONTAINER_ZLIB
+    return CONTAINER_RAW
+
+def make_window(zdict):
+    window = OutputWindow(max_size=WINDOW_SIZE)
+    if zdict:
+        window.append_bytes(bytearray(zdict[-WINDOW_SIZE:]))
+    return window
+
+def parse_zlib(binstr, out_stream, info_stream=None, zdict=None):
+    f = parse_header(binstr, info_stream)
+    if f.get_decoded('zlib_header') & ZLIB_FDICT:
+        dictid = take_uint(binstr, 4, big_endian=True)
+        if zdict is None:
+            raise Error('Preset dictionary %08x required' % dictid)
+        if adler32(zdict) != dictid:
+            raise Error('Preset dictionary checksum mismatch')
+    checksum = 1
+    for data in binstr.decode_blocks(window=make_window(zdict)):
+        checksum = adler32(data, checksum)
+        out_stream.write(data)
+    binstr.discard((8 - binstr.offset) % 8)
+    expected = take_uint(binstr, 4, big_endian=True)
+    if info_stream:
+        iprint(info_stream, 'TRAILER: ADLER32=%08x' % expected)
+    if checksum != expected:
+        raise Error('Adler-32 checksum mismatch: %08x != %08x' % (
+            checksum, expected))
+
+def parse_header(binstr, info_stream=None):
     f = FieldList()
     f.add_field('zlib_header', binstr.take(16), BfdMsbL(0))
     if f.get_decoded('zlib_header') % 31 != 0:
         raise Error('Invalid checksum in ZLIB header')
-    for line in str(f).split('\n'):
-        iprint(info_stream, 'HEADER: %s' % line)
+    if info_stream:
+        for line in str(f).split('\n'):
+            iprint(info_stream, 'HEADER: %s' % line)
+    return f
+
+def parse_gzip_members(binstr, out_stream, info_stream=None):
+    """
+    Decompress gzip members until the end of the stream.
+
+    Zero bytes after the last member (padding written by tape and
+    block device tools) are skipped, like gzip -d does.
+    """
+    parse_gzip_member(binstr, out_stream, info_stream)
+    while binstr.has_n_bits_left(8):
+        if BfdMsb(0)(binstr.peek(8)) == 0:
+            skip_zero_padding(binstr, info_stream)
+            break
+        parse_gzip_member(binstr, out_stream, info_stream)
+
+def skip_zero_padding(binstr, info_stream=None):
+    size = 0
+    while binstr.has_n_bits_left(8):
+        if take_bytes(binstr, 1)[0]:
+            raise Error('Non-zero byte in padding after GZIP member')
+        size += 1
+    if info_stream:
+        iprint(info_stream, 'GZIP PADDING: %d zero bytes' % size)
+
+def parse_gzip_member(binstr, out_stream, info_stream=None):
+    header = take_bytes(binstr, 10)
+    if header[0:2] != GZIP_MAGIC:
+        raise Error('Invalid GZIP magic')
+    if header[2] != 8:
+        raise Error('Unsupported GZIP compression method %d' % header[2])
+    flags = header[3]
+    if flags & GZIP_FEXTRA:
+        xlen = take_bytes(binstr, 2)
+        header += xlen + take_bytes(binstr, xlen[0] | (xlen[1] << 8))
+    for flag in (GZIP_FNAME, GZIP_FCOMMENT):
+        if flags & flag:
+            header += take_zero_terminated(binstr)
+    if info_stream:
+        iprint(info_stream, 'GZIP HEADER: FLG=%02x MTIME=%d' % (
+            flags, take_uint_from(header[4:8])))
+    if flags & GZIP_FHCRC:
+        header_crc = take_uint(binstr, 2)
+        if crc32(header) & 0xffff != header_crc:
+            raise Error('GZIP header CRC mismatch')
+    checksum = 0
+    size = 0
     for data in binstr.decode_blocks():
+        checksum = crc32(data, checksum)
+        size += len(data)
         out_stream.write(data)
+    binstr.discard((8 - binstr.offset) % 8)
+    expected_crc = take_uint(binstr, 4)
+    expected_size = take_uint(binstr, 4)
+    if info_stream:
+        iprint(info_stream, 'TRAILER: CRC32=%08x ISIZE=%d' % (
+            expected_crc, expected_size))
+    if checksum != expected_crc:
+        raise Error('CRC32 checksum mismatch: %08x != %08x' % (
+            checksum, expected_crc))
+    if size & 0xffffffff != expected_size:
+        raise Error('GZIP size mismatch: %d != %d' % (size, expected_size))
+
+def take_bytes(binstr, n):
+    return bytearray(BfdMsb(0)(binstr.take(8)) for dummy in range(n))
+
+def take_zero_terminated(binstr):
+    result = bytearray()
+    while not result or result[-1] != 0:
+        result += take_bytes(binstr, 1)
+    return result
+
+def take_uint(binstr, n, big_endian=False):
+    return take_uint_from(take_bytes(binstr, n), big_endian)
+
+def take_uint_from(data, big_endian=False):
+    """
+    Decode unsigned integer from bytes.
+
+    >>> take_uint_from(bytearray(b'\\x01\\x02'))
+    513
+    >>> take_uint_from(bytearray(b'\\x01\\x02'), big_endian=True)
+    258
+    """
+    if not big_endian:
+        data = reversed(data)
+    value = 0
+    for x in data:
+        value = (value << 8) | x
+    return value
+
+def build_index(in_stream, span=None):
+    """
+    Build checkpoint index for random access to a zlib stream.
+
+    The in_stream should be positioned at the start of the zlib
+    stream.  See deflate_index.DeflateIndex.
+    """
+    stream_start = in_stream.tell()
+    binstr = DeflateBitString(in_stream)
+    parse_header(binstr)
+    return binstr.build_index(span, stream_start)